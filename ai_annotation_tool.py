@@ -59,20 +59,32 @@ import os
 import numpy as np
 from PIL import Image
 import supervision as sv
+from class_registry import ClassRegistry
+from dataset_scan import iter_images
+from preprocess_cache import PreprocessCache, image_key
+from taxonomy import GROUNDING_TASK, Taxonomy, load_taxonomy
+from feature_cache import FeatureCache, encode_image, generate_from_features
+from review_queue import REVIEW_QUEUE_FILE, ReviewQueue, beam_agreement
 
 # Assuming `processor` and `model` are already defined and initialized, and `DEVICE` is set.
 
-def generate_detections(image):
-    text = "<bee>"
-    task = "<OD>"
+# Shared with manual_gui.py through <dataset>/classes.txt; 'bee' is only the fallback
+class_registry = ClassRegistry(['bee'])
+
+def generate_detections(image, cache=None, image_path=None, text="<bee>", task="<OD>", backend=None):
 
     # Process the image with the model
-    inputs = processor(text=text, images=image, return_tensors="pt").to(DEVICE)
-    generated_ids = model.generate(
+    if cache is not None:
+        inputs = cache.inputs(image, text, DEVICE, key=image_key(image, image_path))
+    else:
+        inputs = processor(text=text, images=image, return_tensors="pt").to(DEVICE)
+    # backend can be an OnnxBackend; anything with the model's generate() signature works
+    backend = backend or model
+    generated_ids = backend.generate(
         input_ids=inputs["input_ids"],
         pixel_values=inputs["pixel_values"],
         max_new_tokens=1024,
-        num_beams=3
+        num_beams=3 if backend is model else 1
     )
     generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
     response = processor.post_process_generation(generated_text, task=task, image_size=image.size)
@@ -82,8 +94,51 @@ def generate_detections(image):
 
     return detections
 
-def detections_to_yolov5txt(detections, image_width, image_height):
-    class_labels = ['bee']
+def generate_detections_with_scores(image, cache=None, image_path=None, text="<bee>", task="<OD>", num_beams=3):
+    if cache is not None:
+        inputs = cache.inputs(image, text, DEVICE, key=image_key(image, image_path))
+    else:
+        inputs = processor(text=text, images=image, return_tensors="pt").to(DEVICE)
+
+    # Keep every beam and its score instead of only the best decoded string
+    outputs = model.generate(
+        input_ids=inputs["input_ids"],
+        pixel_values=inputs["pixel_values"],
+        max_new_tokens=1024,
+        num_beams=num_beams,
+        num_return_sequences=num_beams,
+        output_scores=True,
+        return_dict_in_generate=True
+    )
+    beam_detections = []
+    for generated_text in processor.batch_decode(outputs.sequences, skip_special_tokens=False):
+        response = processor.post_process_generation(generated_text, task=task, image_size=image.size)
+        beam_detections.append(sv.Detections.from_lmm(sv.LMM.FLORENCE_2, response, resolution_wh=image.size))
+
+    detections = beam_detections[0]
+    detections.confidence = beam_agreement([beam.xyxy for beam in beam_detections])
+    sequence_score = float(outputs.sequences_scores[0])
+
+    return detections, sequence_score, [len(beam) for beam in beam_detections]
+
+def generate_detections_multi(image, prompts, cache, feature_cache=None, image_path=None, task="<OD>"):
+    # Run the vision encoder once per image and decode every prompt against the cached features
+    key = image_key(image, image_path)
+    pixel_values = cache.pixel_values(image, key).unsqueeze(0).to(DEVICE, model.dtype)
+    image_features = encode_image(model, pixel_values, key, feature_cache)
+
+    results = {}
+    for text in prompts:
+        input_ids = cache.prompt_inputs(text)["input_ids"].to(DEVICE)
+        generated_ids = generate_from_features(model, image_features, input_ids, max_new_tokens=1024, num_beams=3)
+        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+        response = processor.post_process_generation(generated_text, task=task, image_size=image.size)
+        results[text] = sv.Detections.from_lmm(sv.LMM.FLORENCE_2, response, resolution_wh=image.size)
+
+    return results
+
+def detections_to_yolov5txt(detections, image_width, image_height, registry=None, taxonomy=None):
+    taxonomy = taxonomy or Taxonomy(registry or class_registry)
     if detections is None:
         raise ValueError("No detections found.")
 
@@ -93,7 +148,9 @@ def detections_to_yolov5txt(detections, image_width, image_height):
         x1, y1, x2, y2 = detections.xyxy[i]
         class_name = detections.data['class_name'][i] if isinstance(detections.data['class_name'][i], str) else 'Unknown'
 
-        class_index = class_labels.index(class_name)
+        class_index = taxonomy.resolve(class_name)
+        if class_index is None:
+            continue
         bbox_width = x2 - x1
         bbox_height = y2 - y1
         x_center = x1 + bbox_width / 2
@@ -109,72 +166,81 @@ def detections_to_yolov5txt(detections, image_width, image_height):
 
     return yolov5txt_lines
 
-def process_detections(detections, image_size, output_file):
+def process_detections(detections, image_size, output_file, registry=None, taxonomy=None):
     if detections is None:
         print("No detections found.")
         return
     image_width, image_height = image_size[0], image_size[1]
 
-    yolov5txt_lines = detections_to_yolov5txt(detections, image_width, image_height)
+    yolov5txt_lines = detections_to_yolov5txt(detections, image_width, image_height, registry, taxonomy)
 
     with open(output_file, 'w') as f:
         for line in yolov5txt_lines:
             f.write(line + "\n")
 
-def main(dataset_path):
-    for filename in os.listdir(dataset_path):
-        file_path = os.path.join(dataset_path, filename)
-        if os.path.isfile(file_path) and filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            with Image.open(file_path) as img:
-                image_size = img.size  # (width, height)
-
-                # Generate detections for the current image
-                detections = generate_detections(img)
-
-                output_file = os.path.join(dataset_path, f"{os.path.splitext(filename)[0]}_labels.txt")
-                process_detections(detections, image_size, output_file)
+def main(dataset_path, recursive=False, cache_dir=None, taxonomy_path=None, prompts=None, feature_cache_dir=None):
+    registry = ClassRegistry.load(dataset_path, default_names=['bee'])
+    if taxonomy_path:
+        # Ground every class phrase in a single pass per image
+        taxonomy = load_taxonomy(taxonomy_path, registry)
+        text, task = taxonomy.grounding_prompt(), GROUNDING_TASK
+    else:
+        taxonomy = Taxonomy(registry)
+        text, task = "<bee>", "<OD>"
+    # Reruns with cache_dir set reuse pixel_values from earlier runs instead of preprocessing again
+    cache = PreprocessCache(processor, cache_dir)
+    # Several prompts share one vision encoder pass per image; they have no beam scores for the review queue
+    feature_cache = FeatureCache(cache_dir=feature_cache_dir) if prompts else None
+    review_queue = ReviewQueue()
+    for file_path in iter_images(dataset_path, recursive=recursive, cache=True):
+        with Image.open(file_path) as img:
+            image_size = img.size  # (width, height)
+
+            # Generate detections for the current image
+            if prompts:
+                results = generate_detections_multi(img, prompts, cache, feature_cache, file_path, task)
+                detections = sv.Detections.merge(list(results.values()))
+            else:
+                detections, sequence_score, beam_box_counts = generate_detections_with_scores(img, cache, file_path, text, task)
+                review_queue.add(os.path.relpath(file_path, dataset_path), sequence_score, detections.confidence, beam_box_counts)
+
+            output_file = f"{os.path.splitext(file_path)[0]}.txt"
+            process_detections(detections, image_size, output_file, registry, taxonomy)
+    cache.flush()
+    taxonomy.report()
+    # AnnotationTool can open the dataset in this order, most uncertain images first
+    review_queue.save(os.path.join(dataset_path, REVIEW_QUEUE_FILE))
+    registry.save(dataset_path)
 
 if __name__ == "__main__":
     dataset_path = "/content/data_test"
-    main(dataset_path)
+    main(dataset_path, cache_dir="/content/preprocess_cache")
 
 import os
 import cv2
 import matplotlib.pyplot as plt
+from class_registry import ClassRegistry
+from label_io import read_labels, report_errors
+from visualize import draw_boxes, measure_cv2_text, render_folder
 
-def read_labels(label_path):
-    with open(label_path, 'r') as file:
-        labels = file.readlines()
-    return [[float(x) if i else x for i, x in enumerate(label.strip().split())] for label in labels] # Keep the first element (class label) as a string, convert the rest to floats
-
-def draw_bounding_boxes(image_path, label_path, output_path=None):
+def draw_bounding_boxes(image_path, label_path, output_path=None, registry=None):
     # Read the image
     image = cv2.imread(image_path)
     if image is None:
         print(f"Error: Unable to read image from {image_path}")
         return
 
-    image_height, image_width, _ = image.shape
-
     # Read labels
-    labels = read_labels(label_path)
+    classes, boxes, errors = read_labels(label_path)
+    report_errors(errors)
 
-    for label in labels:
-        class_id, x_center, y_center, width, height = label # Now class_id is a string and the rest are floats
+    # Class colors and names come from the classes.txt next to the labels, as in render_folder
+    if registry is None:
+        registry = ClassRegistry.load(os.path.dirname(label_path) or ".", default_names=['bee'])
+        registry.set_text_measure(measure_cv2_text)
 
-        # Convert normalized coordinates to pixel coordinates
-        x_center *= image_width
-        y_center *= image_height
-        width *= image_width
-        height *= image_height
-
-        x_min = int(x_center - width / 2)
-        y_min = int(y_center - height / 2)
-        x_max = int(x_center + width / 2)
-        y_max = int(y_center + height / 2)
-
-        # Draw bounding box
-        cv2.rectangle(image, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
+    # Boxes are denormalized in one array op inside draw_boxes
+    draw_boxes(image, classes, boxes, registry)
 
     # Save or display the image with bounding boxes
     if output_path:
@@ -196,10 +262,14 @@ def draw_bounding_boxes(image_path, label_path, output_path=None):
 
 # Example usage
 image_path = '/content/data_test/inaturalist-17855827-12390505-ind9.jpeg'
-label_path = '/content/data_test/inaturalist-17855827-12390505-ind9_labels.txt'
+label_path = '/content/data_test/inaturalist-17855827-12390505-ind9.txt'
 output_path = '/content/bbox/output_image_with_boxes.jpg'  # Use absolute path here
 draw_bounding_boxes(image_path, label_path, output_path)
 
+# QA a whole folder at once: one preview per image, or contact sheets of tiles
+render_folder('/content/data_test', '/content/data_test', '/content/bbox', max_size=1024)
+render_folder('/content/data_test', '/content/data_test', '/content/bbox_sheets', contact_sheet=True)
+
 """# To download only labels folder"""
 
 import shutil
@@ -280,6 +350,9 @@ from PIL import Image
 import supervision as sv
 import gradio as gr
 from google.colab import files
+from class_registry import ClassRegistry
+from dataset_scan import iter_images
+from taxonomy import Taxonomy
 
 # Load Florence 2 model and processor
 CHECKPOINT = "microsoft/Florence-2-large-ft"
@@ -287,17 +360,18 @@ DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 model = AutoModelForCausalLM.from_pretrained(CHECKPOINT, trust_remote_code=True).to(DEVICE)
 processor = AutoProcessor.from_pretrained(CHECKPOINT, trust_remote_code=True)
+class_registry = ClassRegistry(['bee'])
 
-def generate_detections(image):
-    text = "<bee>"
-    task = "<OD>"
+def generate_detections(image, text="<bee>", task="<OD>", backend=None):
 
     inputs = processor(text=text, images=image, return_tensors="pt").to(DEVICE)
-    generated_ids = model.generate(
+    # backend can be an OnnxBackend; anything with the model's generate() signature works
+    backend = backend or model
+    generated_ids = backend.generate(
         input_ids=inputs["input_ids"],
         pixel_values=inputs["pixel_values"],
         max_new_tokens=1024,
-        num_beams=3
+        num_beams=3 if backend is model else 1
     )
     generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
     response = processor.post_process_generation(generated_text, task=task, image_size=image.size)
@@ -305,15 +379,17 @@ def generate_detections(image):
     detections = sv.Detections.from_lmm(sv.LMM.FLORENCE_2, response, resolution_wh=image.size)
     return detections
 
-def detections_to_yolov5txt(detections, image_width, image_height):
-    class_labels = ['bee']
+def detections_to_yolov5txt(detections, image_width, image_height, registry=None, taxonomy=None):
+    taxonomy = taxonomy or Taxonomy(registry or class_registry)
     yolov5txt_lines = []
 
     for i in range(len(detections.xyxy)):
         x1, y1, x2, y2 = detections.xyxy[i]
         class_name = detections.data['class_name'][i] if isinstance(detections.data['class_name'][i], str) else 'Unknown'
 
-        class_index = class_labels.index(class_name)
+        class_index = taxonomy.resolve(class_name)
+        if class_index is None:
+            continue
         bbox_width = x2 - x1
         bbox_height = y2 - y1
         x_center = x1 + bbox_width / 2
@@ -329,13 +405,13 @@ def detections_to_yolov5txt(detections, image_width, image_height):
 
     return yolov5txt_lines
 
-def process_detections(detections, image_size, output_file):
+def process_detections(detections, image_size, output_file, registry=None, taxonomy=None):
     if detections is None:
         print("No detections found.")
         return
     image_width, image_height = image_size
 
-    yolov5txt_lines = detections_to_yolov5txt(detections, image_width, image_height)
+    yolov5txt_lines = detections_to_yolov5txt(detections, image_width, image_height, registry, taxonomy)
 
     with open(output_file, 'w') as f:
         for line in yolov5txt_lines:
@@ -345,17 +421,21 @@ def auto_annotate(input_folder, output_folder):
     if not input_folder or not output_folder:
         return "Please select both input and output folders."
 
-    for filename in os.listdir(input_folder):
-        file_path = os.path.join(input_folder, filename)
-        if os.path.isfile(file_path) and filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            with Image.open(file_path) as img:
-                image_size = img.size  # (width, height)
+    registry = ClassRegistry.load(output_folder, default_names=['bee'])
+    taxonomy = Taxonomy(registry)
+    for rel_path in iter_images(input_folder, recursive=True, relative=True, cache=True):
+        file_path = os.path.join(input_folder, rel_path)
+        with Image.open(file_path) as img:
+            image_size = img.size  # (width, height)
 
-                # Generate detections for the current image
-                detections = generate_detections(img)
+            # Generate detections for the current image
+            detections = generate_detections(img)
 
-                output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_labels.txt")
-                process_detections(detections, image_size, output_file)
+            output_file = os.path.join(output_folder, f"{os.path.splitext(rel_path)[0]}.txt")
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            process_detections(detections, image_size, output_file, registry, taxonomy)
+    taxonomy.report()
+    registry.save(output_folder)
 
     return f"Auto annotation completed. Files saved to {output_folder}."
 
@@ -394,6 +474,7 @@ demo.launch()
 
 import cv2
 import os
+from dataset_scan import iter_images
 
 # Constants
 WINDOW_NAME = "Image Annotation Tool"
@@ -412,7 +493,7 @@ mouse_y = 0
 drawing = False
 is_bbox_selected = False
 img_objects = []
-annotations = []
+annotations = {}  # image index -> [(class_index, point_1, point_2)]
 
 def decrease_index(current_index, last_index):
     current_index -= 1
@@ -438,9 +519,10 @@ def yolo_format(class_index, point_1, point_2, width, height):
     items = map(str, [class_index, x_center, y_center, x_width, y_height])
     return ' '.join(items)
 
-def append_bb(ann_path, line):
+def append_bb(ann_path, lines):
+    # One open per label file instead of one per box
     with open(ann_path, 'a') as myfile:
-        myfile.write(line + '\n')
+        myfile.write(''.join(line + '\n' for line in lines))
 
 def mouse_callback(event, x, y, flags, param):
     global mouse_x, mouse_y, drawing, img, img_copy, point_1, point_2
@@ -459,8 +541,13 @@ def mouse_callback(event, x, y, flags, param):
 
     elif event == cv2.EVENT_LBUTTONUP:
         drawing = False
-        point_2 = (x, y)
-        annotations.append((class_index, point_1, point_2))
+        height, width = img.shape[:2]
+        # Clip to the image and ignore clicks without a drag
+        point_1 = (min(max(point_1[0], 0), width - 1), min(max(point_1[1], 0), height - 1))
+        point_2 = (min(max(x, 0), width - 1), min(max(y, 0), height - 1))
+        if point_1[0] == point_2[0] or point_1[1] == point_2[1]:
+            return
+        annotations.setdefault(img_index, []).append((class_index, point_1, point_2))
         cv2.rectangle(img, point_1, point_2, (0, 255, 0), LINE_THICKNESS)
 
 def set_img_index(val):
@@ -473,7 +560,7 @@ def set_class_index(val):
 
 def load_images_from_folder(folder):
     images = []
-    for filename in os.listdir(folder):
+    for filename in iter_images(folder, relative=True):
         img = cv2.imread(os.path.join(folder, filename))
         if img is not None:
             images.append((filename, img))
@@ -526,12 +613,14 @@ def main():
 
     cv2.destroyAllWindows()
 
-    # Save annotations
-    for filename, img in images:
+    # Save annotations: each image gets only the boxes drawn on it, scaled by its own size
+    for index, (filename, img) in enumerate(images):
+        if index not in annotations:
+            continue
+        height, width = img.shape[:2]
         ann_path = os.path.splitext(filename)[0] + '.txt'
-        for class_idx, pt1, pt2 in annotations:
-            line = yolo_format(class_idx, pt1, pt2, width, height)
-            append_bb(ann_path, line)
+        lines = [yolo_format(class_idx, pt1, pt2, width, height) for class_idx, pt1, pt2 in annotations[index]]
+        append_bb(ann_path, lines)
 
 if __name__ == "__main__":
     main()
@@ -545,6 +634,9 @@ import numpy as np
 from PIL import Image
 import supervision as sv
 import gradio as gr
+from class_registry import ClassRegistry
+from dataset_scan import iter_images
+from taxonomy import Taxonomy
 
 # Checkpoint for the model
 CHECKPOINT = "microsoft/Florence-2-large-ft"
@@ -553,17 +645,18 @@ DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 # Load model and processor
 model = AutoModelForCausalLM.from_pretrained(CHECKPOINT, trust_remote_code=True).to(DEVICE)
 processor = AutoProcessor.from_pretrained(CHECKPOINT, trust_remote_code=True)
+class_registry = ClassRegistry(['bee'])
 
-def generate_detections(image):
-    text = "<bee>"
-    task = "<OD>"
+def generate_detections(image, text="<bee>", task="<OD>", backend=None):
 
     inputs = processor(text=text, images=image, return_tensors="pt").to(DEVICE)
-    generated_ids = model.generate(
+    # backend can be an OnnxBackend; anything with the model's generate() signature works
+    backend = backend or model
+    generated_ids = backend.generate(
         input_ids=inputs["input_ids"],
         pixel_values=inputs["pixel_values"],
         max_new_tokens=1024,
-        num_beams=3
+        num_beams=3 if backend is model else 1
     )
     generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
     response = processor.post_process_generation(generated_text, task=task, image_size=image.size)
@@ -571,15 +664,17 @@ def generate_detections(image):
     detections = sv.Detections.from_lmm(sv.LMM.FLORENCE_2, response, resolution_wh=image.size)
     return detections
 
-def detections_to_yolov5txt(detections, image_width, image_height):
-    class_labels = ['bee']
+def detections_to_yolov5txt(detections, image_width, image_height, registry=None, taxonomy=None):
+    taxonomy = taxonomy or Taxonomy(registry or class_registry)
     yolov5txt_lines = []
 
     for i in range(len(detections.xyxy)):
         x1, y1, x2, y2 = detections.xyxy[i]
         class_name = detections.data['class_name'][i] if isinstance(detections.data['class_name'][i], str) else 'Unknown'
 
-        class_index = class_labels.index(class_name)
+        class_index = taxonomy.resolve(class_name)
+        if class_index is None:
+            continue
         bbox_width = x2 - x1
         bbox_height = y2 - y1
         x_center = x1 + bbox_width / 2
@@ -595,13 +690,13 @@ def detections_to_yolov5txt(detections, image_width, image_height):
 
     return yolov5txt_lines
 
-def process_detections(detections, image_size, output_file):
+def process_detections(detections, image_size, output_file, registry=None, taxonomy=None):
     if detections is None:
         print("No detections found.")
         return
     image_width, image_height = image_size
 
-    yolov5txt_lines = detections_to_yolov5txt(detections, image_width, image_height)
+    yolov5txt_lines = detections_to_yolov5txt(detections, image_width, image_height, registry, taxonomy)
 
     with open(output_file, 'w') as f:
         for line in yolov5txt_lines:
@@ -611,17 +706,21 @@ def auto_annotate(input_folder, output_folder):
     if not input_folder or not output_folder:
         return "Please select both input and output folders."
 
-    for filename in os.listdir(input_folder):
-        file_path = os.path.join(input_folder, filename)
-        if os.path.isfile(file_path) and filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            with Image.open(file_path) as img:
-                image_size = img.size  # (width, height)
-
-                # Generate detections for the current image
-                detections = generate_detections(img)
-
-                output_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_labels.txt")
-                process_detections(detections, image_size, output_file)
+    registry = ClassRegistry.load(output_folder, default_names=['bee'])
+    taxonomy = Taxonomy(registry)
+    for rel_path in iter_images(input_folder, recursive=True, relative=True, cache=True):
+        file_path = os.path.join(input_folder, rel_path)
+        with Image.open(file_path) as img:
+            image_size = img.size  # (width, height)
+
+            # Generate detections for the current image
+            detections = generate_detections(img)
+
+            output_file = os.path.join(output_folder, f"{os.path.splitext(rel_path)[0]}.txt")
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            process_detections(detections, image_size, output_file, registry, taxonomy)
+    taxonomy.report()
+    registry.save(output_folder)
 
     return f"Auto annotation completed. Files saved to {output_folder}."
 
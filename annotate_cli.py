@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from class_registry import ClassRegistry
+from dataset_scan import CACHE_DIR, iter_images, list_images
+from detector import DEFAULT_CHECKPOINT, DECODE_PRESETS, detections_to_yolo
+from exporters import build_exporter, parse_formats
+from review_queue import REVIEW_QUEUE_FILE, ReviewQueue
+from taxonomy import GROUNDING_TASK, Taxonomy, load_taxonomy
+
+DEFAULT_CONFIG = {
+    'checkpoint': DEFAULT_CHECKPOINT,
+    'device': "auto",
+    'backend': "torch",          # "torch" or "onnx"
+    'onnx_dir': None,
+    'batch_size': 1,
+    'workers': 2,                # image decode threads feeding the model
+    'processes': 1,              # >1: forked CPU workers sharing one copy of the model
+    'torch_threads': None,
+    'decode_preset': "default",  # "fast", "default" or "accurate"
+    'input': None,
+    'output': None,
+    'recursive': True,
+    'include': [],
+    'exclude': [],
+    'output_format': "yolo",     # any of "yolo", "coco", "voc", "shards", as a list or comma-separated
+    'taxonomy': None,
+    'prompt': "<bee>",
+    'task': "<OD>",
+    'prompts': [],               # several prompts per image, decoded from one vision encoder pass; replaces 'prompt'
+    'feature_cache_dir': None,   # keep encoder features on disk so reruns with other prompts skip the encoder
+    'review_queue': True,
+    'preprocess_cache_dir': None,
+    'dedup': False,              # run inference once per group of near-duplicate images
+    'dedup_threshold': 4,
+    'keyframe_interval': 10,     # videos: run the detector on every Nth frame, track boxes in between
+    'save_video_frames': False,  # also write the decoded video frames under <output>/frames
+    'profile': "auto",           # autotune profile: "auto" for this host's, a path, or null to ignore
+    'server': None,              # inference_server.py URL (http://host:port or unix:///path); no local model when set
+}
+PROFILE_KEYS = ('batch_size', 'workers', 'torch_threads', 'decode_preset')
+
+
+def default_profile_path():
+    return os.path.join(CACHE_DIR, f"autotune_{socket.gethostname()}.json")
+
+
+def load_config(path):
+    with open(path, 'r') as file:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            data = yaml.safe_load(file) or {}
+        else:
+            data = json.load(file)
+    unknown = set(data) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown config keys in {path}: {', '.join(sorted(unknown))}")
+    return data
+
+
+def load_profile(path, config):
+    """Tuned settings from an autotune profile, if it was made for the same model setup."""
+    if path == "auto":
+        path = default_profile_path()
+        if not os.path.exists(path):
+            return {}
+    with open(path, 'r') as file:
+        profile = json.load(file)
+    tuned_for = {key: profile.get(key) for key in ('checkpoint', 'device', 'backend')}
+    if any(tuned_for[key] != config[key] for key in tuned_for):
+        print(f"Warning: ignoring autotune profile {path}, it was tuned for {tuned_for}")
+        return {}
+    print(f"Using autotune profile {path}: {profile['settings']}")
+    return {key: value for key, value in profile['settings'].items() if key in PROFILE_KEYS}
+
+
+def build_config(args):
+    explicit = {}
+    if args.config:
+        explicit.update(load_config(args.config))
+    for key, value in vars(args).items():
+        if key != 'config' and value is not None:
+            explicit[key] = value
+    # Precedence: defaults < autotune profile < config file < command line
+    config = {**DEFAULT_CONFIG, **explicit}
+    if config['profile'] and config['profile'] != "none":
+        tuned = load_profile(config['profile'], config)
+        config = {**DEFAULT_CONFIG, **tuned, **explicit}
+    if isinstance(config['prompts'], str):
+        config['prompts'] = [prompt.strip() for prompt in config['prompts'].split(",") if prompt.strip()]
+    if config['prompts'] and (config['backend'] != "torch" or config['server']):
+        raise ValueError("'prompts' needs the local PyTorch backend (set it on the inference server instead)")
+    if config['dedup']:
+        from dedup import MAX_THRESHOLD
+
+        if not 0 <= config['dedup_threshold'] <= MAX_THRESHOLD:
+            raise ValueError(f"dedup_threshold must be between 0 and {MAX_THRESHOLD}")
+    if not config['input']:
+        raise ValueError("No input folder given (set 'input' in the config or pass --input)")
+    config['output'] = config['output'] or config['input']
+    config['output_format'] = parse_formats(config['output_format'])
+    return config
+
+
+def load_images(paths):
+    """(paths that could be read, their RGB images); unreadable files are reported and left out."""
+    from PIL import Image
+
+    loaded = []
+    images = []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                images.append(img.convert("RGB"))
+        except OSError as e:
+            print(f"Error: Unable to read image from {path}: {e}")
+            continue
+        loaded.append(path)
+    return loaded, images
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_detector(config, text, task, with_scores):
+    if config['server']:
+        from inference_client import InferenceClient
+        # Scores are the server's choice (inference_server.py --with-scores)
+        return InferenceClient(config['server'], text, task, pool_size=max(config['workers'], 1))
+
+    import torch
+
+    from detector import Detector, load_model
+    from preprocess_cache import PreprocessCache
+
+    if config['torch_threads']:
+        torch.set_num_threads(config['torch_threads'])
+    model, processor, device = load_model(config['checkpoint'], config['device'])
+    backend = None
+    if config['backend'] == "onnx":
+        from onnx_backend import OnnxBackend
+        backend = OnnxBackend(config['onnx_dir'], threads=config['torch_threads'])
+    cache = PreprocessCache(processor, config['preprocess_cache_dir'])
+    feature_cache = None
+    if config['prompts']:
+        from feature_cache import FeatureCache
+        feature_cache = FeatureCache(cache_dir=config['feature_cache_dir'])
+    return Detector(model, processor, device, config['decode_preset'], backend, cache, with_scores, text, task,
+                    config['prompts'], feature_cache)
+
+
+def run(config, detector=None, rel_paths=None):
+    """Annotate every image under config['input'] and write labels under config['output'].
+
+    rel_paths restricts the run to those images (and skips videos).
+    """
+    input_folder = config['input']
+    output_folder = config['output']
+    registry = ClassRegistry.load(output_folder, default_names=['bee'])
+    if config['taxonomy']:
+        taxonomy = load_taxonomy(config['taxonomy'], registry)
+        text, task = taxonomy.grounding_prompt(), GROUNDING_TASK
+    else:
+        taxonomy = Taxonomy(registry)
+        text, task = config['prompt'], config['task']
+
+    detector = detector or build_detector(config, text, task, config['review_queue'])
+    exporter = build_exporter(config['output_format'], output_folder, registry)
+    review_queue = ReviewQueue()
+    try:
+        annotate_videos = rel_paths is None
+        if rel_paths is None:
+            rel_paths = iter_images(input_folder, config['recursive'], config['include'], config['exclude'], relative=True, cache=True)
+        duplicates = {}
+        if config['dedup']:
+            from dedup import DUPLICATES_FILE, find_duplicate_groups, same_aspect, save_groups
+
+            # Only images in this run are grouped, so every skipped member's representative gets annotated here
+            rel_paths = list(rel_paths)
+            groups = find_duplicate_groups(input_folder, config['dedup_threshold'], rel_paths=rel_paths)
+            os.makedirs(output_folder, exist_ok=True)
+            save_groups(os.path.join(output_folder, DUPLICATES_FILE), groups)
+            # Labels can only be copied to members with the representative's aspect ratio; crops get their own inference
+            duplicates = {group[0]['image']: [member for member in group[1:] if same_aspect(group[0], member)] for group in groups}
+            skipped = {member['image'] for members in duplicates.values() for member in members}
+            rel_paths = (rel_path for rel_path in rel_paths if rel_path not in skipped)
+            reshaped = sum(len(group) - 1 for group in groups) - len(skipped)
+            print(f"Dedup: skipping inference on {len(skipped)} near-duplicate images"
+                  + (f", annotating {reshaped} with a different aspect ratio separately" if reshaped else ""))
+        batches = batched(rel_paths, config['batch_size'])
+
+        start = time.perf_counter()
+        count = 0
+        pool = None
+        if config['processes'] > 1:
+            if config['server'] or config['backend'] != "torch":
+                print("Warning: 'processes' only applies to the local PyTorch model, running in one process")
+            else:
+                from fork_pool import ForkedDetectorPool
+
+                try:
+                    pool = ForkedDetectorPool(detector, config['processes'], load_images, config['torch_threads'])
+                except ValueError as e:
+                    print(f"Warning: {e}, running in one process")
+        if pool is not None:
+            # imap feeds path batches from its own thread; results come back in the same order
+            fed = deque()
+
+            def path_batches():
+                for batch in batches:
+                    fed.append(batch)
+                    yield [os.path.join(input_folder, rel_path) for rel_path in batch]
+
+            try:
+                for image_paths, sizes, results in pool.imap(path_batches()):
+                    batch = readable(fed.popleft(), image_paths, input_folder)
+                    count += write_results(batch, sizes, results, exporter, taxonomy, review_queue, duplicates)
+            except BaseException:
+                pool.close(wait=False)
+                raise
+            pool.close()
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, config['workers'])) as executor:
+                # Decode the next batch of images while the model works on the current one
+                pending = None
+                for batch in batches:
+                    future = executor.submit(load_images, [os.path.join(input_folder, rel_path) for rel_path in batch])
+                    if pending:
+                        count += annotate_batch(detector, *pending, exporter, taxonomy, review_queue, config, duplicates)
+                    pending = (batch, future)
+                if pending:
+                    count += annotate_batch(detector, *pending, exporter, taxonomy, review_queue, config, duplicates)
+
+        frames_folder = os.path.join(output_folder, "frames") if config['save_video_frames'] else None
+        videos = []
+        if annotate_videos:
+            from video_annotate import VIDEO_EXTENSIONS, annotate_video
+
+            videos = list_images(input_folder, config['recursive'], config['include'], config['exclude'],
+                                 extensions=VIDEO_EXTENSIONS, relative=True, cache=True)
+        for rel_path in videos:
+            try:
+                frames, keyframes = annotate_video(detector, os.path.join(input_folder, rel_path), rel_path, exporter, taxonomy,
+                                                   config['keyframe_interval'], config['batch_size'], frames_folder)
+            except OSError as e:
+                print(f"Error: {e}")
+                continue
+            print(f"{rel_path}: {frames} frames labelled from {keyframes} detector calls")
+            count += frames
+    finally:
+        # Also after an error, so exports are finalized and what was annotated so far is kept
+        exporter.close()
+        registry.save(output_folder)
+        if config['review_queue']:
+            review_queue.save(os.path.join(output_folder, REVIEW_QUEUE_FILE))
+        if detector.cache is not None:
+            detector.cache.flush()
+    elapsed = time.perf_counter() - start
+    taxonomy.report()
+    print(f"Annotated {count} images in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.2f} images/s)")
+    return count
+
+
+def readable(rel_paths, loaded_paths, input_folder):
+    loaded = set(loaded_paths)
+    return [rel_path for rel_path in rel_paths if os.path.join(input_folder, rel_path) in loaded]
+
+
+def annotate_batch(detector, rel_paths, future, exporter, taxonomy, review_queue, config, duplicates):
+    image_paths, images = future.result()
+    if not images:
+        return 0
+    rel_paths = readable(rel_paths, image_paths, config['input'])
+    results = detector.detect_batch(images, image_paths)
+    return write_results(rel_paths, [image.size for image in images], results, exporter, taxonomy, review_queue, duplicates)
+
+
+def write_results(rel_paths, sizes, results, exporter, taxonomy, review_queue, duplicates):
+    for rel_path, (width, height), (detections, sequence_score, beam_box_counts) in zip(rel_paths, sizes, results):
+        # Converted once, then written to every requested format
+        classes, boxes, _ = detections_to_yolo(detections, width, height, taxonomy)
+        exporter.write(rel_path, width, height, classes, boxes)
+        # Normalized boxes carry over to resized copies unchanged; only the pixel size differs
+        for member in duplicates.get(rel_path, []):
+            exporter.write(member['image'], member['width'], member['height'], classes, boxes)
+        if sequence_score is not None:
+            review_queue.add(rel_path, sequence_score, detections.confidence, beam_box_counts)
+    return len(rel_paths)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Auto-annotate a folder of images with Florence-2.")
+    parser.add_argument("--config", help="JSON or YAML file with any of the settings below")
+    parser.add_argument("--input", help="Folder of images to annotate")
+    parser.add_argument("--output", help="Dataset folder for labels/, voc/ and annotations.json (defaults to the input folder)")
+    parser.add_argument("--checkpoint")
+    parser.add_argument("--device", help="'auto', 'cpu', 'cuda', 'cuda:1', ...")
+    parser.add_argument("--backend", choices=["torch", "onnx"])
+    parser.add_argument("--onnx-dir", dest="onnx_dir")
+    parser.add_argument("--batch-size", dest="batch_size", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--torch-threads", dest="torch_threads", type=int, help="Per worker process when --processes > 1")
+    parser.add_argument("--processes", type=int, help="Forked CPU inference workers sharing one copy of the model")
+    parser.add_argument("--decode-preset", dest="decode_preset", choices=sorted(DECODE_PRESETS))
+    parser.add_argument("--output-format", dest="output_format", help="Comma-separated: yolo,coco,voc,shards")
+    parser.add_argument("--prompts", help="Comma-separated prompts decoded from one encoder pass per image")
+    parser.add_argument("--feature-cache-dir", dest="feature_cache_dir")
+    parser.add_argument("--taxonomy", help="Class/synonym file for multi-class phrase grounding")
+    parser.add_argument("--preprocess-cache-dir", dest="preprocess_cache_dir")
+    parser.add_argument("--keyframe-interval", dest="keyframe_interval", type=int, help="Video frames between detector calls")
+    parser.add_argument("--profile", help="Autotune profile to load ('auto' for this host's, 'none' to ignore)")
+    parser.add_argument("--server", help="Send images to a running inference_server.py instead of loading the model")
+    parser.add_argument("--dedup", action="store_true", default=None, help="Annotate one image per near-duplicate group")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        config = build_config(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+    run(config)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+
+from label_io import label_path_for, read_labels, report_errors
+from taxonomy import Taxonomy
+
+PROPOSAL_DIR = "proposals"  # annotate_cli --output <dataset>/proposals fills this cache ahead of time
+
+
+class AssistWorker:
+    """Runs the detector for upcoming images on a background thread.
+
+    The GUI calls request() with the next few images in navigation order and
+    polls result() from a Tk after() callback, so neither model loading nor
+    inference ever runs on the Tk main loop. Proposals already on disk under
+    proposal_folder are used instead of running the model.
+    """
+
+    def __init__(self, registry, proposal_folder=None, detector_factory=None, image_loader=None, preset='fast', max_results=64):
+        self.taxonomy = Taxonomy(registry)
+        self.proposal_folder = proposal_folder
+        self.image_loader = image_loader or load_rgb
+        self.detector_factory = detector_factory or (lambda: default_detector(preset))
+        self.detector = None
+        self.max_results = max_results
+        self.pending = []
+        self.done = OrderedDict()  # image path -> (classes, boxes)
+        self.error = None
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, image_paths):
+        # Replaces the previous window: images the annotator skipped past are no longer worth computing
+        with self.condition:
+            self.pending = [path for path in image_paths if path not in self.done]
+            self.condition.notify()
+
+    def result(self, image_path):
+        with self.condition:
+            return self.done.get(image_path)
+
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                image_path = self.pending.pop(0)
+            try:
+                proposals = self._propose(image_path)
+            except Exception as e:  # a failing model must not take the GUI down with it
+                print(f"Error: Model assist failed on {image_path}: {e}")
+                with self.condition:
+                    self.error = e
+                    self.pending = []
+                    # Without a model there is nothing left to try
+                    self.stopped = self.stopped or self.detector is None
+                continue
+            with self.condition:
+                self.done[image_path] = proposals
+                while len(self.done) > self.max_results:
+                    self.done.popitem(last=False)
+
+    def _propose(self, image_path):
+        if self.proposal_folder:
+            cached = label_path_for(image_path, self.proposal_folder)
+            if os.path.exists(cached):
+                classes, boxes, errors = read_labels(cached)
+                report_errors(errors)
+                return classes, boxes
+
+        from detector import detections_to_yolo
+
+        if self.detector is None:
+            self.detector = self.detector_factory()
+        image = self.image_loader(image_path)
+        detections, _, _ = self.detector.detect(image, image_path)
+        classes, boxes, _ = detections_to_yolo(detections, image.size[0], image.size[1], self.taxonomy)
+        return classes, boxes
+
+
+def load_rgb(image_path):
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        return img.convert("RGB")
+
+
+def default_detector(preset='fast'):
+    from detector import Detector, load_model
+    from inference_client import client_from_env
+
+    # A running inference_server.py saves loading a second copy of the model into the GUI
+    client = client_from_env()
+    if client is not None:
+        return client
+    model, processor, device = load_model()
+    return Detector(model, processor, device, preset)
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from annotate_cli import DEFAULT_CONFIG, PROFILE_KEYS, build_detector, default_profile_path, load_config, run
+from dataset_scan import list_images
+from detector import DECODE_PRESETS
+from label_io import atomic_write_text
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # Not Linux: fall back to the process high-water mark (kilobytes on Linux/BSD, bytes on macOS)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """Samples resident memory on a background thread while a trial runs."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def _sample(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def time_trial(config, detector, rel_paths, settings):
+    """Annotate rel_paths with settings applied; returns (images per second, peak resident bytes)."""
+    import torch
+
+    torch.set_num_threads(settings['torch_threads'])
+    detector.decode = dict(DECODE_PRESETS[settings['decode_preset']])
+    with tempfile.TemporaryDirectory() as output:
+        trial = dict(config, **settings, output=output, output_format=["yolo"], review_queue=False, dedup=False, processes=1)
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            count = run(trial, detector, rel_paths)
+            elapsed = time.perf_counter() - start
+    return count / max(elapsed, 1e-9), memory.peak
+
+
+def autotune(config, sample_size=16, memory_limit=None, presets=None, detector=None, seed=0):
+    """Find the fastest batch size, torch threads, decode workers (and optionally preset) on this host.
+
+    A full grid is too slow with a real model, so the sweep is greedy: torch
+    threads first at batch size 1, then batch size with the best thread
+    count (stopping once throughput drops or memory_limit is exceeded), then
+    decode workers, then presets. Each trial times a run over the same
+    random sample of the dataset after one warm-up batch. The forked worker
+    count is left out: every trial runs in this process, and ForkedDetectorPool
+    can't fork safely once it has run inference.
+    """
+    rel_paths = list_images(config['input'], config['recursive'], config['include'], config['exclude'], relative=True, cache=True)
+    if not rel_paths:
+        raise ValueError(f"No images found in {config['input']}")
+    rel_paths = random.Random(seed).sample(rel_paths, min(sample_size, len(rel_paths)))
+    detector = detector or build_detector(config, config['prompt'], config['task'], with_scores=False)
+
+    cores = os.cpu_count() or 1
+    thread_options = sorted({max(1, cores // divisor) for divisor in (4, 2, 1)})
+    batch_options = [size for size in (1, 2, 4, 8, 16) if size <= len(rel_paths)]
+    worker_options = [1, 2, 4]
+    presets = presets or [config['decode_preset']]
+
+    best = {'batch_size': 1, 'workers': config['workers'], 'torch_threads': cores, 'decode_preset': presets[0]}
+    trials = []
+
+    def measure(**changes):
+        settings = dict(best, **changes)
+        for trial in trials:
+            if trial['settings'] == settings:
+                return trial
+        try:
+            throughput, peak = time_trial(config, detector, rel_paths, settings)
+        except (RuntimeError, MemoryError) as e:  # torch reports out-of-memory as RuntimeError
+            print(f"Error: trial {settings} failed: {e}")
+            throughput, peak = 0.0, None
+        trial = {'settings': settings, 'images_per_second': round(throughput, 4), 'peak_memory': peak,
+                 'over_memory_limit': bool(memory_limit and peak and peak > memory_limit)}
+        trials.append(trial)
+        print(f"autotune: {settings} -> {throughput:.2f} images/s, peak {(peak or 0) / 2**20:.0f} MiB")
+        return trial
+
+    def usable(trial):
+        return trial['images_per_second'] > 0 and not trial['over_memory_limit']
+
+    def pick(key, options, stop_early=False):
+        best_trial = None
+        for value in options:
+            trial = measure(**{key: value})
+            if not usable(trial):
+                if stop_early:
+                    break
+                continue
+            if best_trial is None or trial['images_per_second'] > best_trial['images_per_second']:
+                best_trial = trial
+            elif stop_early:
+                break
+        if best_trial is not None:
+            best.update(best_trial['settings'])
+
+    # Warm-up: the first batch pays for lazy initialisation and would skew the first trial
+    time_trial(config, detector, rel_paths[:1], best)
+    pick('torch_threads', thread_options)
+    pick('batch_size', batch_options, stop_early=True)
+    pick('workers', worker_options)
+    if len(presets) > 1:
+        pick('decode_preset', presets)
+
+    result = next((trial for trial in trials if trial['settings'] == best and usable(trial)), None)
+    if result is None:
+        raise RuntimeError("No setting stayed within the memory limit")
+    return {
+        'host': socket.gethostname(),
+        'cpu_count': cores,
+        'checkpoint': config['checkpoint'],
+        'device': config['device'],
+        'backend': config['backend'],
+        'sample_size': len(rel_paths),
+        'memory_limit': memory_limit,
+        'settings': {key: best[key] for key in PROFILE_KEYS},
+        'untuned': {'processes': "trials run in one process; set 'processes' in the config"},
+        'images_per_second': result['images_per_second'],
+        'trials': trials,
+    }
+
+
+def parse_size(text):
+    units = {'k': 2**10, 'm': 2**20, 'g': 2**30}
+    text = text.strip().lower().rstrip('b')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune batch size, threads and workers for annotate_cli.py on this host.")
+    parser.add_argument("--config", help="annotate_cli config to tune (checkpoint, device, backend, input, ...)")
+    parser.add_argument("--input", help="Image folder to sample from")
+    parser.add_argument("--sample-size", dest="sample_size", type=int, default=16)
+    parser.add_argument("--memory-limit", dest="memory_limit", type=parse_size, help="Skip settings whose peak RSS exceeds this, e.g. 12G")
+    parser.add_argument("--presets", help="Comma-separated decode presets to compare (default: only the configured one)")
+    parser.add_argument("--output", help="Profile path (default: this host's profile, loaded automatically by annotate_cli.py)")
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG)
+    try:
+        if args.config:
+            config.update(load_config(args.config))
+        if args.input:
+            config['input'] = args.input
+        if not config['input']:
+            raise ValueError("No input folder given (set 'input' in the config or pass --input)")
+        presets = [preset.strip() for preset in args.presets.split(",")] if args.presets else None
+        unknown = set(presets or []) - set(DECODE_PRESETS)
+        if unknown:
+            raise ValueError(f"Unknown decode preset(s): {', '.join(sorted(unknown))}")
+        profile = autotune(config, args.sample_size, args.memory_limit, presets)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    path = args.output or default_profile_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write_text(path, json.dumps(profile, indent=1))
+    print(f"Best: {profile['settings']} at {profile['images_per_second']:.2f} images/s, written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
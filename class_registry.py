@@ -0,0 +1,156 @@
+import os
+import random
+
+CLASSES_FILE = "classes.txt"
+DATA_YAML_FILE = "data.yaml"
+
+
+class ClassRegistry:
+    """Bidirectional class name <-> index table shared by the auto and manual annotators.
+
+    Indices are stored in a list so name/color lookups for a box are a single
+    array access instead of a scan over a dict.
+    """
+
+    def __init__(self, names=None):
+        self.names = []       # index -> name (None for unused indices)
+        self.indices = {}     # name -> index
+        self.colors = []      # index -> "#rrggbb"
+        self.colors_bgr = []  # index -> (b, g, r) for OpenCV
+        self.text_metrics = []
+        self.measure_text = None
+        for name in names or []:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, name):
+        return name in self.indices
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def items(self):
+        return sorted(self.indices.items(), key=lambda item: item[1])
+
+    def class_names(self):
+        return [name for name in self.names if name is not None]
+
+    def add(self, name, index=None):
+        """Index of name, adding it at index (default: the next free one); raises ValueError if index is unusable."""
+        if name in self.indices:
+            return self.indices[name]
+        if index is None:
+            index = len(self.names)
+        if index < 0:
+            raise ValueError(f"Class index must not be negative, got {index} for '{name}'")
+        if index < len(self.names) and self.names[index] is not None:
+            raise ValueError(f"Class index {index} is already used by '{self.names[index]}'")
+        while len(self.names) <= index:
+            self.names.append(None)
+            self.colors.append("#000000")
+            self.colors_bgr.append((0, 0, 0))
+            self.text_metrics.append(None)
+
+        self.names[index] = name
+        self.indices[name] = index
+        self.colors[index] = self.color_for_index(index)
+        self.colors_bgr[index] = hex_to_bgr(self.colors[index])
+        if self.measure_text:
+            self.text_metrics[index] = self.measure_text(name)
+        return index
+
+    def index_of(self, name, default=None):
+        return self.indices.get(name, default)
+
+    def name_of(self, index, default="Unknown"):
+        if 0 <= index < len(self.names) and self.names[index] is not None:
+            return self.names[index]
+        return default
+
+    def color_of(self, index, default="#000000"):
+        if 0 <= index < len(self.names) and self.names[index] is not None:
+            return self.colors[index]
+        return default
+
+    def bgr_of(self, index, default=(0, 255, 0)):
+        if 0 <= index < len(self.names) and self.names[index] is not None:
+            return self.colors_bgr[index]
+        return default
+
+    def text_size_of(self, index):
+        if 0 <= index < len(self.text_metrics):
+            return self.text_metrics[index]
+        return None
+
+    def set_text_measure(self, measure):
+        # measure(name) -> (width, height); cached per class so redraws never re-measure
+        self.measure_text = measure
+        self.text_metrics = [measure(name) if name is not None else None for name in self.names]
+
+    @staticmethod
+    def color_for_index(index):
+        # Seeded per index so the GUI, renderer and exports agree on colors across runs
+        return "#{:06x}".format(random.Random(index).randint(0, 0xFFFFFF))
+
+    @classmethod
+    def load(cls, folder, default_names=None):
+        registry = cls()
+        classes_path = os.path.join(folder, CLASSES_FILE)
+        yaml_path = os.path.join(folder, DATA_YAML_FILE)
+
+        if os.path.exists(classes_path):
+            with open(classes_path, 'r') as file:
+                for index, line in enumerate(file):
+                    name = line.strip()
+                    if name:
+                        registry.add(name, index)
+        elif os.path.exists(yaml_path):
+            for index, name in enumerate(read_yaml_names(yaml_path)):
+                registry.add(name, index)
+
+        if not len(registry) and default_names:
+            for name in default_names:
+                registry.add(name)
+        return registry
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        names = [name if name is not None else f"class_{index}" for index, name in enumerate(self.names)]
+
+        with open(os.path.join(folder, CLASSES_FILE), 'w') as file:
+            for name in names:
+                file.write(name + "\n")
+
+        with open(os.path.join(folder, DATA_YAML_FILE), 'w') as file:
+            file.write(f"nc: {len(names)}\n")
+            file.write("names: [" + ", ".join(repr(name) for name in names) + "]\n")
+
+
+def hex_to_bgr(color):
+    value = int(color.lstrip('#'), 16)
+    return (value & 0xFF, (value >> 8) & 0xFF, (value >> 16) & 0xFF)
+
+
+def read_yaml_names(yaml_path):
+    try:
+        import yaml
+    except ImportError:
+        yaml = None
+
+    if yaml is not None:
+        with open(yaml_path, 'r') as file:
+            data = yaml.safe_load(file) or {}
+        names = data.get('names', [])
+        if isinstance(names, dict):
+            return [names[key] for key in sorted(names)]
+        return list(names)
+
+    # Fallback for the single-line "names: [...]" form written by ClassRegistry.save
+    with open(yaml_path, 'r') as file:
+        for line in file:
+            if line.startswith("names:"):
+                items = line.split(":", 1)[1].strip().strip("[]")
+                return [item.strip().strip("'\"") for item in items.split(",") if item.strip()]
+    return []
@@ -0,0 +1,152 @@
+import fnmatch
+import hashlib
+import json
+import os
+
+from image_probe import probe_size
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.tif', '.tiff', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "auto_annotations")
+
+
+def default_cache_path(root):
+    # Kept outside the dataset: writing next to the images would bump the root mtime and invalidate itself
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"index_{key}.json")
+
+
+def matches_any(path, patterns):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+class DatasetIndex:
+    """Lazy, mtime-cached listing of the images under a dataset root.
+
+    Directories are read with os.scandir, so file type checks come from the
+    directory entry instead of a stat per file. A directory is only re-listed
+    when its mtime changes; the cache can be persisted between runs. Image
+    sizes probed from file headers are cached alongside the listings.
+    """
+
+    def __init__(self, root, cache_path=None):
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path
+        self.dirs = {}  # relative dir -> {'mtime': ns, 'files': [...], 'subdirs': [...]}
+        self.sizes = {}  # relative file -> [mtime_ns, width, height]
+        self.dirty = False
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r') as file:
+                    data = json.load(file)
+                if data.get('root') == self.root:
+                    self.dirs = data.get('dirs', {})
+                    self.sizes = data.get('sizes', {})
+            except (OSError, ValueError) as e:
+                print(f"Warning: ignoring unreadable dataset index {cache_path}: {e}")
+
+    def list_dir(self, rel_dir):
+        path = os.path.join(self.root, rel_dir)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return [], []
+
+        cached = self.dirs.get(rel_dir)
+        if cached and cached['mtime'] == mtime:
+            return cached['files'], cached['subdirs']
+
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry.name)
+        files.sort()
+        subdirs.sort()
+        self.dirs[rel_dir] = {'mtime': mtime, 'files': files, 'subdirs': subdirs}
+        self.dirty = True
+        return files, subdirs
+
+    def iter_images(self, recursive=False, include=None, exclude=None, extensions=IMAGE_EXTENSIONS, relative=False):
+        """Yield image paths in sorted, depth-first order.
+
+        include/exclude are glob patterns matched against the path relative to
+        the root (with '/' separators); extensions are matched case-insensitively.
+        """
+        extensions = tuple(ext.lower() for ext in extensions)
+        include = list(include or [])
+        exclude = list(exclude or [])
+        pending = [""]
+
+        while pending:
+            rel_dir = pending.pop()
+            files, subdirs = self.list_dir(rel_dir)
+
+            for name in files:
+                if not name.lower().endswith(extensions):
+                    continue
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if include and not matches_any(rel_path, include):
+                    continue
+                if exclude and matches_any(rel_path, exclude):
+                    continue
+                yield rel_path.replace('/', os.sep) if relative else os.path.join(self.root, rel_path)
+
+            if recursive:
+                children = [f"{rel_dir}/{name}" if rel_dir else name for name in subdirs]
+                children = [child for child in children if not (exclude and matches_any(child, exclude))]
+                pending.extend(reversed(children))
+
+    def _size_entry(self, image_path):
+        path = os.path.join(self.root, image_path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, None
+        return os.path.relpath(path, self.root).replace(os.sep, '/'), mtime
+
+    def cached_size(self, image_path):
+        # (width, height) if the file hasn't changed since it was last probed; never opens the file
+        rel_path, mtime = self._size_entry(image_path)
+        cached = self.sizes.get(rel_path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        return None
+
+    def remember_size(self, image_path, size):
+        # For sizes probed elsewhere, e.g. in worker processes
+        rel_path, mtime = self._size_entry(image_path)
+        if size is not None and mtime is not None:
+            self.sizes[rel_path] = [mtime, size[0], size[1]]
+            self.dirty = True
+
+    def image_size(self, image_path):
+        # (width, height) of an image under the root, probed from its header and cached by file mtime
+        size = self.cached_size(image_path)
+        if size is None:
+            size = probe_size(os.path.join(self.root, image_path))
+            self.remember_size(image_path, size)
+        return size
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'root': self.root, 'dirs': self.dirs, 'sizes': self.sizes}, file)
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
+
+
+def iter_images(root, recursive=False, include=None, exclude=None, extensions=IMAGE_EXTENSIONS, relative=False, cache=False):
+    index = DatasetIndex(root, default_cache_path(root) if cache else None)
+    yield from index.iter_images(recursive, include, exclude, extensions, relative)
+    index.save()
+
+
+def list_images(root, recursive=False, include=None, exclude=None, extensions=IMAGE_EXTENSIONS, relative=False, cache=False):
+    return list(iter_images(root, recursive, include, exclude, extensions, relative, cache))
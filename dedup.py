@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_scan import DatasetIndex, default_cache_path
+from image_probe import load_thumbnail
+from label_io import atomic_write_text, label_path_for
+
+DUPLICATES_FILE = "duplicate_groups.json"
+HASH_SIZE = 8
+DCT_SIZE = 32
+MAX_THRESHOLD = 15        # 16 chunks of 4 bits; narrower chunks put nearly every hash in one bucket
+MAX_BLOCK_PAIRS = 1 << 18
+
+
+def dct_matrix(size):
+    # Orthonormal DCT-II basis, so a batch of 2-D DCTs is two matrix products
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = dct_matrix(DCT_SIZE)
+
+
+def load_gray(image_path):
+    try:
+        img = load_thumbnail(image_path, DCT_SIZE * 4).convert("L").resize((DCT_SIZE, DCT_SIZE))
+    except OSError as e:
+        print(f"Error: Unable to read image from {image_path}: {e}")
+        return None
+    return np.asarray(img, dtype=np.float32)
+
+
+def phash_batch(grays):
+    """64-bit perceptual hashes of a (N, 32, 32) stack of grayscale thumbnails."""
+    coefficients = DCT @ grays @ DCT.T
+    low = coefficients[:, :HASH_SIZE, :HASH_SIZE].reshape(len(grays), -1)
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def _hash_chunk(image_paths):
+    grays = [load_gray(path) for path in image_paths]
+    valid = np.array([gray is not None for gray in grays], dtype=bool)
+    hashes = np.zeros(len(image_paths), dtype=np.uint64)
+    if valid.any():
+        hashes[valid] = phash_batch(np.stack([gray for gray in grays if gray is not None]))
+    return hashes, valid
+
+
+def compute_hashes(image_paths, workers=None, chunk_size=256):
+    chunks = [image_paths[start:start + chunk_size] for start in range(0, len(image_paths), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_hash_chunk, chunks))
+    if not results:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    return np.concatenate([hashes for hashes, _ in results]), np.concatenate([valid for _, valid in results])
+
+
+def popcount(values):
+    values = np.asarray(values, dtype=np.uint64)
+    bits = np.unpackbits(values.astype('>u8').view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    return bits.reshape(values.shape)
+
+
+def bucket_pairs(members, hashes, threshold, earlier_chunks):
+    """Pairs within threshold among one bucket's members (sorted indices), compared in bounded blocks.
+
+    Every pair of a bucket has to be checked, so a huge bucket is still
+    quadratic, but it is done with array operations on at most
+    MAX_BLOCK_PAIRS distances at a time instead of a Python loop. Pairs that
+    also share one of earlier_chunks were already reported from that bucket.
+    """
+    member_hashes = hashes[members]
+    rows_per_block = max(1, MAX_BLOCK_PAIRS // len(members))
+    found = []
+    for start in range(0, len(members) - 1, rows_per_block):
+        rows = np.arange(start, min(start + rows_per_block, len(members)))
+        xor = member_hashes[rows, None] ^ member_hashes[None, :]
+        keep = (popcount(xor) <= threshold) & (np.arange(len(members))[None, :] > rows[:, None])
+        for low, mask in earlier_chunks:
+            keep &= ((xor >> low) & mask) != 0
+        row, col = np.nonzero(keep)
+        found.append(np.stack([members[rows[row]], members[col]], axis=1))
+    return found
+
+
+def near_duplicate_pairs(hashes, threshold):
+    """Pairs (i, j), i < j, with Hamming distance <= threshold, via multi-index hashing.
+
+    The 64 bits are split into threshold + 1 chunks; by the pigeonhole
+    principle two hashes within the threshold agree exactly on at least one
+    chunk, so only hashes sharing a chunk bucket are ever compared. Each pair
+    is reported from the first chunk it shares. Above MAX_THRESHOLD the
+    chunks get too narrow to prune anything.
+    """
+    if not 0 <= threshold <= MAX_THRESHOLD:
+        raise ValueError(f"Duplicate threshold must be between 0 and {MAX_THRESHOLD}, got {threshold}")
+    bounds = np.linspace(0, 64, threshold + 2).astype(int)
+    found = []
+    earlier_chunks = []
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        low, mask = np.uint64(low), np.uint64((1 << int(high - low)) - 1)
+        keys = (hashes >> low) & mask
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        shared = ends - starts > 1
+        for start, end in zip(starts[shared].tolist(), ends[shared].tolist()):
+            found += bucket_pairs(np.sort(order[start:end]), hashes, threshold, earlier_chunks)
+        earlier_chunks.append((low, mask))
+    if not found:
+        return []
+    pairs = np.concatenate(found)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))].tolist()
+
+
+def group_pairs(count, pairs):
+    parent = list(range(count))
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for item in range(count):
+        groups.setdefault(find(item), []).append(item)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def find_duplicate_groups(image_folder, threshold=4, workers=None, recursive=True, rel_paths=None):
+    """Group near-duplicate images; each group lists its representative first.
+
+    The representative is the highest-resolution copy (sizes come from file
+    headers), so inference or manual labelling runs on the best version.
+    rel_paths limits grouping to those images instead of the whole tree.
+    """
+    index = DatasetIndex(image_folder, default_cache_path(image_folder))
+    if rel_paths is None:
+        rel_paths = list(index.iter_images(recursive, relative=True))
+    paths = [os.path.join(image_folder, rel_path) for rel_path in rel_paths]
+    hashes, valid = compute_hashes(paths, workers)
+    indices = np.flatnonzero(valid)
+    pairs = [(indices[a], indices[b]) for a, b in near_duplicate_pairs(hashes[valid], threshold)]
+
+    groups = []
+    for members in group_pairs(len(paths), pairs):
+        sizes = {member: index.image_size(rel_paths[member]) or (0, 0) for member in members}
+        members.sort(key=lambda member: (-sizes[member][0] * sizes[member][1], rel_paths[member]))
+        groups.append([{'image': rel_paths[member], 'width': sizes[member][0], 'height': sizes[member][1]} for member in members])
+    index.save()
+    return groups
+
+
+def same_aspect(a, b, tolerance=0.01):
+    if not a['height'] or not b['height']:
+        return False
+    return abs(a['width'] / a['height'] - b['width'] / b['height']) <= tolerance * (a['width'] / a['height'])
+
+
+def save_groups(path, groups):
+    atomic_write_text(path, json.dumps({'groups': groups}, indent=1))
+
+
+def load_groups(path):
+    with open(path, 'r') as file:
+        return json.load(file).get('groups', [])
+
+
+def propagate_labels(groups, label_folder):
+    """Copy each representative's YOLO labels to the other members of its group.
+
+    YOLO boxes are normalized, so a copy at another resolution is already
+    correct; members whose aspect ratio differs (crops, letterboxing) are
+    skipped rather than given misplaced boxes.
+    """
+    copied = 0
+    skipped = []
+    for group in groups:
+        representative = group[0]
+        source = label_path_for(representative['image'], os.path.join(label_folder, os.path.dirname(representative['image'])))
+        if not os.path.exists(source):
+            continue
+        with open(source, 'r') as file:
+            text = file.read()
+        for member in group[1:]:
+            if not same_aspect(representative, member):
+                skipped.append(member['image'])
+                continue
+            label_dir = os.path.join(label_folder, os.path.dirname(member['image']))
+            os.makedirs(label_dir, exist_ok=True)
+            atomic_write_text(label_path_for(member['image'], label_dir), text)
+            copied += 1
+    if skipped:
+        print(f"Warning: {len(skipped)} duplicates have a different aspect ratio and were not given copied labels")
+    return copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find near-duplicate images and optionally share labels within groups.")
+    parser.add_argument("image_folder")
+    parser.add_argument("--threshold", type=int, default=4, help="Maximum Hamming distance between 64-bit perceptual hashes")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help=f"Where to write the groups (default: <image_folder>/{DUPLICATES_FILE})")
+    parser.add_argument("--propagate-labels", dest="label_folder", help="Copy representative labels to duplicates in this folder")
+    args = parser.parse_args(argv)
+
+    try:
+        groups = find_duplicate_groups(args.image_folder, args.threshold, args.workers)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    save_groups(args.output or os.path.join(args.image_folder, DUPLICATES_FILE), groups)
+    duplicates = sum(len(group) - 1 for group in groups)
+    print(f"Found {len(groups)} duplicate groups ({duplicates} redundant images)")
+    if args.label_folder:
+        print(f"Copied labels to {propagate_labels(groups, args.label_folder)} duplicates")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
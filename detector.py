@@ -0,0 +1,227 @@
+import time
+
+import numpy as np
+
+from review_queue import beam_agreement
+
+DEFAULT_CHECKPOINT = "microsoft/Florence-2-large-ft"
+DECODE_PRESETS = {
+    'fast': {'num_beams': 1, 'max_new_tokens': 256},
+    'default': {'num_beams': 3, 'max_new_tokens': 1024},
+    'accurate': {'num_beams': 5, 'max_new_tokens': 1024},
+}
+
+
+def resolve_device(device=None):
+    import torch
+
+    if device in (None, "auto"):
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return torch.device(device)
+
+
+def load_model(checkpoint=DEFAULT_CHECKPOINT, device=None):
+    # Imported here so tools that never run inference don't pay for torch/transformers at startup
+    from transformers import AutoModelForCausalLM, AutoProcessor
+
+    device = resolve_device(device)
+    model = AutoModelForCausalLM.from_pretrained(checkpoint, trust_remote_code=True).to(device).eval()
+    processor = AutoProcessor.from_pretrained(checkpoint, trust_remote_code=True)
+    return model, processor, device
+
+
+def detections_to_yolo(detections, image_width, image_height, taxonomy):
+    """Convert sv.Detections to (classes, boxes) arrays of normalized YOLO rows.
+
+    Boxes whose label the taxonomy can't resolve are dropped.
+    """
+    xyxy = np.asarray(detections.xyxy, dtype=np.float32).reshape(-1, 4)
+    names = detections.data.get('class_name', [])
+    classes = np.array([taxonomy.resolve(name) if isinstance(name, str) else -1 for name in names] or [], dtype=object)
+    keep = np.array([class_index is not None and class_index >= 0 for class_index in classes], dtype=bool)
+    if not len(xyxy) or not keep.any():
+        return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32), keep
+
+    xyxy = xyxy[keep]
+    scale = np.array([image_width, image_height], dtype=np.float32)
+    centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2 / scale
+    sizes = (xyxy[:, 2:] - xyxy[:, :2]) / scale
+    return classes[keep].astype(np.int32), np.hstack([centers, sizes]), keep
+
+
+def make_detections(xyxy, class_names, confidence=None):
+    """sv.Detections built from plain arrays, for detections that didn't come straight from the model."""
+    import supervision as sv
+
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    confidence = None if confidence is None else np.asarray(confidence, dtype=np.float32)
+    return sv.Detections(xyxy=xyxy, confidence=confidence, data={'class_name': np.array(class_names, dtype=str).reshape(-1)})
+
+
+class Detector:
+    """Florence-2 detection over batches of PIL images.
+
+    backend defaults to the PyTorch model; any object with the same
+    generate() signature (e.g. OnnxBackend) can be used instead. With
+    with_scores=True every beam is kept so boxes can be scored for review.
+    With prompts set, text is ignored and each prompt is decoded in turn
+    from image features encoded once (and kept in feature_cache, if given).
+    """
+
+    def __init__(self, model, processor, device, preset='default', backend=None, cache=None,
+                 with_scores=False, text="<bee>", task="<OD>", prompts=None, feature_cache=None):
+        self.model = model
+        self.processor = processor
+        self.device = device
+        self.decode = dict(DECODE_PRESETS[preset]) if isinstance(preset, str) else dict(preset)
+        self.backend = backend or model
+        self.cache = cache
+        # Scores come from beam search: greedy decoding and non-PyTorch backends have none to keep
+        self.with_scores = with_scores and self.backend is model and self.decode['num_beams'] > 1
+        self.text = text
+        self.task = task
+        # With several prompts the vision encoder runs once per image and every prompt decodes from its features
+        self.prompts = list(prompts or [])
+        self.feature_cache = feature_cache
+        if self.prompts:
+            if self.backend is not model:
+                raise ValueError("Multiple prompts need the PyTorch model; the ONNX graphs don't take image features")
+            self.with_scores = False
+            if self.cache is None:
+                from preprocess_cache import PreprocessCache
+                self.cache = PreprocessCache(processor)  # in memory only, for the tokenized prompts
+
+    def prepare(self, images, image_paths=None):
+        import torch
+
+        from preprocess_cache import image_key
+
+        image_paths = image_paths or [None] * len(images)
+        if self.cache is None:
+            return self.processor(text=[self.text] * len(images), images=images, return_tensors="pt").to(self.device)
+
+        prompt = self.cache.prompt_inputs(self.text)
+        pixel_values = torch.stack([self.cache.pixel_values(image, image_key(image, path))
+                                    for image, path in zip(images, image_paths)])
+        dtype = getattr(self.model, "dtype", torch.float32)
+        return {
+            "input_ids": prompt["input_ids"].repeat(len(images), 1).to(self.device),
+            "pixel_values": pixel_values.to(self.device, dtype),
+        }
+
+    def generate(self, inputs):
+        import torch
+
+        num_beams = self.decode['num_beams'] if self.backend is self.model else 1
+        kwargs = {'max_new_tokens': self.decode['max_new_tokens'], 'num_beams': num_beams}
+        if self.with_scores:
+            kwargs.update(num_return_sequences=num_beams, output_scores=True, return_dict_in_generate=True)
+        with torch.no_grad():
+            return self.backend.generate(input_ids=inputs["input_ids"], pixel_values=inputs["pixel_values"], **kwargs), num_beams
+
+    def to_detections(self, generated_text, image_size):
+        import supervision as sv
+
+        response = self.processor.post_process_generation(generated_text, task=self.task, image_size=image_size)
+        return sv.Detections.from_lmm(sv.LMM.FLORENCE_2, response, resolution_wh=image_size)
+
+    def encode_features(self, images, image_paths=None):
+        """Vision encoder features for a batch; images found in feature_cache skip preprocessing and the encoder."""
+        import torch
+
+        from preprocess_cache import image_key
+
+        image_paths = image_paths or [None] * len(images)
+        keys = [None] * len(images)
+        features = [None] * len(images)
+        dtype = getattr(self.model, "dtype", torch.float32)
+        if self.feature_cache is not None:
+            keys = [image_key(image, path) for image, path in zip(images, image_paths)]
+            features = [self.feature_cache.get(key, self.device, dtype) for key in keys]
+        missing = [index for index, feature in enumerate(features) if feature is None]
+        if missing:
+            inputs = self.prepare([images[index] for index in missing], [image_paths[index] for index in missing])
+            with torch.no_grad():
+                encoded = self.model._encode_image(inputs["pixel_values"].to(self.device, dtype))
+            for row, index in enumerate(missing):
+                features[index] = encoded[row:row + 1]
+                if self.feature_cache is not None:
+                    self.feature_cache.put(keys[index], features[index])
+        return torch.cat([feature.to(self.device, dtype) for feature in features])
+
+    def detect_prompts(self, images, image_paths=None):
+        """One encoder pass per image, one decode per prompt; each image gets the merged detections of all prompts."""
+        import supervision as sv
+
+        from feature_cache import generate_from_features
+
+        features = self.encode_features(images, image_paths)
+        per_image = [[] for _ in images]
+        for text in self.prompts:
+            input_ids = self.cache.prompt_inputs(text)["input_ids"].repeat(len(images), 1).to(self.device)
+            outputs = generate_from_features(self.model, features, input_ids, max_new_tokens=self.decode['max_new_tokens'],
+                                             num_beams=self.decode['num_beams'])
+            for index, text_output in enumerate(self.processor.batch_decode(outputs, skip_special_tokens=False)):
+                per_image[index].append(self.to_detections(text_output, images[index].size))
+        return [(sv.Detections.merge(detections), None, None) for detections in per_image]
+
+    def detect_batch(self, images, image_paths=None):
+        """Return one (detections, sequence_score, beam_box_counts) tuple per image."""
+        if self.prompts:
+            return self.detect_prompts(images, image_paths)
+        inputs = self.prepare(images, image_paths)
+        outputs, num_beams = self.generate(inputs)
+
+        if not self.with_scores:
+            texts = self.processor.batch_decode(outputs, skip_special_tokens=False)
+            return [(self.to_detections(text, image.size), None, None) for text, image in zip(texts, images)]
+
+        texts = self.processor.batch_decode(outputs.sequences, skip_special_tokens=False)
+        sequence_scores = outputs.sequences_scores.float().cpu().numpy()
+        results = []
+        for index, image in enumerate(images):
+            beams = [self.to_detections(text, image.size) for text in texts[index * num_beams:(index + 1) * num_beams]]
+            detections = beams[0]
+            detections.confidence = beam_agreement([beam.xyxy for beam in beams])
+            results.append((detections, float(sequence_scores[index * num_beams]), [len(beam) for beam in beams]))
+        return results
+
+    def detect(self, image, image_path=None):
+        return self.detect_batch([image], [image_path])[0]
+
+
+class StubDetector:
+    """Model-free stand-in with Detector's interface, for exercising pipelines on machines without the model.
+
+    Every image gets boxes_per_image random boxes, deterministic for a given
+    image size, after sleeping latency seconds per image.
+    """
+
+    cache = None
+
+    def __init__(self, boxes_per_image=1, latency=0.0, label="bee", seed=0):
+        self.boxes_per_image = boxes_per_image
+        self.latency = latency
+        self.label = label
+        self.seed = seed
+        self.text = "<bee>"
+        self.task = "<OD>"
+        self.decode = dict(DECODE_PRESETS['fast'])
+
+    def boxes(self, image_width, image_height):
+        rng = np.random.default_rng([self.seed, image_width, image_height])
+        sizes = rng.uniform(0.02, 0.2, size=(self.boxes_per_image, 2)) * [image_width, image_height]
+        corners = rng.uniform(0, 1, size=(self.boxes_per_image, 2)) * ([image_width, image_height] - sizes)
+        return np.hstack([corners, corners + sizes]).astype(np.float32)
+
+    def detect_batch(self, images, image_paths=None):
+        if self.latency:
+            time.sleep(self.latency * len(images))
+        results = []
+        for image in images:
+            xyxy = self.boxes(image.size[0], image.size[1])
+            results.append((make_detections(xyxy, [self.label] * len(xyxy)), None, None))
+        return results
+
+    def detect(self, image, image_path=None):
+        return self.detect_batch([image], [image_path])[0]
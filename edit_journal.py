@@ -0,0 +1,172 @@
+import json
+import os
+
+from label_io import read_labels, report_errors, write_labels
+
+JOURNAL_FILE = ".annotation_journal.jsonl"
+
+
+def to_row(class_index, box):
+    # Rounded like the label files, so a box read back from disk compares equal to the one saved
+    return [int(class_index)] + [round(float(value), 6) for value in box]
+
+
+def diff_rows(before, after):
+    """The single edit record turning before into after, or None if they are equal."""
+    if before == after:
+        return None
+    if len(after) == len(before) + 1:
+        row = next((i for i in range(len(before)) if before[i] != after[i]), len(before))
+        if before[row:] == after[row + 1:]:
+            return {'op': "add", 'row': row, 'box': after[row]}
+    if len(after) == len(before) - 1:
+        row = next((i for i in range(len(after)) if before[i] != after[i]), len(after))
+        if before[row + 1:] == after[row:]:
+            return {'op': "delete", 'row': row, 'box': before[row]}
+    if len(after) == len(before):
+        changed = [i for i in range(len(before)) if before[i] != after[i]]
+        if len(changed) == 1:
+            return {'op': "update", 'row': changed[0], 'before': before[changed[0]], 'after': after[changed[0]]}
+    return {'op': "replace", 'before': before, 'after': after}
+
+
+def invert(record):
+    if record['op'] == "add":
+        return dict(record, op="delete")
+    if record['op'] == "delete":
+        return dict(record, op="add")
+    return dict(record, before=record['after'], after=record['before'])
+
+
+def apply_record(rows, record):
+    rows = list(rows)
+    if record['op'] == "add":
+        rows.insert(record['row'], record['box'])
+    elif record['op'] == "delete":
+        del rows[record['row']]
+    elif record['op'] == "update":
+        rows[record['row']] = record['after']
+    elif record['op'] == "replace":
+        rows = list(record['after'])
+    return rows
+
+
+class EditJournal:
+    """Append-only log of label edits with per-image undo/redo.
+
+    Each edit is one small JSON line (add/delete/update a row, or replace
+    all rows) instead of a label file rewrite. The first time an image is
+    touched after a compaction its current rows are logged as a 'base'
+    record, so replaying the journal gives the same result whether or not
+    a compaction was interrupted half way. compact() writes the edited
+    images' label files and truncates the journal; it runs every
+    compact_every records, on close, and on startup to recover edits from
+    a crashed session.
+    """
+
+    def __init__(self, path, label_folder, compact_every=200, fsync=True):
+        self.path = path
+        self.label_folder = label_folder
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.state = {}  # label file name -> rows, for images edited since the last compaction
+        self.undo_stack = {}
+        self.redo_stack = {}
+        self.records = 0
+        self.file = None
+        self.recovered = self.replay()
+        if self.file is None:
+            self.file = open(path, 'a')
+
+    def replay(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can cut the last append short; everything before it is intact
+                    print(f"Warning: ignoring truncated record at the end of {self.path}")
+                    break
+                if record['op'] == "base":
+                    self.state[record['label']] = record['rows']
+                else:
+                    self.state[record['label']] = apply_record(self.state[record['label']], record)
+        recovered = len(self.state)
+        self.compact()
+        return recovered
+
+    def rows(self, label):
+        if label in self.state:
+            return list(self.state[label])
+        label_path = os.path.join(self.label_folder, label)
+        classes, boxes, errors = read_labels(label_path)
+        report_errors(errors)
+        return [to_row(class_index, box) for class_index, box in zip(classes.tolist(), boxes.tolist())]
+
+    def _append(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.records += 1
+
+    def _apply(self, label, record):
+        if label not in self.state:
+            self.state[label] = self.rows(label)
+            self._append({'op': "base", 'label': label, 'rows': self.state[label]})
+        self._append(dict(record, label=label))
+        self.state[label] = apply_record(self.state[label], record)
+
+    def record(self, label, rows):
+        """Log the edit that turns label's current rows into rows; returns False if nothing changed."""
+        record = diff_rows(self.rows(label), [to_row(row[0], row[1:]) for row in rows])
+        if record is None:
+            return False
+        self._apply(label, record)
+        self.undo_stack.setdefault(label, []).append(record)
+        self.redo_stack.pop(label, None)
+        self._maybe_compact()
+        return True
+
+    def undo(self, label):
+        """Revert the last edit of label; returns its rows afterwards, or None if there is nothing to undo."""
+        if not self.undo_stack.get(label):
+            return None
+        record = self.undo_stack[label].pop()
+        self._apply(label, invert(record))
+        self.redo_stack.setdefault(label, []).append(record)
+        self._maybe_compact()
+        return self.rows(label)
+
+    def redo(self, label):
+        if not self.redo_stack.get(label):
+            return None
+        record = self.redo_stack[label].pop()
+        self._apply(label, record)
+        self.undo_stack[label].append(record)
+        self._maybe_compact()
+        return self.rows(label)
+
+    def _maybe_compact(self):
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Write every edited image's label file, then start an empty journal."""
+        if self.state:
+            os.makedirs(self.label_folder, exist_ok=True)
+        for label, rows in self.state.items():
+            write_labels(os.path.join(self.label_folder, label), [row[0] for row in rows], [row[1:] for row in rows])
+        if self.file is not None:
+            self.file.close()
+        # Truncating only after every label file is written keeps a crash here recoverable
+        self.file = open(self.path, 'w')
+        self.state = {}
+        self.records = 0
+
+    def close(self):
+        self.compact()
+        self.file.close()
+        os.remove(self.path)
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from label_io import atomic_write_text, label_filename, write_labels
+from shard_store import ShardExporter
+
+EXPORT_FORMATS = ("yolo", "coco", "voc", "shards")
+YOLO_DIR = "labels"
+VOC_DIR = "voc"
+COCO_FILE = "annotations.json"
+
+
+def output_stem(rel_path):
+    # Every format names its output after the image stem, so image.jpg -> image.txt / image.xml
+    return os.path.splitext(rel_path)[0]
+
+
+def to_pixel_xyxy(boxes, image_width, image_height):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    half_sizes = boxes[:, 2:] / 2
+    xyxy = np.hstack([boxes[:, :2] - half_sizes, boxes[:, :2] + half_sizes])
+    return xyxy * np.array([image_width, image_height, image_width, image_height])
+
+
+class YoloExporter:
+    def __init__(self, output_folder):
+        self.label_folder = os.path.join(output_folder, YOLO_DIR)
+
+    def write(self, rel_path, image_width, image_height, classes, boxes):
+        label_dir = os.path.join(self.label_folder, os.path.dirname(rel_path))
+        os.makedirs(label_dir, exist_ok=True)
+        write_labels(os.path.join(label_dir, label_filename(rel_path)), classes, boxes)
+
+    def close(self):
+        pass
+
+
+class VocExporter:
+    def __init__(self, output_folder, registry):
+        self.xml_folder = os.path.join(output_folder, VOC_DIR)
+        self.registry = registry
+
+    def write(self, rel_path, image_width, image_height, classes, boxes):
+        xyxy = np.rint(to_pixel_xyxy(boxes, image_width, image_height)).astype(int)
+        lines = [
+            "<annotation>",
+            f"  <filename>{escape(os.path.basename(rel_path))}</filename>",
+            f"  <path>{escape(rel_path)}</path>",
+            f"  <size><width>{image_width}</width><height>{image_height}</height><depth>3</depth></size>",
+        ]
+        for class_index, (x_min, y_min, x_max, y_max) in zip(np.asarray(classes).tolist(), xyxy.tolist()):
+            lines += [
+                "  <object>",
+                f"    <name>{escape(self.registry.name_of(class_index))}</name>",
+                "    <difficult>0</difficult>",
+                f"    <bndbox><xmin>{x_min}</xmin><ymin>{y_min}</ymin><xmax>{x_max}</xmax><ymax>{y_max}</ymax></bndbox>",
+                "  </object>",
+            ]
+        lines.append("</annotation>")
+        xml_path = os.path.join(self.xml_folder, output_stem(rel_path) + ".xml")
+        os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+        atomic_write_text(xml_path, "\n".join(lines) + "\n")
+
+    def close(self):
+        pass
+
+
+class CocoExporter:
+    """Streams a single COCO JSON file without holding the dataset in memory.
+
+    Image and annotation records are appended to two temp files as they
+    arrive; close() stitches them together with the categories and renames
+    the result into place, so a partial run never leaves a truncated file.
+    """
+
+    def __init__(self, output_folder, registry):
+        self.path = os.path.join(output_folder, COCO_FILE)
+        self.registry = registry
+        os.makedirs(output_folder, exist_ok=True)
+        self.images_file = open(self.path + ".images.tmp", 'w')
+        self.annotations_file = open(self.path + ".annotations.tmp", 'w')
+        self.image_count = 0
+        self.annotation_count = 0
+
+    def write(self, rel_path, image_width, image_height, classes, boxes):
+        self.image_count += 1
+        image_id = self.image_count
+        record = {'id': image_id, 'file_name': rel_path.replace(os.sep, '/'), 'width': image_width, 'height': image_height}
+        self.images_file.write(("," if image_id > 1 else "") + json.dumps(record))
+
+        xyxy = to_pixel_xyxy(boxes, image_width, image_height)
+        for class_index, (x_min, y_min, x_max, y_max) in zip(np.asarray(classes).tolist(), xyxy.tolist()):
+            self.annotation_count += 1
+            width, height = x_max - x_min, y_max - y_min
+            record = {
+                'id': self.annotation_count,
+                'image_id': image_id,
+                'category_id': class_index,
+                'bbox': [round(x_min, 2), round(y_min, 2), round(width, 2), round(height, 2)],
+                'area': round(width * height, 2),
+                'iscrowd': 0,
+            }
+            self.annotations_file.write(("," if self.annotation_count > 1 else "") + json.dumps(record))
+
+    def close(self):
+        self.images_file.close()
+        self.annotations_file.close()
+        categories = [{'id': index, 'name': name} for name, index in self.registry.items()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            file.write('{"images": [')
+            with open(self.images_file.name, 'r') as part:
+                shutil.copyfileobj(part, file)
+            file.write('], "annotations": [')
+            with open(self.annotations_file.name, 'r') as part:
+                shutil.copyfileobj(part, file)
+            file.write('], "categories": ' + json.dumps(categories) + '}\n')
+        os.replace(tmp_path, self.path)
+        os.remove(self.images_file.name)
+        os.remove(self.annotations_file.name)
+
+
+class MultiExporter:
+    """Fans one set of detections out to every requested format."""
+
+    def __init__(self, exporters):
+        self.exporters = exporters
+
+    def write(self, rel_path, image_width, image_height, classes, boxes):
+        for exporter in self.exporters:
+            exporter.write(rel_path, image_width, image_height, classes, boxes)
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+def parse_formats(formats):
+    if isinstance(formats, str):
+        formats = [fmt.strip() for fmt in formats.split(",") if fmt.strip()]
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown output format(s): {', '.join(sorted(unknown))}; choose from {', '.join(EXPORT_FORMATS)}")
+    return list(formats)
+
+
+def build_exporter(formats, output_folder, registry):
+    exporters = []
+    for fmt in parse_formats(formats):
+        if fmt == "yolo":
+            exporters.append(YoloExporter(output_folder))
+        elif fmt == "coco":
+            exporters.append(CocoExporter(output_folder, registry))
+        elif fmt == "voc":
+            exporters.append(VocExporter(output_folder, registry))
+        elif fmt == "shards":
+            exporters.append(ShardExporter(output_folder))
+    return MultiExporter(exporters)
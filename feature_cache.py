@@ -0,0 +1,107 @@
+import os
+from collections import OrderedDict
+
+import torch
+
+
+def tensor_bytes(tensor):
+    return tensor.numel() * tensor.element_size()
+
+
+class FeatureCache:
+    """Bounded cache of Florence-2 vision encoder outputs.
+
+    Keeps image features in an in-memory LRU capped at max_bytes and, when
+    cache_dir is given, spills them to float16 files capped at disk_max_bytes
+    (oldest files are removed first).
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, cache_dir=None, disk_max_bytes=8 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    def _put_memory(self, key, features):
+        if key in self.memory:
+            self.memory_bytes -= tensor_bytes(self.memory.pop(key))
+        self.memory[key] = features
+        self.memory_bytes += tensor_bytes(features)
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= tensor_bytes(evicted)
+
+    def _put_disk(self, key, features):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = path + ".tmp"
+        torch.save(features.detach().to("cpu", torch.float16), tmp_path)
+        os.replace(tmp_path, path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".pt"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def get(self, key, device=None, dtype=None):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        if self.cache_dir and os.path.exists(self._disk_path(key)):
+            features = torch.load(self._disk_path(key), map_location=device or "cpu")
+            features = features.to(dtype=dtype or torch.float32)
+            self._put_memory(key, features)
+            self.hits += 1
+            return features
+        self.misses += 1
+        return None
+
+    def put(self, key, features):
+        self._put_memory(key, features)
+        self._put_disk(key, features)
+
+
+@torch.no_grad()
+def encode_image(model, pixel_values, key=None, cache=None):
+    # Runs the DaViT encoder and projection once; every prompt for this image reuses the result
+    if cache is not None and key is not None:
+        features = cache.get(key, pixel_values.device, pixel_values.dtype)
+        if features is not None:
+            return features
+    features = model._encode_image(pixel_values)
+    if cache is not None and key is not None:
+        cache.put(key, features)
+    return features
+
+
+@torch.no_grad()
+def generate_from_features(model, image_features, input_ids, **generate_kwargs):
+    # Same merge Florence-2's generate() does internally, minus the vision encoder call
+    inputs_embeds = model.get_input_embeddings()(input_ids)
+    batch_size = input_ids.shape[0]
+    if image_features.shape[0] != batch_size:
+        image_features = image_features.expand(batch_size, -1, -1)
+    inputs_embeds, _ = model._merge_input_ids_with_image_features(image_features, inputs_embeds)
+    return model.generate(input_ids=None, inputs_embeds=inputs_embeds, **generate_kwargs)
@@ -0,0 +1,77 @@
+import gc
+import multiprocessing
+import os
+
+# Set in the parent right before forking; every worker inherits it without pickling the model
+_detector = None
+_loader = None
+
+
+def freeze_for_fork(detector):
+    """Make the parent's model safe to share copy-on-write with forked workers.
+
+    Inference never writes to parameter storage, so those pages stay shared
+    as long as nothing else touches them: autograd is switched off, and
+    gc.freeze() moves every existing object into a generation the collector
+    no longer scans (a collection in a child would otherwise write to the
+    header of every object it visits).
+    """
+    model = getattr(detector, 'model', None)
+    if model is not None:
+        model.eval()
+        model.requires_grad_(False)
+    gc.collect()
+    gc.freeze()
+
+
+def _init_worker(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+    cache = _detector.cache
+    if cache is not None and cache.cache_dir:
+        # The on-disk index and shards are not safe to write from several processes
+        from preprocess_cache import PreprocessCache
+        _detector.cache = PreprocessCache(cache.processor)
+
+
+def _detect(image_paths):
+    image_paths, images = _loader(image_paths)
+    if not images:
+        return [], [], []
+    return image_paths, [image.size for image in images], _detector.detect_batch(images, image_paths)
+
+
+class ForkedDetectorPool:
+    """Worker processes forked from a parent that has already loaded the model.
+
+    Each worker decodes and runs inference on whole batches of image paths;
+    loader(paths) returns (paths it could read, images), and the worker sends
+    back (those paths, image sizes, detect_batch results). Writing labels stays
+    in the parent. Resident memory stays close to one model copy however many
+    workers run. The parent must not run inference before the fork: GNU
+    OpenMP hangs in a child forked after its thread pool has started.
+    """
+
+    def __init__(self, detector, processes, loader, threads=None):
+        global _detector, _loader
+        if str(getattr(detector, 'device', "cpu")).startswith("cuda"):
+            raise ValueError("Forked workers need a CPU model; CUDA can't be used after fork")
+        context = multiprocessing.get_context("fork")  # ValueError where fork isn't available (Windows)
+        _detector = detector
+        _loader = loader
+        freeze_for_fork(detector)
+        threads = threads or max(1, (os.cpu_count() or 1) // processes)
+        self.pool = context.Pool(processes, _init_worker, (threads,))
+
+    def imap(self, path_batches):
+        """Results for each batch of paths, in order, while later batches are still being worked on."""
+        return self.pool.imap(_detect, path_batches)
+
+    def close(self, wait=True):
+        if wait:
+            self.pool.close()
+        else:
+            self.pool.terminate()
+        self.pool.join()
+        gc.unfreeze()
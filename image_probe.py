@@ -0,0 +1,90 @@
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but don't
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def _probe_png(file):
+    header = file.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def _probe_jpeg(file):
+    if file.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = file.read(1)
+        while byte and byte != b'\xff':
+            byte = file.read(1)
+        while byte == b'\xff':
+            byte = file.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            frame = file.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>HH', frame[1:5])
+            return width, height
+        if marker == 0xD9 or marker == 0xDA:
+            return None
+        file.seek(length - 2, 1)
+
+
+def probe_size(image_path):
+    """Return (width, height) from the file header without decoding pixels.
+
+    Sizes are the stored dimensions (EXIF orientation is not applied), which is
+    what PIL's Image.size reports and what the auto annotator normalizes against.
+    """
+    try:
+        with open(image_path, 'rb') as file:
+            signature = file.read(8)
+            file.seek(0)
+            if signature.startswith(PNG_SIGNATURE):
+                size = _probe_png(file)
+            elif signature.startswith(b'\xff\xd8'):
+                size = _probe_jpeg(file)
+            else:
+                size = None
+    except OSError as e:
+        print(f"Error: Unable to read image header from {image_path}: {e}")
+        return None
+
+    if size is not None:
+        return size
+    # Other formats (webp, tif, ...): PIL only parses the header until pixels are requested
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except OSError as e:
+        print(f"Error: Unable to read image from {image_path}: {e}")
+        return None
+
+
+def load_thumbnail(image_path, max_size):
+    """Load an RGB image no larger than max_size, using JPEG draft mode when possible.
+
+    Draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale, so only a
+    fraction of the pixels of a large photo are ever decoded.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        img.draft('RGB', (max_size, max_size))
+        img = img.convert('RGB')
+        img.thumbnail((max_size, max_size))
+        return img
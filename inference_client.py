@@ -0,0 +1,165 @@
+import base64
+import http.client
+import io
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+from detector import make_detections
+
+SERVER_ENV = "ANNOTATION_SERVER"
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+class ServerError(Exception):
+    pass
+
+
+class RequestTooLarge(ServerError):
+    def __init__(self, message, max_images):
+        super().__init__(message)
+        self.max_images = max_images
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class InferenceClient:
+    """Detector stand-in that sends images to a running inference_server.py.
+
+    url is http://host:port or unix:///path/to.sock. Connections are kept
+    alive and pooled, so concurrent callers (decode threads, the GUI's
+    assist worker) don't pay for a handshake per image. Images the server
+    can read itself are sent as paths; the rest are sent as encoded bytes.
+    """
+
+    cache = None
+
+    def __init__(self, url, text="<bee>", task="<OD>", pool_size=4, retries=3, timeout=300, send_paths=None):
+        self.url = url
+        parsed = urlparse(url)
+        self.socket_path = parsed.path if parsed.scheme == "unix" else None
+        self.host = parsed.hostname
+        self.port = parsed.port
+        if send_paths is None:
+            send_paths = self.socket_path is not None or self.host in LOCAL_HOSTS
+        self.send_paths = send_paths
+        self.text = text
+        self.task = task
+        self.retries = retries
+        self.timeout = timeout
+        self.connections = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.max_images = None  # learned from the server's first 413
+
+    def _connect(self):
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(self, method, path, body=None, headers=None):
+        """Send one request over a pooled connection, retrying dropped connections and 503s with backoff."""
+        delay = 0.5
+        for attempt in range(self.retries + 1):
+            with self.slots:
+                try:
+                    connection = self.connections.get_nowait()
+                except queue.Empty:
+                    connection = self._connect()
+                try:
+                    connection.request(method, path, body=body, headers=headers or {})
+                    response = connection.getresponse()
+                    payload = response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    connection.close()
+                    if attempt == self.retries:
+                        raise ServerError(f"Inference server {self.url} unreachable: {e}")
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                self.connections.put(connection)
+            if response.status == 503 and attempt < self.retries:
+                time.sleep(float(response.getheader("Retry-After", delay)))
+                delay *= 2
+                continue
+            data = json.loads(payload) if payload else {}
+            if response.status == 413 and data.get('max_images'):
+                raise RequestTooLarge(f"Inference server accepts at most {data['max_images']} images per request",
+                                      data['max_images'])
+            if response.status != 200:
+                raise ServerError(f"Inference server returned {response.status}: {data.get('error', '')}")
+            return data
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def metrics(self):
+        return self._request("GET", "/metrics")
+
+    def encode(self, image, image_path=None):
+        if image_path and self.send_paths and os.path.exists(image_path):
+            return {'path': os.path.abspath(image_path)}
+        if image_path and os.path.exists(image_path):
+            # The original file is usually much smaller than a re-encode of the decoded pixels
+            with open(image_path, 'rb') as file:
+                data = file.read()
+        else:
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+            data = buffer.getvalue()
+        return {'data': base64.b64encode(data).decode("ascii")}
+
+    def detect_batch(self, images, image_paths=None):
+        """Return one (detections, sequence_score, beam_box_counts) tuple per image, like Detector.
+
+        Batches larger than the server accepts in one request are split.
+        """
+        image_paths = image_paths or [None] * len(images)
+        size = self.max_images or len(images)
+        if len(images) > size:
+            results = []
+            for start in range(0, len(images), size):
+                results += self.detect_batch(images[start:start + size], image_paths[start:start + size])
+            return results
+        try:
+            return self._detect(images, image_paths)
+        except RequestTooLarge as e:
+            if self.max_images == e.max_images:
+                raise
+            self.max_images = e.max_images
+            return self.detect_batch(images, image_paths)
+
+    def _detect(self, images, image_paths):
+        request = {
+            'images': [self.encode(image, path) for image, path in zip(images, image_paths)],
+            'text': self.text,
+            'task': self.task,
+        }
+        data = self._request("POST", "/detect", json.dumps(request).encode("utf-8"), {'Content-Type': "application/json"})
+        return [(make_detections(result['xyxy'], result['class_name'], result['confidence']),
+                 result['sequence_score'], result['beam_box_counts']) for result in data['results']]
+
+    def detect(self, image, image_path=None):
+        return self.detect_batch([image], [image_path])[0]
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+def client_from_env(text="<bee>", task="<OD>"):
+    """An InferenceClient for $ANNOTATION_SERVER, or None when no server is configured."""
+    url = os.environ.get(SERVER_ENV)
+    return InferenceClient(url, text, task) if url else None
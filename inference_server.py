@@ -0,0 +1,285 @@
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class BatchQueue:
+    """Collects images from concurrent requests into batches for one model.
+
+    A single inference thread owns the detector. Jobs waiting longer than
+    max_wait for company are run anyway, and submit() refuses work beyond
+    max_queue images so callers get backpressure instead of unbounded latency.
+    A single request larger than max_queue could never fit and is refused
+    with RequestTooLarge instead.
+    """
+
+    def __init__(self, detector, max_batch=4, max_wait=0.01, max_queue=64):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.jobs = deque()
+        self.condition = threading.Condition()
+        self.started = time.time()
+        self.latencies = deque(maxlen=1000)
+        self.counts = {'requests': 0, 'images': 0, 'batches': 0, 'rejected': 0, 'errors': 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, images, image_paths, text, task):
+        if len(images) > self.max_queue:
+            with self.condition:
+                self.counts['rejected'] += 1
+            raise RequestTooLarge()
+        futures = [Future() for _ in images]
+        with self.condition:
+            if len(self.jobs) + len(images) > self.max_queue:
+                self.counts['rejected'] += 1
+                raise QueueFull()
+            self.counts['requests'] += 1
+            for image, image_path, future in zip(images, image_paths, futures):
+                self.jobs.append((image, image_path, text, task, future, time.perf_counter()))
+            self.condition.notify()
+        return futures
+
+    def _next_batch(self):
+        with self.condition:
+            while not self.jobs:
+                self.condition.wait()
+            deadline = time.perf_counter() + self.max_wait
+            while len(self.jobs) < self.max_batch and time.perf_counter() < deadline:
+                self.condition.wait(deadline - time.perf_counter())
+            # Only jobs with the same prompt can share a forward pass
+            prompt = self.jobs[0][2:4]
+            batch = []
+            rest = deque()
+            for job in self.jobs:
+                # Partitioned rather than deque.remove(), which would compare the queued PIL images
+                if len(batch) < self.max_batch and job[2:4] == prompt:
+                    batch.append(job)
+                else:
+                    rest.append(job)
+            self.jobs = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            images = [job[0] for job in batch]
+            self.detector.text, self.detector.task = batch[0][2:4]
+            try:
+                results = self.detector.detect_batch(images, [job[1] for job in batch])
+            except Exception as e:  # reported to every caller in the batch; the server keeps running
+                with self.condition:
+                    self.counts['errors'] += 1
+                for job in batch:
+                    job[4].set_exception(e)
+                continue
+            now = time.perf_counter()
+            with self.condition:
+                self.counts['batches'] += 1
+                self.counts['images'] += len(batch)
+                self.latencies.extend(now - job[5] for job in batch)
+            for job, result in zip(batch, results):
+                job[4].set_result(result)
+
+    def metrics(self):
+        with self.condition:
+            latencies = sorted(self.latencies)
+            metrics = dict(self.counts, queue_depth=len(self.jobs), max_queue=self.max_queue,
+                           uptime_seconds=round(time.time() - self.started, 1))
+        metrics['mean_batch_size'] = round(metrics['images'] / metrics['batches'], 2) if metrics['batches'] else 0.0
+        for name, quantile in (('latency_p50', 0.5), ('latency_p95', 0.95)):
+            metrics[name] = round(latencies[int(quantile * (len(latencies) - 1))], 4) if latencies else None
+        return metrics
+
+
+def detections_to_json(detections, image_size, sequence_score=None, beam_box_counts=None):
+    confidence = getattr(detections, 'confidence', None)
+    return {
+        'width': image_size[0],
+        'height': image_size[1],
+        'xyxy': [[round(float(v), 2) for v in box] for box in detections.xyxy],
+        'class_name': [str(name) for name in detections.data.get('class_name', [])],
+        'confidence': None if confidence is None else [round(float(v), 4) for v in confidence],
+        'sequence_score': sequence_score,
+        'beam_box_counts': beam_box_counts,
+    }
+
+
+def load_request_image(item):
+    from PIL import Image
+
+    if 'path' in item:
+        with Image.open(item['path']) as img:
+            return img.convert("RGB"), item['path']
+    with Image.open(io.BytesIO(base64.b64decode(item['data']))) as img:
+        return img.convert("RGB"), None
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients reuse connections
+    server_version = "AutoAnnotationInference/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self.send_json(200, {'status': "ok", 'queue_depth': self.server.batch_queue.metrics()['queue_depth']})
+        elif path == "/metrics":
+            self.send_json(200, self.server.batch_queue.metrics())
+        else:
+            self.send_json(404, {'error': f"Unknown endpoint {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/detect":
+            self.send_json(404, {'error': f"Unknown endpoint {url.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                request = json.loads(body)
+                items = request['images']
+            else:
+                # A single raw image body; the prompt comes from the query string
+                request = {key: values[0] for key, values in parse_qs(url.query).items()}
+                items = [{'data': base64.b64encode(body).decode("ascii")}]
+            loaded = [load_request_image(item) for item in items]
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self.send_json(400, {'error': f"Bad request: {e}"})
+            return
+
+        text = request.get('text', self.server.text)
+        task = request.get('task', self.server.task)
+        try:
+            futures = self.server.batch_queue.submit([image for image, _ in loaded], [path for _, path in loaded], text, task)
+        except RequestTooLarge:
+            max_images = self.server.batch_queue.max_queue
+            self.send_json(413, {'error': f"At most {max_images} images per request", 'max_images': max_images})
+            return
+        except QueueFull:
+            self.send_json(503, {'error': "Server busy, retry later"}, {'Retry-After': "1"})
+            return
+        try:
+            results = [future.result() for future in futures]
+        except Exception as e:
+            self.send_json(500, {'error': f"Inference failed: {e}"})
+            return
+        self.send_json(200, {'results': [detections_to_json(detections, image.size, score, counts)
+                                         for (image, _), (detections, score, counts) in zip(loaded, results)]})
+
+
+class UnixInferenceServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("unix", 0)
+
+
+def make_server(detector, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, max_batch=4, max_wait=0.01,
+                max_queue=64, verbose=False):
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixInferenceServer(unix_socket, InferenceHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), InferenceHandler)
+        server.daemon_threads = True
+    server.batch_queue = BatchQueue(detector, max_batch, max_wait, max_queue)
+    server.text = detector.text
+    server.task = detector.task
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    from annotate_cli import DEFAULT_CONFIG, build_detector, load_config
+    from detector import DECODE_PRESETS
+
+    parser = argparse.ArgumentParser(description="Serve Florence-2 detections over HTTP so every tool on the host shares one warm model.")
+    parser.add_argument("--config", help="annotate_cli config for the model settings (checkpoint, device, backend, ...)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", dest="unix_socket", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--checkpoint")
+    parser.add_argument("--device")
+    parser.add_argument("--decode-preset", dest="decode_preset", choices=sorted(DECODE_PRESETS))
+    parser.add_argument("--with-scores", dest="with_scores", action="store_true", help="Keep beam scores for review queues")
+    parser.add_argument("--max-batch", dest="max_batch", type=int, default=4)
+    parser.add_argument("--max-wait-ms", dest="max_wait_ms", type=float, default=10.0)
+    parser.add_argument("--max-queue", dest="max_queue", type=int, default=64, help="Images queued before requests get 503; also the most one request may send")
+    parser.add_argument("--stub", action="store_true", help="Serve random boxes without loading a model")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG)
+    try:
+        if args.config:
+            config.update(load_config(args.config))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+    for key in ('checkpoint', 'device', 'decode_preset'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    config['server'] = None  # this process is the server
+
+    if args.stub:
+        from detector import StubDetector
+        detector = StubDetector()
+    else:
+        detector = build_detector(config, config['prompt'], config['task'], args.with_scores)
+
+    server = make_server(detector, args.host, args.port, args.unix_socket, args.max_batch, args.max_wait_ms / 1000,
+                         args.max_queue, args.verbose)
+    print(f"Serving detections on {args.unix_socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
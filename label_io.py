@@ -0,0 +1,149 @@
+import math
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+LabelError = namedtuple("LabelError", ["path", "line_number", "line", "reason"])
+
+# Rows of a YOLO label file: class index plus normalized (x_center, y_center, width, height)
+EMPTY_CLASSES = np.zeros(0, dtype=np.int32)
+EMPTY_BOXES = np.zeros((0, 4), dtype=np.float32)
+ROW = re.compile(r"^[ \t]*\S+(?:[ \t]+\S+){4}[ \t\r]*$", re.MULTILINE)
+
+
+def label_filename(image_file, suffix=""):
+    return os.path.splitext(os.path.basename(image_file))[0] + suffix + ".txt"
+
+
+def label_path_for(image_file, label_folder, suffix=""):
+    return os.path.join(label_folder, label_filename(image_file, suffix))
+
+
+def parse_labels(text, path=None):
+    """Parse YOLO label text into (classes, boxes, errors).
+
+    Well-formed text (every non-blank line five numbers) is converted from one
+    split of the whole text in a single NumPy call; only when that fails are
+    lines checked one by one so bad rows can be reported with line numbers.
+    """
+    tokens = text.split()
+    if not tokens:
+        return EMPTY_CLASSES, EMPTY_BOXES, []
+
+    # Every token must sit on a five-field row, or a 4- and a 6-field line would pair up
+    if len(tokens) == 5 * len(ROW.findall(text)):
+        try:
+            values = np.array(tokens, dtype=np.float64).reshape(-1, 5)
+        except ValueError:
+            values = None
+        if values is not None and np.all(np.isfinite(values)) and np.all(values[:, 0] == np.floor(values[:, 0])):
+            return values[:, 0].astype(np.int32), values[:, 1:].astype(np.float32), []
+
+    lines = text.splitlines()
+    rows = [line.split() for line in lines]
+    classes = []
+    boxes = []
+    errors = []
+    for line_number, (line, row) in enumerate(zip(lines, rows), start=1):
+        if not row:
+            continue
+        if len(row) != 5:
+            errors.append(LabelError(path, line_number, line, f"expected 5 fields, got {len(row)}"))
+            continue
+        try:
+            values = [float(x) for x in row]
+        except ValueError:
+            errors.append(LabelError(path, line_number, line, "non-numeric field"))
+            continue
+        if not all(math.isfinite(x) for x in values):
+            errors.append(LabelError(path, line_number, line, "non-finite value"))
+            continue
+        if values[0] != int(values[0]):
+            errors.append(LabelError(path, line_number, line, "class index is not an integer"))
+            continue
+        classes.append(int(values[0]))
+        boxes.append(values[1:])
+
+    if not classes:
+        return EMPTY_CLASSES, EMPTY_BOXES, errors
+    return np.array(classes, dtype=np.int32), np.array(boxes, dtype=np.float32), errors
+
+
+def read_labels(label_path):
+    if not os.path.exists(label_path):
+        return EMPTY_CLASSES, EMPTY_BOXES, []
+    with open(label_path, 'r') as file:
+        text = file.read()
+    return parse_labels(text, label_path)
+
+
+def read_label_batch(label_paths):
+    """Read many label files with a single parse.
+
+    Returns (file_ids, classes, boxes, errors) where file_ids[i] is the index
+    into label_paths of the file row i came from. Missing files contribute no rows.
+    """
+    texts = []
+    for label_path in label_paths:
+        text = ""
+        if os.path.exists(label_path):
+            with open(label_path, 'r') as file:
+                text = file.read()
+        if text and not text.endswith("\n"):
+            text += "\n"
+        texts.append(text)
+
+    classes, boxes, errors = parse_labels("".join(texts))
+    if not errors:
+        row_counts = [sum(1 for line in text.splitlines() if line.strip()) for text in texts]
+        file_ids = np.repeat(np.arange(len(label_paths), dtype=np.int32), row_counts)
+        return file_ids, classes, boxes, []
+
+    # Something is malformed: fall back to per-file parsing so errors point at the right file and line
+    file_ids = []
+    all_classes = []
+    all_boxes = []
+    errors = []
+    for file_id, (label_path, text) in enumerate(zip(label_paths, texts)):
+        file_classes, file_boxes, file_errors = parse_labels(text, label_path)
+        file_ids.append(np.full(len(file_classes), file_id, dtype=np.int32))
+        all_classes.append(file_classes)
+        all_boxes.append(file_boxes)
+        errors.extend(file_errors)
+    return np.concatenate(file_ids), np.concatenate(all_classes), np.concatenate(all_boxes), errors
+
+
+def clip_boxes(boxes):
+    """Clip normalized YOLO boxes to the image; boxes entirely outside end up with zero size."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    xyxy = np.clip(np.hstack([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2]), 0.0, 1.0)
+    return np.hstack([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]]).astype(np.float32)
+
+
+def format_labels(classes, boxes):
+    if len(classes) == 0:
+        return ""
+    rows = np.column_stack([np.asarray(classes, dtype=np.float64), np.asarray(boxes, dtype=np.float64)])
+    lines = ["%d %.6f %.6f %.6f %.6f" % tuple(row) for row in rows]
+    return "\n".join(lines) + "\n"
+
+
+def atomic_write_text(path, text):
+    # Readers never see a half-written file: write a sibling temp file, then rename over the target
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_labels(label_path, classes, boxes):
+    atomic_write_text(label_path, format_labels(classes, boxes))
+
+
+def report_errors(errors, limit=20):
+    for error in errors[:limit]:
+        print(f"Warning: {error.path or '<labels>'}:{error.line_number}: {error.reason}: {error.line.strip()!r}")
+    if len(errors) > limit:
+        print(f"Warning: {len(errors) - limit} more malformed label lines not shown")
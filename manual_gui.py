@@ -1,16 +1,31 @@
 import tkinter as tk
 from tkinter import simpledialog, filedialog, messagebox
 from tkinter import ttk
+import tkinter.font as tkfont
 from PIL import Image, ImageTk
 import cv2
 import os
 import shutil
-import random
 import tkinter.colorchooser as colorchooser
 import tkinter.simpledialog as simpledialog
+from assist import PROPOSAL_DIR, AssistWorker
+from class_registry import ClassRegistry
+from dataset_scan import list_images
+from dedup import DUPLICATES_FILE, load_groups, same_aspect
+from edit_journal import JOURNAL_FILE, EditJournal
+from exporters import YOLO_DIR
+from prefetch import Prefetcher
+from review_queue import REVIEW_QUEUE_FILE, REVIEW_THRESHOLD, ReviewQueue
+from thumbnail_cache import THUMBNAIL_SIZE, ThumbnailGenerator
+from video_annotate import VIDEO_EXTENSIONS, VideoReader, frame_name
+from label_io import clip_boxes, label_filename, label_path_for, read_label_batch, report_errors, write_labels
+import numpy as np
+
+MIN_BOX_PIXELS = 3  # shorter drags are treated as clicks, not boxes
 
 class AnnotationTool:
-    def __init__(self, root, dataset_path):
+    def __init__(self, root, dataset_path, review_queue_path=None, review_threshold=REVIEW_THRESHOLD, prefetch_window=4, duplicates_path=None,
+                 assist=False, assist_window=4):
         self.root = root
         self.root.title("Image Annotation Tool")
 
@@ -20,11 +35,21 @@ class AnnotationTool:
         self.null_folder = os.path.join(dataset_path, "null")
         os.makedirs(self.null_folder, exist_ok=True)
 
-        self.image_files = [f for f in os.listdir(self.image_folder) if f.endswith(('jpg', 'jpeg', 'png'))]
+        self.image_files = list_images(self.image_folder, relative=True, cache=True)
+        self.video_frames = {}  # frame name -> (VideoReader, frame index)
+        self.image_files += self.list_video_frames()
+        self.duplicates = {}
+        if duplicates_path and os.path.exists(duplicates_path):
+            self.image_files = self.hide_duplicates(duplicates_path)
+        if review_queue_path and os.path.exists(review_queue_path):
+            flagged = self.order_by_review_queue(review_queue_path, review_threshold)
+            if flagged:
+                self.image_files = flagged
+            else:
+                messagebox.showinfo("Review Queue", f"No image has an uncertainty of {review_threshold:g} or more; showing all images.")
         self.current_image_index = 0
         self.annotations = []
-        self.classes = {}
-        self.class_colors = {}
+        self.classes = ClassRegistry.load(dataset_path)
         self.current_class = None
 
         self.zoom_factor = 1.0  # Initial zoom level
@@ -32,12 +57,32 @@ class AnnotationTool:
         self.zoom_min = 0.5     # Minimum zoom factor
         self.zoom_max = 3.0     # Maximum zoom factor
 
-        self.prompt_for_classes()
+        if not len(self.classes):
+            self.prompt_for_classes()
+
+        # Edits are appended to a journal and compacted into the label files periodically and on exit
+        self.journal = EditJournal(os.path.join(dataset_path, JOURNAL_FILE), self.label_folder)
+        if self.journal.recovered:
+            messagebox.showinfo("Recovered", f"Restored unsaved edits for {self.journal.recovered} images from the last session.")
 
         self.canvas_width = 1200
         self.canvas_height = 900
         self.canvas = tk.Canvas(root, cursor="cross", width=self.canvas_width, height=self.canvas_height)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.prefetcher = Prefetcher(self.read_canvas_image, window=prefetch_window)
+
+        # Model proposals for the current image, drawn dashed until accepted ("a") or rejected ("r")
+        self.proposals = []
+        self.proposals_shown_for = None
+        self.assist_window = assist_window
+        self.assist = None
+        self.assist_error_shown = False
+        if assist:
+            self.assist = AssistWorker(self.classes, os.path.join(dataset_path, PROPOSAL_DIR, YOLO_DIR), image_loader=self.read_assist_image)
+            self.root.after(200, self.poll_proposals)
+
+        self.label_font = tkfont.Font(family="Arial", size=12, weight="bold")
+        self.classes.set_text_measure(lambda name: (self.label_font.measure(name), self.label_font.metrics("linespace")))
 
         self.class_list_frame = tk.Frame(root)
         self.class_list_frame.pack(side=tk.RIGHT, fill=tk.Y)
@@ -82,12 +127,22 @@ class AnnotationTool:
         self.mark_as_null_button = tk.Button(self.control_frame, text="Mark as Null", command=self.mark_as_null)
         self.mark_as_null_button.pack(side=tk.LEFT, padx=10, pady=10)
 
+        self.triage_button = tk.Button(self.control_frame, text="Triage Grid", command=self.open_triage)
+        self.triage_button.pack(side=tk.LEFT, padx=10, pady=10)
+
         # Bind zoom actions
         self.root.bind("<Control-MouseWheel>", self.on_mouse_wheel)
 
         self.root.bind("<Control-n>", lambda event: self.add_new_class())
         self.root.bind("<Delete>", lambda event: self.delete_annotations())
         self.root.bind("n", lambda event: self.mark_as_null())
+        self.root.bind("a", lambda event: self.accept_proposals())
+        self.root.bind("r", lambda event: self.reject_proposals())
+        self.root.bind("t", lambda event: self.open_triage())
+        self.root.bind("<Control-z>", lambda event: self.undo())
+        self.root.bind("<Control-y>", lambda event: self.redo())
+        self.root.bind("<Control-Shift-Z>", lambda event: self.redo())
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.root.bind("<Left>", self.on_left_arrow)
         self.root.bind("<Right>", self.on_right_arrow)
 
@@ -97,30 +152,58 @@ class AnnotationTool:
 
 
     def show_statistics(self):
+        self.journal.compact()
         total_images = len(self.image_files)
-        total_annotated_images = 0
-        class_count = {class_name: 0 for class_name in self.classes}
-
-        for image_file in self.image_files:
-            label_filename = os.path.basename(image_file).replace('.jpg', '.txt').replace('.jpeg', '.txt').replace('.png', '.txt')
-            label_path = os.path.join(self.label_folder, label_filename)
-            if os.path.exists(label_path):
-                total_annotated_images += 1
-                with open(label_path, 'r') as file:
-                    lines = file.readlines()
-                    for line in lines:
-                        class_index = int(line.strip().split()[0])
-                        class_name = next((name for name, index in self.classes.items() if index == class_index), None)
-                        if class_name:
-                            class_count[class_name] += 1
+        label_paths = [label_path_for(image_file, self.label_folder) for image_file in self.image_files]
+        label_paths = [label_path for label_path in label_paths if os.path.exists(label_path)]
+        total_annotated_images = len(label_paths)
+
+        _, classes, _, errors = read_label_batch(label_paths)
+        report_errors(errors)
+        classes = classes[(classes >= 0) & (classes < len(self.classes.names))]
+        class_count = np.bincount(classes, minlength=len(self.classes.names))
 
         message = f"Total No of images: {total_images}\n"
         message += f"Total Annotated Images: {total_annotated_images}\n"
-        for class_name, count in class_count.items():
-            message += f"Total Annotated Images of {class_name}: {count}\n"
+        for class_name, class_index in self.classes.items():
+            message += f"Total Annotated Images of {class_name}: {class_count[class_index]}\n"
 
         messagebox.showinfo("Statistics", message)
 
+    def order_by_review_queue(self, review_queue_path, threshold):
+        # Images scored with an uncertainty of at least threshold, most uncertain first; unscored images are left out
+        queue = ReviewQueue.load(review_queue_path)
+        by_path = {image_file.replace(os.sep, '/'): image_file for image_file in self.image_files}
+        ordered = []
+        for entry in queue.ordered(threshold):
+            image_file = by_path.get(entry['image'].replace(os.sep, '/'))
+            if image_file is not None:
+                ordered.append(image_file)
+        return ordered
+
+    def list_video_frames(self):
+        # Each video frame appears as its own image, named like an exploded frame so labels line up
+        frames = []
+        for rel_path in list_images(self.image_folder, extensions=VIDEO_EXTENSIONS, relative=True, cache=True):
+            try:
+                reader = VideoReader(os.path.join(self.image_folder, rel_path))
+            except OSError as e:
+                print(f"Error: {e}")
+                continue
+            for index in range(reader.frame_count):
+                name = frame_name(rel_path, index)
+                self.video_frames[name] = (reader, index)
+                frames.append(name)
+        return frames
+
+    def hide_duplicates(self, duplicates_path):
+        # Members the representative's labels are copied to on save are hidden; crops and letterboxed copies stay
+        hidden = set()
+        for group in load_groups(duplicates_path):
+            self.duplicates[os.path.basename(group[0]['image'])] = group
+            hidden.update(os.path.basename(member['image']) for member in group[1:] if same_aspect(group[0], member))
+        return [image_file for image_file in self.image_files if os.path.basename(image_file) not in hidden]
+
     def on_left_arrow(self, event):
         self.prev_image()
 
@@ -134,8 +217,11 @@ class AnnotationTool:
                 break
             class_index = simpledialog.askinteger("Class Index", f"Enter index for class '{class_name}':")
             if class_index is not None:
-                self.classes[class_name] = class_index
-                self.class_colors[class_index] = self.random_color()
+                try:
+                    self.classes.add(class_name, class_index)
+                except ValueError as e:
+                    messagebox.showerror("Class Index", str(e))
+        self.classes.save(self.dataset_path)
 
     def populate_class_listbox(self):
         self.class_listbox.delete(0, tk.END)
@@ -158,17 +244,19 @@ class AnnotationTool:
         self.image_path = os.path.join(self.image_folder, self.image_files[self.current_image_index])
         print(f"Trying to load image from: {self.image_path}")
 
-        if not os.path.exists(self.image_path):
+        if self.image_files[self.current_image_index] not in self.video_frames and not os.path.exists(self.image_path):
             messagebox.showerror("Error", f"File does not exist: {self.image_path}")
             return
 
-        img = cv2.imread(self.image_path)
-        if img is None:
+        self.image = self.prefetcher.get(self.image_path)
+        if self.image is None:
             messagebox.showerror("Error", f"Failed to read image: {self.image_path}")
             return
+        self.prefetch_next()
+        if self.assist is not None:
+            upcoming = self.image_files[self.current_image_index:self.current_image_index + 1 + self.assist_window]
+            self.assist.request([os.path.join(self.image_folder, image_file) for image_file in upcoming])
 
-        self.image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        self.image = cv2.resize(self.image, (self.canvas_width, self.canvas_height))
         self.tk_image = ImageTk.PhotoImage(Image.fromarray(self.image))
 
         self.canvas.delete("all")
@@ -176,52 +264,121 @@ class AnnotationTool:
 
         self.load_annotations()
 
+    def read_canvas_image(self, image_path):
+        # Runs on prefetch threads, so it must not touch any Tk objects
+        img = self.read_frame(image_path)
+        if img is None:
+            return None
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return cv2.resize(img, (self.canvas_width, self.canvas_height))
+
+    def read_frame(self, image_path):
+        frame = self.video_frames.get(os.path.relpath(image_path, self.image_folder))
+        if frame is None:
+            return cv2.imread(image_path)
+        reader, index = frame
+        return reader.read(index)
+
+    def read_assist_image(self, image_path):
+        # Runs on the assist thread: decodes at full resolution, not the canvas size
+        img = self.read_frame(image_path)
+        if img is None:
+            raise OSError(f"Unable to read image from {image_path}")
+        return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+
+    def poll_proposals(self):
+        # Tk after() callback: picks up finished background inference without ever waiting on it
+        if self.assist.error is not None and not self.assist_error_shown:
+            # Reported once: after a model failure the worker only keeps serving cached proposals, if any
+            self.assist_error_shown = True
+            messagebox.showerror("Model Assist", f"Model assist failed: {self.assist.error}\nAnnotation continues without model proposals.")
+        image_path = getattr(self, 'image_path', None)
+        if image_path and self.proposals_shown_for != image_path and not self.annotations:
+            result = self.assist.result(image_path)
+            if result is not None:
+                classes, boxes = result
+                self.proposals = [{'class_index': class_index, 'center_x': center_x, 'center_y': center_y, 'width': width, 'height': height}
+                                  for class_index, (center_x, center_y, width, height) in zip(classes.tolist(), boxes.tolist())]
+                self.proposals_shown_for = image_path
+                self.draw_annotations()
+        self.root.after(200, self.poll_proposals)
+
+    def accept_proposals(self):
+        self.annotations.extend(self.proposals)
+        self.proposals = []
+        self.ensure_classes_initialized()
+        self.save_annotations()
+        self.draw_annotations()
+
+    def reject_proposals(self):
+        self.proposals = []
+        self.draw_annotations()
+
+    def prefetch_next(self):
+        start = self.current_image_index + 1
+        upcoming = self.image_files[start:start + self.prefetcher.window]
+        self.prefetcher.prefetch(os.path.join(self.image_folder, image_file) for image_file in upcoming)
+
     def load_annotations(self):
         if self.current_image_index >= len(self.image_files):
             messagebox.showinfo("Info", "No more images to annotate.")
             return
 
-        self.image_path = os.path.join(self.image_folder, self.image_files[self.current_image_index])
-        self.image = cv2.cvtColor(cv2.imread(self.image_path), cv2.COLOR_BGR2RGB)
-
-        self.image = cv2.resize(self.image, (self.canvas_width, self.canvas_height))
-        self.tk_image = ImageTk.PhotoImage(Image.fromarray(self.image))
+        # The image was already decoded and drawn by load_image; only the labels are read here
+        self.proposals = []
+        self.set_annotations(self.journal.rows(label_filename(self.image_path)))
 
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_image)
-
-        label_filename = os.path.basename(self.image_path).replace('.jpg', '.txt').replace('.jpeg', '.txt').replace('.png', '.txt')
-        label_path = os.path.join(self.label_folder, label_filename)
+    def set_annotations(self, rows):
         self.annotations = []
-        if os.path.exists(label_path):
-            with open(label_path, 'r') as file:
-                lines = file.readlines()
-                for line in lines:
-                    class_index, center_x, center_y, width, height = map(float, line.strip().split())
-                    bbox = {
-                        'class_index': int(class_index),
-                        'center_x': center_x,
-                        'center_y': center_y,
-                        'width': width,
-                        'height': height
-                    }
-                    self.annotations.append(bbox)
-            self.ensure_classes_initialized()
-            self.draw_annotations()
+        for class_index, center_x, center_y, width, height in rows:
+            bbox = {
+                'class_index': class_index,
+                'center_x': center_x,
+                'center_y': center_y,
+                'width': width,
+                'height': height
+            }
+            self.annotations.append(bbox)
+        self.ensure_classes_initialized()
+        self.draw_annotations()
 
     def save_annotations(self):
-        label_filename = os.path.basename(self.image_path).replace('.jpg', '.txt').replace('.jpeg', '.txt').replace('.png', '.txt')
-        label_path = os.path.join(self.label_folder, label_filename)
-
-        with open(label_path, 'w') as file:
-            for bbox in self.annotations:
-                class_index = bbox['class_index']
-                center_x = bbox['center_x']
-                center_y = bbox['center_y']
-                width = bbox['width']
-                height = bbox['height']
-                line = f"{class_index} {center_x} {center_y} {width} {height}\n"
-                file.write(line)
+        classes = [bbox['class_index'] for bbox in self.annotations]
+        boxes = clip_boxes([(bbox['center_x'], bbox['center_y'], bbox['width'], bbox['height']) for bbox in self.annotations])
+        rows = [[class_index] + box for class_index, box in zip(classes, boxes.tolist())]
+        if not self.journal.record(label_filename(self.image_path), rows):
+            return
+        self.copy_to_duplicates(rows)
+
+    def copy_to_duplicates(self, rows):
+        # Hidden same-aspect duplicates always carry the representative's current labels
+        group = self.duplicates.get(os.path.basename(self.image_path), [])
+        members = [member for member in group[1:] if same_aspect(group[0], member)]
+        if not members:
+            return
+        classes = [row[0] for row in rows]
+        boxes = [row[1:] for row in rows]
+        for member in members:
+            write_labels(label_path_for(member['image'], self.label_folder), classes, boxes)
+
+    def undo(self):
+        rows = self.journal.undo(label_filename(self.image_path))
+        if rows is not None:
+            self.set_annotations(rows)
+            self.copy_to_duplicates(rows)
+
+    def redo(self):
+        rows = self.journal.redo(label_filename(self.image_path))
+        if rows is not None:
+            self.set_annotations(rows)
+            self.copy_to_duplicates(rows)
+
+    def on_close(self):
+        self.journal.close()
+        self.prefetcher.close()
+        if self.assist is not None:
+            self.assist.close()
+        self.root.destroy()
 
     def add_new_class(self):
         class_name = simpledialog.askstring("Input", "Enter new class name:")
@@ -232,20 +389,18 @@ class AnnotationTool:
 
     def update_classes(self):
         if self.current_class and self.current_class not in self.classes:
-            class_index = len(self.classes)
-            self.classes[self.current_class] = class_index
-            self.class_colors[class_index] = self.random_color()
+            self.classes.add(self.current_class)
+            self.classes.save(self.dataset_path)
 
     def ensure_classes_initialized(self):
         for bbox in self.annotations:
             class_index = bbox['class_index']
-            if class_index not in self.class_colors:
-                class_name = f"class_{class_index}"
-                self.classes[class_name] = class_index
-                self.class_colors[class_index] = self.random_color()
-
-    def random_color(self):
-        return "#{:06x}".format(random.randint(0, 0xFFFFFF))
+            if self.classes.name_of(class_index, None) is None:
+                try:
+                    self.classes.add(f"class_{class_index}", class_index)
+                except ValueError as e:
+                    # Drawn as "Unknown" until the box is given a valid class
+                    print(f"Warning: {e}")
 
     def on_click(self, event):
         self.start_x = event.x
@@ -279,29 +434,37 @@ class AnnotationTool:
 
     def on_release(self, event):
         self.canvas.config(cursor="cross")
-        if not self.selected_handle and not self.selected_edge:
-            end_x, end_y = (event.x, event.y)
-            width = abs(end_x - self.start_x)
-            height = abs(end_y - self.start_y)
-            center_x = (self.start_x + end_x) / 2 / self.canvas_width
-            center_y = (self.start_y + end_y) / 2 / self.canvas_height
-
-            if self.current_class is None:
-                self.add_new_class()
-
-            if self.current_class:
-                self.update_classes()
-                class_index = self.classes[self.current_class]
-                bbox = {
-                    'class_index': class_index,
-                    'center_x': center_x,
-                    'center_y': center_y,
-                    'width': width / self.canvas_width,
-                    'height': height / self.canvas_height
-                }
-                self.annotations.append(bbox)
-                self.save_annotations()
-                self.draw_annotations()
+        if self.selected_handle or self.selected_edge:
+            self.save_annotations()
+        else:
+            # Boxes dragged past the canvas edge are clipped to the image
+            start_x, end_x = (min(max(x, 0), self.canvas_width) for x in (self.start_x, event.x))
+            start_y, end_y = (min(max(y, 0), self.canvas_height) for y in (self.start_y, event.y))
+            width = abs(end_x - start_x)
+            height = abs(end_y - start_y)
+            center_x = (start_x + end_x) / 2 / self.canvas_width
+            center_y = (start_y + end_y) / 2 / self.canvas_height
+
+            if width < MIN_BOX_PIXELS or height < MIN_BOX_PIXELS:
+                if self.rect:
+                    self.canvas.delete(self.rect)
+            else:
+                if self.current_class is None:
+                    self.add_new_class()
+
+                if self.current_class:
+                    self.update_classes()
+                    class_index = self.classes.index_of(self.current_class)
+                    bbox = {
+                        'class_index': class_index,
+                        'center_x': center_x,
+                        'center_y': center_y,
+                        'width': width / self.canvas_width,
+                        'height': height / self.canvas_height
+                    }
+                    self.annotations.append(bbox)
+                    self.save_annotations()
+                    self.draw_annotations()
         self.rect = None
         self.selected_bbox = None
         self.selected_handle = None
@@ -368,7 +531,7 @@ class AnnotationTool:
         bbox['width'] = width
         bbox['height'] = height
 
-        self.save_annotations()
+        # Saved once on release, so a whole drag is a single journal record and a single undo step
         self.draw_annotations()
 
     def find_bbox(self, x, y):
@@ -426,10 +589,24 @@ class AnnotationTool:
             top = (cy - h/2) * self.canvas_height
             bottom = (cy + h/2) * self.canvas_height
             class_index = bbox['class_index']
-            class_name = next((k for k, v in self.classes.items() if v == class_index), "Unknown")
-            color = self.class_colors.get(class_index, "#000000")
+            class_name = self.classes.name_of(class_index)
+            color = self.classes.color_of(class_index)
             self.canvas.create_rectangle(left, top, right, bottom, outline=color, width=2)
-            self.canvas.create_text(left, top, anchor=tk.SW, text=class_name, fill=color, font=("Arial", 12, "bold"))
+            text_size = self.classes.text_size_of(class_index)
+            if text_size is None:
+                self.canvas.create_text(left, top, anchor=tk.SW, text=class_name, fill=color, font=self.label_font)
+                continue
+            # Sizes are measured once per class, so the label background costs no font lookups per redraw
+            text_width, text_height = text_size
+            label_bottom = max(top, text_height)
+            self.canvas.create_rectangle(left, label_bottom - text_height, left + text_width, label_bottom, fill=color, outline=color)
+            self.canvas.create_text(left, label_bottom, anchor=tk.SW, text=class_name, fill="white", font=self.label_font)
+        for bbox in self.proposals:
+            cx, cy, w, h = bbox['center_x'], bbox['center_y'], bbox['width'], bbox['height']
+            color = self.classes.color_of(bbox['class_index'])
+            self.canvas.create_rectangle((cx - w/2) * self.canvas_width, (cy - h/2) * self.canvas_height,
+                                         (cx + w/2) * self.canvas_width, (cy + h/2) * self.canvas_height,
+                                         outline=color, width=2, dash=(6, 4))
 
     def on_motion(self, event):
         x, y = event.x, event.y
@@ -507,7 +684,7 @@ class AnnotationTool:
             dialog.destroy()
 
     def change_class(self, bbox, dialog):
-        class_names = list(self.classes.keys())
+        class_names = self.classes.class_names()
 
         change_class_dialog = tk.Toplevel(self.root)
         change_class_dialog.title("Change Class")
@@ -529,9 +706,9 @@ class AnnotationTool:
             if new_class_name:
                 if new_class_name not in self.classes:
                     self.add_class(new_class_name)
-                bbox['class_index'] = self.classes[new_class_name]
+                bbox['class_index'] = self.classes.index_of(new_class_name)
             else:
-                bbox['class_index'] = self.classes[selected_class_name]
+                bbox['class_index'] = self.classes.index_of(selected_class_name)
 
             self.save_annotations()
             self.draw_annotations()
@@ -544,14 +721,42 @@ class AnnotationTool:
 
     def add_class(self, class_name):
         if class_name not in self.classes:
-            class_index = len(self.classes)
-            self.classes[class_name] = class_index
-            self.class_colors[class_index] = self.random_color()
+            self.classes.add(class_name)
+            self.classes.save(self.dataset_path)
             self.populate_class_listbox()
 
     def mark_as_null(self):
-        shutil.move(self.image_path, os.path.join(self.null_folder, os.path.basename(self.image_path)))
-        self.next_image()
+        if self.current_image_index < len(self.image_files):
+            self.move_to_null([self.image_files[self.current_image_index]])
+
+    def move_to_null(self, image_files):
+        """Move images to the null folder in one batch and drop them from the navigation order."""
+        moved = set()
+        for image_file in image_files:
+            image_path = os.path.join(self.image_folder, image_file)
+            null_path = os.path.join(self.null_folder, os.path.basename(image_file))
+            try:
+                if image_file in self.video_frames:
+                    # Video frames have no file to move; the decoded frame is saved as a null image instead
+                    cv2.imwrite(null_path, self.read_frame(image_path))
+                else:
+                    shutil.move(image_path, null_path)
+            except (OSError, cv2.error) as e:
+                print(f"Error: Unable to move {image_path} to the null folder: {e}")
+                continue
+            moved.add(image_file)
+
+        current = self.image_files[self.current_image_index] if self.current_image_index < len(self.image_files) else None
+        # Stay on the same image, or on the first remaining one after it if it was moved
+        self.current_image_index = sum(1 for image_file in self.image_files[:self.current_image_index] if image_file not in moved)
+        self.image_files = [image_file for image_file in self.image_files if image_file not in moved]
+        if current in moved:
+            self.current_image_index = min(self.current_image_index, max(len(self.image_files) - 1, 0))
+            self.load_image()
+        return moved
+
+    def open_triage(self):
+        TriageWindow(self)
 
     def prev_image(self):
         if self.current_image_index > 0:
@@ -565,9 +770,148 @@ class AnnotationTool:
             self.current_image_index += 1
             self.load_image()
 
+class TriageWindow:
+    """Paginated thumbnail grid for sorting out empty images in bulk.
+
+    Click thumbnails to select them, then "Move Selected to Null" moves them
+    all at once. Thumbnails are generated on a process pool and picked up by
+    polling, so paging never waits for images to decode.
+    """
+
+    def __init__(self, tool, columns=8, rows=5, size=THUMBNAIL_SIZE):
+        self.tool = tool
+        self.columns = columns
+        self.rows = rows
+        self.size = size
+        self.cell = size + 8
+        self.page_size = columns * rows
+        self.selected = set()
+        self.tk_images = {}
+        self.futures = []
+        self.generator = ThumbnailGenerator(size)
+
+        self.window = tk.Toplevel(tool.root)
+        self.window.title("Triage")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.canvas = tk.Canvas(self.window, width=columns * self.cell, height=rows * self.cell, bg="gray20")
+        self.canvas.pack(side=tk.TOP)
+        self.canvas.bind("<Button-1>", self.on_click)
+
+        controls = tk.Frame(self.window)
+        controls.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Button(controls, text="<< Page", command=lambda: self.show_page(self.page - 1)).pack(side=tk.LEFT, padx=10, pady=10)
+        tk.Button(controls, text="Page >>", command=lambda: self.show_page(self.page + 1)).pack(side=tk.LEFT, padx=10, pady=10)
+        tk.Button(controls, text="Move Selected to Null", command=self.apply).pack(side=tk.LEFT, padx=10, pady=10)
+        self.status = tk.Label(controls)
+        self.status.pack(side=tk.LEFT, padx=10)
+        self.window.bind("<Prior>", lambda event: self.show_page(self.page - 1))
+        self.window.bind("<Next>", lambda event: self.show_page(self.page + 1))
+        self.window.bind("<Return>", lambda event: self.apply())
+
+        self.closed = False
+        current = tool.image_files[tool.current_image_index] if tool.current_image_index < len(tool.image_files) else None
+        files = self.files()
+        self.show_page(files.index(current) // self.page_size if current in files else 0)
+        self.window.after(100, self.poll)
+
+    def files(self):
+        # Video frames are left to the main view; there is no file to thumbnail
+        return [image_file for image_file in self.tool.image_files if image_file not in self.tool.video_frames]
+
+    def page_files(self, page):
+        return self.files()[page * self.page_size:(page + 1) * self.page_size]
+
+    def show_page(self, page):
+        pages = max(1, -(-len(self.files()) // self.page_size))
+        self.page = min(max(page, 0), pages - 1)
+        files = self.page_files(self.page)
+        for future in self.futures:
+            future.cancel()
+        self.futures = self.generator.submit(os.path.join(self.tool.image_folder, image_file) for image_file in files)
+        # Warm the cache for the next page while this one is on screen
+        self.generator.submit(os.path.join(self.tool.image_folder, image_file) for image_file in self.page_files(self.page + 1))
+        self.tk_images = {}
+        self.canvas.delete("all")
+        for position, image_file in enumerate(files):
+            x, y = self.cell_origin(position)
+            self.canvas.create_text(x + self.cell // 2, y + self.cell // 2, text=os.path.basename(image_file), fill="gray70", width=self.size)
+            self.draw_selection(position, image_file)
+        self.update_status()
+
+    def update_status(self):
+        pages = max(1, -(-len(self.files()) // self.page_size))
+        self.status.config(text=f"Page {self.page + 1}/{pages}, {len(self.selected)} selected")
+
+    def cell_origin(self, position):
+        return (position % self.columns) * self.cell, (position // self.columns) * self.cell
+
+    def draw_selection(self, position, image_file):
+        x, y = self.cell_origin(position)
+        self.canvas.delete(f"selection_{position}")
+        if image_file in self.selected:
+            self.canvas.create_rectangle(x + 2, y + 2, x + self.cell - 2, y + self.cell - 2, outline="red", width=4, tags=f"selection_{position}")
+
+    def poll(self):
+        if self.closed:
+            return
+        for position, future in enumerate(self.futures):
+            if position in self.tk_images or not future.done() or future.cancelled():
+                continue
+            self.tk_images[position] = None
+            try:
+                thumb_path = future.result()
+                if thumb_path is not None:
+                    with Image.open(thumb_path) as img:
+                        self.tk_images[position] = ImageTk.PhotoImage(img)
+            except Exception as e:  # e.g. BrokenProcessPool; one bad cell must not stop polling the others
+                print(f"Error: Unable to make a thumbnail: {e}")
+            x, y = self.cell_origin(position)
+            if self.tk_images[position] is None:
+                self.canvas.create_text(x + self.cell // 2, y + self.cell // 2 + 16, text="unreadable", fill="red")
+                continue
+            self.canvas.create_image(x + self.cell // 2, y + self.cell // 2, image=self.tk_images[position])
+            self.canvas.tag_raise(f"selection_{position}")
+        self.window.after(100, self.poll)
+
+    def on_click(self, event):
+        column, row = event.x // self.cell, event.y // self.cell
+        position = row * self.columns + column
+        files = self.page_files(self.page)
+        if column >= self.columns or position >= len(files):
+            return
+        self.selected ^= {files[position]}
+        self.draw_selection(position, files[position])
+        self.update_status()
+
+    def apply(self):
+        moved = self.tool.move_to_null(sorted(self.selected))
+        self.selected -= moved
+        self.show_page(self.page)
+
+    def close(self):
+        self.closed = True
+        self.generator.close()
+        self.window.destroy()
+
 if __name__ == "__main__":
     root = tk.Tk()
     dataset_path = filedialog.askdirectory(title="Select Dataset Directory")
     if dataset_path:
-        app= AnnotationTool(root, dataset_path)
+        review_queue_path = os.path.join(dataset_path, REVIEW_QUEUE_FILE)
+        review_threshold = REVIEW_THRESHOLD
+        if os.path.exists(review_queue_path) and messagebox.askyesno(
+                "Review Queue", "Open only the images the auto annotator was unsure about, most uncertain first?\n"
+                                "Images it did not score are left out."):
+            threshold = simpledialog.askfloat("Review Queue", "Minimum uncertainty (0-1):", initialvalue=REVIEW_THRESHOLD,
+                                              minvalue=0.0, maxvalue=1.0)
+            if threshold is not None:
+                review_threshold = threshold
+        else:
+            review_queue_path = None
+        duplicates_path = os.path.join(dataset_path, DUPLICATES_FILE)
+        if not (os.path.exists(duplicates_path) and messagebox.askyesno("Duplicates", "Hide near-duplicate images and copy labels to them on save?")):
+            duplicates_path = None
+        assist = messagebox.askyesno("Model Assist", "Pre-annotate upcoming images with Florence-2 in the background?")
+        app= AnnotationTool(root, dataset_path, review_queue_path, review_threshold,
+                            duplicates_path=duplicates_path, assist=assist)
         root.mainloop()
\ No newline at end of file
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+ENCODER_FILES = ("vision_encoder.onnx", "embed_tokens.onnx", "encoder.onnx")
+DECODER_FILE = "decoder.onnx"
+DECODER_WITH_PAST_FILE = "decoder_with_past.onnx"
+GENERATION_FILE = "generation.json"
+KV_NAMES = ("self_key", "self_value", "cross_key", "cross_value")
+
+
+def past_names(prefix, num_layers):
+    return [f"{prefix}_{layer}_{name}" for layer in range(num_layers) for name in KV_NAMES]
+
+
+def export_onnx(model, processor, output_dir, opset=17):
+    """Trace Florence-2 into ONNX graphs that OnnxBackend can run without transformers.
+
+    The vision encoder, token embedding and language encoder run once per
+    image; the decoder is exported twice, for the first step and for later
+    steps that reuse the self- and cross-attention KV cache.
+    """
+    import torch
+    from PIL import Image
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = model.eval().to("cpu", torch.float32)
+    language_model = model.language_model
+    decoder = language_model.get_decoder()
+    num_layers = language_model.config.decoder_layers
+
+    class VisionEncoder(torch.nn.Module):
+        def forward(self, pixel_values):
+            return model._encode_image(pixel_values)
+
+    class EmbedTokens(torch.nn.Module):
+        def forward(self, input_ids):
+            return model.get_input_embeddings()(input_ids)
+
+    class TextEncoder(torch.nn.Module):
+        def forward(self, inputs_embeds, attention_mask):
+            return language_model.get_encoder()(inputs_embeds=inputs_embeds, attention_mask=attention_mask).last_hidden_state
+
+    class Decoder(torch.nn.Module):
+        def forward(self, input_ids, encoder_hidden_states, encoder_attention_mask, *past_flat):
+            past = None
+            if past_flat:
+                past = tuple(tuple(past_flat[layer * 4:(layer + 1) * 4]) for layer in range(num_layers))
+            outputs = decoder(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                past_key_values=past,
+                use_cache=True,
+            )
+            logits = language_model.lm_head(outputs.last_hidden_state)
+            if hasattr(language_model, "final_logits_bias"):
+                logits = logits + language_model.final_logits_bias
+            present = [tensor for layer in outputs.past_key_values for tensor in layer]
+            return (logits, *present)
+
+    image = Image.new("RGB", (768, 768))
+    inputs = processor(text="<OD>", images=image, return_tensors="pt")
+    pixel_values = inputs["pixel_values"]
+    input_ids = inputs["input_ids"]
+
+    with torch.no_grad():
+        torch.onnx.export(VisionEncoder(), (pixel_values,), os.path.join(output_dir, "vision_encoder.onnx"),
+                          input_names=["pixel_values"], output_names=["image_features"],
+                          dynamic_axes={"pixel_values": {0: "batch"}, "image_features": {0: "batch"}},
+                          opset_version=opset)
+        torch.onnx.export(EmbedTokens(), (input_ids,), os.path.join(output_dir, "embed_tokens.onnx"),
+                          input_names=["input_ids"], output_names=["inputs_embeds"],
+                          dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "inputs_embeds": {0: "batch", 1: "sequence"}},
+                          opset_version=opset)
+
+        image_features = model._encode_image(pixel_values)
+        inputs_embeds = torch.cat([image_features, model.get_input_embeddings()(input_ids)], dim=1)
+        attention_mask = torch.ones(inputs_embeds.shape[:2], dtype=torch.long)
+        torch.onnx.export(TextEncoder(), (inputs_embeds, attention_mask), os.path.join(output_dir, "encoder.onnx"),
+                          input_names=["inputs_embeds", "attention_mask"], output_names=["encoder_hidden_states"],
+                          dynamic_axes={"inputs_embeds": {0: "batch", 1: "sequence"},
+                                        "attention_mask": {0: "batch", 1: "sequence"},
+                                        "encoder_hidden_states": {0: "batch", 1: "sequence"}},
+                          opset_version=opset)
+
+        encoder_hidden_states = TextEncoder()(inputs_embeds, attention_mask)
+        start_ids = torch.full((1, 1), language_model.config.decoder_start_token_id, dtype=torch.long)
+        present_names = past_names("present", num_layers)
+        kv_axes = {0: "batch", 2: "past_sequence"}
+        common_axes = {"input_ids": {0: "batch", 1: "decoder_sequence"},
+                       "encoder_hidden_states": {0: "batch", 1: "sequence"},
+                       "encoder_attention_mask": {0: "batch", 1: "sequence"},
+                       "logits": {0: "batch", 1: "decoder_sequence"}}
+        first_axes = dict(common_axes, **{name: kv_axes for name in present_names})
+        torch.onnx.export(Decoder(), (start_ids, encoder_hidden_states, attention_mask), os.path.join(output_dir, DECODER_FILE),
+                          input_names=["input_ids", "encoder_hidden_states", "encoder_attention_mask"],
+                          output_names=["logits"] + present_names, dynamic_axes=first_axes, opset_version=opset)
+
+        first = Decoder()(start_ids, encoder_hidden_states, attention_mask)
+        input_past_names = past_names("past", num_layers)
+        with_past_axes = dict(first_axes, **{name: kv_axes for name in input_past_names})
+        torch.onnx.export(Decoder(), (start_ids, encoder_hidden_states, attention_mask, *first[1:]),
+                          os.path.join(output_dir, DECODER_WITH_PAST_FILE),
+                          input_names=["input_ids", "encoder_hidden_states", "encoder_attention_mask"] + input_past_names,
+                          output_names=["logits"] + present_names, dynamic_axes=with_past_axes, opset_version=opset)
+
+    config = language_model.config
+    generation_config = getattr(language_model, "generation_config", config)
+    with open(os.path.join(output_dir, GENERATION_FILE), 'w') as file:
+        json.dump({
+            "num_layers": num_layers,
+            "decoder_start_token_id": config.decoder_start_token_id,
+            "eos_token_id": config.eos_token_id,
+            "pad_token_id": config.pad_token_id,
+            "forced_bos_token_id": getattr(generation_config, "forced_bos_token_id", None),
+            "forced_eos_token_id": getattr(generation_config, "forced_eos_token_id", None),
+            "no_repeat_ngram_size": getattr(generation_config, "no_repeat_ngram_size", 0) or 0,
+        }, file, indent=1)
+    print(f"Exported ONNX graphs to {output_dir}")
+
+
+def banned_ngram_tokens(tokens, ngram_size):
+    # Tokens that would repeat an n-gram already present in this sequence
+    if ngram_size <= 0 or len(tokens) < ngram_size:
+        return []
+    prefix = tuple(tokens[len(tokens) - ngram_size + 1:])
+    banned = []
+    for start in range(len(tokens) - ngram_size + 1):
+        if tuple(tokens[start:start + ngram_size - 1]) == prefix:
+            banned.append(tokens[start + ngram_size - 1])
+    return banned
+
+
+class OnnxBackend:
+    """Runs exported Florence-2 graphs with ONNX Runtime on CPU.
+
+    Exposes the same generate(input_ids=..., pixel_values=..., max_new_tokens=...)
+    call as the PyTorch model so it can be passed to generate_detections as a
+    backend. Decoding is greedy with a KV cache; num_beams > 1 is not supported,
+    and parity is checked against the PyTorch model with num_beams=1.
+    """
+
+    def __init__(self, model_dir, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+
+        def session(name):
+            return ort.InferenceSession(os.path.join(model_dir, name), options, providers=providers)
+
+        self.vision_encoder, self.embed_tokens, self.encoder = (session(name) for name in ENCODER_FILES)
+        self.decoder = session(DECODER_FILE)
+        self.decoder_with_past = session(DECODER_WITH_PAST_FILE)
+        with open(os.path.join(model_dir, GENERATION_FILE), 'r') as file:
+            self.config = json.load(file)
+        self.past_names = past_names("past", self.config["num_layers"])
+
+    def encode(self, input_ids, pixel_values):
+        image_features = self.vision_encoder.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+        text_embeds = self.embed_tokens.run(None, {"input_ids": input_ids.astype(np.int64)})[0]
+        inputs_embeds = np.concatenate([image_features, text_embeds], axis=1)
+        attention_mask = np.ones(inputs_embeds.shape[:2], dtype=np.int64)
+        encoder_hidden_states = self.encoder.run(None, {"inputs_embeds": inputs_embeds, "attention_mask": attention_mask})[0]
+        return encoder_hidden_states, attention_mask
+
+    def next_tokens(self, logits, sequences, step, max_new_tokens):
+        config = self.config
+        logits = logits.copy()
+        if step == 1 and config["forced_bos_token_id"] is not None:
+            logits[:] = -np.inf
+            logits[:, config["forced_bos_token_id"]] = 0
+        elif step == max_new_tokens and config["forced_eos_token_id"] is not None:
+            logits[:] = -np.inf
+            logits[:, config["forced_eos_token_id"]] = 0
+        for row, tokens in enumerate(sequences):
+            banned = banned_ngram_tokens(tokens, config["no_repeat_ngram_size"])
+            if banned:
+                logits[row, banned] = -np.inf
+        return logits.argmax(axis=-1)
+
+    def generate(self, input_ids, pixel_values, max_new_tokens=1024, num_beams=1, **kwargs):
+        if num_beams != 1:
+            print(f"Warning: OnnxBackend decodes greedily, ignoring num_beams={num_beams}")
+        input_ids = np.asarray(input_ids.cpu() if hasattr(input_ids, "cpu") else input_ids)
+        pixel_values = np.asarray(pixel_values.float().cpu() if hasattr(pixel_values, "cpu") else pixel_values)
+        encoder_hidden_states, attention_mask = self.encode(input_ids, pixel_values)
+
+        config = self.config
+        batch_size = input_ids.shape[0]
+        sequences = [[config["decoder_start_token_id"]] for _ in range(batch_size)]
+        finished = np.zeros(batch_size, dtype=bool)
+        feed = {
+            "input_ids": np.array(sequences, dtype=np.int64),
+            "encoder_hidden_states": encoder_hidden_states,
+            "encoder_attention_mask": attention_mask,
+        }
+        outputs = self.decoder.run(None, feed)
+
+        for step in range(1, max_new_tokens + 1):
+            tokens = self.next_tokens(outputs[0][:, -1, :], sequences, step, max_new_tokens)
+            tokens = np.where(finished, config["pad_token_id"], tokens)
+            for row, token in enumerate(tokens.tolist()):
+                sequences[row].append(token)
+            finished |= tokens == config["eos_token_id"]
+            if finished.all():
+                break
+
+            feed["input_ids"] = tokens.reshape(-1, 1).astype(np.int64)
+            for index, name in enumerate(self.past_names):
+                feed[name] = outputs[1 + index]
+            # Cross-attention keys/values come from the encoder and never change, so keep the first step's
+            present = self.decoder_with_past.run(None, feed)
+            for index, name in enumerate(self.past_names):
+                if name.endswith(("cross_key", "cross_value")):
+                    present[1 + index] = outputs[1 + index]
+            outputs = present
+
+        return np.array(sequences, dtype=np.int64)
+
+
+def check_parity(model, processor, backend, images, text="<OD>", max_new_tokens=256):
+    """Compare greedy decodes of the PyTorch model and an ONNX backend; returns the mismatching images."""
+    import torch
+    from PIL import Image
+
+    mismatches = []
+    for image_path in images:
+        with Image.open(image_path) as img:
+            inputs = processor(text=text, images=img.convert("RGB"), return_tensors="pt")
+        with torch.no_grad():
+            expected = model.generate(input_ids=inputs["input_ids"], pixel_values=inputs["pixel_values"],
+                                      max_new_tokens=max_new_tokens, num_beams=1, do_sample=False)
+        actual = backend.generate(input_ids=inputs["input_ids"], pixel_values=inputs["pixel_values"],
+                                  max_new_tokens=max_new_tokens)
+        expected_text = processor.batch_decode(expected, skip_special_tokens=False)[0]
+        actual_text = processor.batch_decode(actual, skip_special_tokens=False)[0]
+        if expected_text != actual_text:
+            print(f"Mismatch on {image_path}:\n  torch: {expected_text}\n  onnx:  {actual_text}")
+            mismatches.append(image_path)
+    print(f"Parity: {len(images) - len(mismatches)}/{len(images)} images match")
+    return mismatches
+
+
+def load_torch_model(checkpoint):
+    from transformers import AutoModelForCausalLM, AutoProcessor
+
+    model = AutoModelForCausalLM.from_pretrained(checkpoint, trust_remote_code=True).eval()
+    processor = AutoProcessor.from_pretrained(checkpoint, trust_remote_code=True)
+    return model, processor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Florence-2 to ONNX and check it against PyTorch.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the encoder and KV-cache decoder graphs")
+    export_parser.add_argument("--checkpoint", default="microsoft/Florence-2-large-ft")
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--opset", type=int, default=17)
+
+    parity_parser = subparsers.add_parser("parity", help="Compare ONNX Runtime output with the PyTorch model")
+    parity_parser.add_argument("--checkpoint", default="microsoft/Florence-2-large-ft")
+    parity_parser.add_argument("--model-dir", required=True)
+    parity_parser.add_argument("--prompt", default="<OD>")
+    parity_parser.add_argument("--max-new-tokens", type=int, default=256)
+    parity_parser.add_argument("images", nargs="+")
+
+    args = parser.parse_args(argv)
+    model, processor = load_torch_model(args.checkpoint)
+    if args.command == "export":
+        export_onnx(model, processor, args.output, args.opset)
+        return 0
+    mismatches = check_parity(model, processor, OnnxBackend(args.model_dir), args.images, args.prompt, args.max_new_tokens)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
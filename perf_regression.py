@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from class_registry import ClassRegistry
+from label_io import atomic_write_text, format_labels, read_labels
+from visualize import measure_cv2_text
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_baseline.json")
+TIME_TOLERANCE = 0.25    # relative slowdown allowed before a run fails
+MEMORY_TOLERANCE = 0.10
+MIN_TIME_DELTA = 0.02    # ms; differences below this are timer noise
+MIN_MEMORY_DELTA = 16    # KiB
+DENSITIES = {'sparse': 2, 'medium': 50, 'dense': 500}
+SIZES = {'small': (320, 240), 'large': (1920, 1080), 'huge': (8000, 6000)}
+CANVAS_SIZE = (1200, 900)
+CLASS_NAMES = ["bee", "drone", "queen", "wasp", "varroa"]
+
+
+def synthetic_boxes(count, seed=0):
+    """count random normalized cx, cy, w, h boxes with class indices, like a labelled hive image."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.uniform(0.01, 0.2, size=(count, 2))
+    centers = sizes / 2 + rng.uniform(0, 1, size=(count, 2)) * (1 - sizes)
+    classes = rng.integers(0, len(CLASS_NAMES), size=count).astype(np.int32)
+    return classes, np.hstack([centers, sizes]).astype(np.float32)
+
+
+class OffscreenCanvas:
+    """Records what the GUI draws when there is no display, so the Python side of a redraw can still be timed."""
+
+    def __init__(self):
+        self.items = 0
+
+    def delete(self, *tags):
+        self.items = 0
+
+    def _create(self, *args, **kwargs):
+        self.items += 1
+        return self.items
+
+    create_image = create_rectangle = create_text = create_line = _create
+
+    def config(self, **kwargs):
+        pass
+
+
+def make_tool(classes, boxes, registry, root=None):
+    """An AnnotationTool with only what drawing and hit-testing need: no dataset, journal or dialogs."""
+    from manual_gui import AnnotationTool
+
+    tool = AnnotationTool.__new__(AnnotationTool)
+    tool.canvas_width, tool.canvas_height = CANVAS_SIZE
+    tool.classes = registry
+    tool.proposals = []
+    tool.handle_size = 20
+    tool.annotations = [{'class_index': int(class_index), 'center_x': float(box[0]), 'center_y': float(box[1]),
+                         'width': float(box[2]), 'height': float(box[3])} for class_index, box in zip(classes, boxes)]
+    if root is None:
+        tool.canvas = OffscreenCanvas()
+        tool.label_font = None
+        tool.tk_image = None
+    else:
+        import tkinter as tk
+        import tkinter.font as tkfont
+        from PIL import Image, ImageTk
+
+        tool.canvas = tk.Canvas(root, width=tool.canvas_width, height=tool.canvas_height)
+        tool.label_font = tkfont.Font(root=root, family="Arial", size=12, weight="bold")
+        tool.tk_image = ImageTk.PhotoImage(Image.new("RGB", CANVAS_SIZE), master=root)
+    return tool
+
+
+def bench_detect(density, size, context):
+    # The stub stands in for Florence-2, so this times everything around the model: detections -> YOLO rows -> text
+    from PIL import Image
+
+    from detector import StubDetector, detections_to_yolo
+    from taxonomy import Taxonomy
+
+    detector = StubDetector(boxes_per_image=DENSITIES[density])
+    taxonomy = Taxonomy(context['registry'])
+    image = Image.new("RGB", SIZES[size])
+
+    def run():
+        detections, _, _ = detector.detect(image)
+        classes, boxes, _ = detections_to_yolo(detections, image.size[0], image.size[1], taxonomy)
+        format_labels(classes, boxes)
+    return run
+
+
+def bench_read_labels(density, size, context):
+    classes, boxes = synthetic_boxes(DENSITIES[density])
+    label_path = os.path.join(context['tmp'], f"{density}.txt")
+    atomic_write_text(label_path, format_labels(classes, boxes))
+    return lambda: read_labels(label_path)
+
+
+def bench_draw_boxes(density, size, context):
+    from visualize import draw_boxes
+
+    classes, boxes = synthetic_boxes(DENSITIES[density])
+    image = np.zeros((SIZES[size][1], SIZES[size][0], 3), dtype=np.uint8)
+    # Drawing in place over and over costs the same as drawing on a fresh copy, without timing the copy
+    return lambda: draw_boxes(image, classes, boxes, context['registry'])
+
+
+def bench_draw_annotations(density, size, context):
+    classes, boxes = synthetic_boxes(DENSITIES[density])
+    tool = make_tool(classes, boxes, context['registry'], context['root'])
+    return tool.draw_annotations
+
+
+def bench_find_bbox(density, size, context):
+    classes, boxes = synthetic_boxes(DENSITIES[density])
+    tool = make_tool(classes, boxes, context['registry'], context['root'])
+    points = [(x, y) for x in range(0, CANVAS_SIZE[0], 120) for y in range(0, CANVAS_SIZE[1], 90)]
+
+    def run():
+        for x, y in points:
+            tool.find_bbox(x, y)
+    return run
+
+
+# name -> (setup, whether the cost depends on image size)
+HOT_PATHS = {
+    'detect_to_yolo': (bench_detect, True),
+    'read_labels': (bench_read_labels, False),
+    'draw_boxes': (bench_draw_boxes, True),
+    'draw_annotations': (bench_draw_annotations, False),
+    'find_bbox': (bench_find_bbox, False),
+}
+
+
+def cases(selected=None):
+    for name, (setup, sized) in HOT_PATHS.items():
+        if selected and name not in selected:
+            continue
+        for density in DENSITIES:
+            for size in (SIZES if sized else ['-']):
+                key = f"{name}/{density}" + (f"/{size}" if sized else "")
+                yield key, setup, density, size
+
+
+def measure(run, repeat=7):
+    """Best per-call time over repeat samples, and tracemalloc peak/retained KiB for one call."""
+    run()  # warm-up: imports, caches and lazily built tables are not what is being measured
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'time_ms': round(best * 1000, 4),
+        'peak_kib': round((peak - before) / 1024, 1),
+        'retained_kib': round((current - before) / 1024, 1),
+    }
+
+
+def regressions(result, baseline, time_tolerance, memory_tolerance):
+    problems = []
+    if result['time_ms'] > baseline['time_ms'] * (1 + time_tolerance) + MIN_TIME_DELTA:
+        problems.append(f"time {baseline['time_ms']:.3f} -> {result['time_ms']:.3f} ms")
+    for metric in ('peak_kib', 'retained_kib'):
+        if result[metric] > baseline[metric] * (1 + memory_tolerance) + MIN_MEMORY_DELTA:
+            problems.append(f"{metric} {baseline[metric]:.1f} -> {result[metric]:.1f}")
+    return problems
+
+
+def open_display():
+    """A Tk root on the current display (e.g. under xvfb-run), or None to draw on an OffscreenCanvas."""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:  # tkinter missing or no display; TclError isn't importable without tkinter
+        return None
+    root.withdraw()
+    return root
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the annotation hot paths on synthetic data and compare against a baseline.")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", dest="update_baseline", action="store_true", help="Record this run as the new baseline")
+    parser.add_argument("--only", help=f"Comma-separated hot paths ({', '.join(HOT_PATHS)})")
+    parser.add_argument("--repeat", type=int, default=7, help="Timing samples per case; the fastest is kept")
+    parser.add_argument("--time-tolerance", dest="time_tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", dest="memory_tolerance", type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument("--offscreen", action="store_true", help="Use the off-screen canvas even when a display is available")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(",")] if args.only else None
+    unknown = set(selected or []) - set(HOT_PATHS)
+    if unknown:
+        print(f"Error: Unknown hot path(s): {', '.join(sorted(unknown))}")
+        return 2
+
+    baseline = None
+    if not args.update_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"Error: No baseline at {args.baseline}; run with --update-baseline first")
+            return 2
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline['host'] != socket.gethostname():
+            print(f"Warning: baseline was recorded on {baseline['host']}; timings may not be comparable")
+
+    registry = ClassRegistry(CLASS_NAMES)
+    registry.set_text_measure(measure_cv2_text)
+    root = None if args.offscreen else open_display()
+    canvas = "offscreen" if root is None else "tk"
+    if baseline and baseline['canvas'] != canvas:
+        print(f"Warning: baseline drew on a {baseline['canvas']} canvas, this run on {canvas}")
+    results = {}
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        context = {'registry': registry, 'root': root, 'tmp': tmp}
+        skipped = set()
+        for key, setup, density, size in cases(selected):
+            name = key.split("/")[0]
+            if name in skipped:
+                continue
+            try:
+                results[key] = measure(setup(density, size, context), args.repeat)
+            except ImportError as e:  # e.g. supervision, imported on first use by the stub detector
+                print(f"Warning: skipping {name}: {e}")
+                skipped.add(name)
+                continue
+            line = f"{key:38} {results[key]['time_ms']:10.3f} ms {results[key]['peak_kib']:10.1f} KiB peak {results[key]['retained_kib']:8.1f} KiB retained"
+            expected = baseline['results'].get(key) if baseline else None
+            problems = regressions(results[key], expected, args.time_tolerance, args.memory_tolerance) if expected else []
+            if problems:
+                failed.append(key)
+                line += "  REGRESSION: " + "; ".join(problems)
+            elif baseline and expected is None:
+                line += "  (no baseline)"
+            print(line)
+    if root is not None:
+        root.destroy()
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as file:
+                previous = json.load(file)['results']
+            # A partial run (--only) keeps the other hot paths' baselines
+            results = {**previous, **results}
+        data = {
+            'host': socket.gethostname(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'canvas': canvas,
+            'recorded': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'results': results,
+        }
+        atomic_write_text(args.baseline, json.dumps(data, indent=1))
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if failed:
+        print(f"{len(failed)} of {len(results)} cases regressed past the tolerance")
+        return 1
+    print(f"All {len(results)} cases within tolerance")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Loads the next few items of a navigation order on background threads.
+
+    load_fn must be thread-safe and must not touch Tk; image decoding and
+    resizing in OpenCV release the GIL, so this overlaps with the UI.
+    """
+
+    def __init__(self, load_fn, window=4, workers=2):
+        self.load_fn = load_fn
+        self.window = window
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+
+    def get(self, key):
+        future = self.futures.pop(key, None)
+        if future is not None:
+            return future.result()
+        return self.load_fn(key)
+
+    def prefetch(self, keys):
+        keys = list(keys)[:self.window]
+        for key in list(self.futures):
+            if key not in keys:
+                self.futures.pop(key).cancel()
+        for key in keys:
+            if key not in self.futures:
+                self.futures[key] = self.executor.submit(self.load_fn, key)
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.executor.shutdown(wait=False)
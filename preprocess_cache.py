@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def image_key(image, image_path=None):
+    # A file path + mtime + size is enough to identify an image on disk and far cheaper than hashing pixels
+    if image_path:
+        stat = os.stat(image_path)
+        data = f"{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}".encode("utf-8")
+    else:
+        data = image.tobytes() + repr((image.size, image.mode)).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def processor_key(processor):
+    image_processor = getattr(processor, "image_processor", processor)
+    if hasattr(image_processor, "to_json_string"):
+        config = image_processor.to_json_string()
+    else:
+        config = repr(sorted(vars(image_processor).items()))
+    return hashlib.blake2b(config.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PreprocessCache:
+    """Cache of processor outputs so repeated runs over the same images skip preprocessing.
+
+    Prompts are tokenized once per text. pixel_values are kept in an in-memory
+    LRU and, when cache_dir is given, in memory-mapped float16 shard files
+    indexed by image key and processor config, so later runs (other prompts,
+    other decode settings) read them back without resizing or normalizing.
+    """
+
+    def __init__(self, processor, cache_dir=None, memory_items=64, shard_size=256, dtype=np.float16):
+        self.processor = processor
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.shard_size = shard_size
+        self.dtype = np.dtype(dtype)
+        self.config_key = processor_key(processor)
+        self.prompts = {}
+        self.memory = OrderedDict()
+        self.index = {}  # key -> [shard, slot]
+        self.shape = None
+        self.shards = {}
+        self.hits = 0
+        self.misses = 0
+
+        if cache_dir:
+            self.cache_dir = os.path.join(cache_dir, self.config_key)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            index_path = os.path.join(self.cache_dir, "index.json")
+            if os.path.exists(index_path):
+                with open(index_path, 'r') as file:
+                    data = json.load(file)
+                if data.get('dtype') == self.dtype.name:
+                    self.index = data['entries']
+                    # Older runs that cached nothing wrote [] for "not known yet"
+                    self.shape = tuple(data['shape']) if data.get('shape') else None
+
+    def prompt_inputs(self, text):
+        if text not in self.prompts:
+            tokenizer = self.processor.tokenizer
+            # Florence-2 expands task tokens such as "<OD>" into natural-language prompts before tokenizing
+            if hasattr(self.processor, "_construct_prompts"):
+                prompt = self.processor._construct_prompts([text])
+            else:
+                prompt = [text]
+            self.prompts[text] = tokenizer(prompt, return_tensors="pt", padding=True)
+        return self.prompts[text]
+
+    def _shard(self, shard_id, create=False):
+        if shard_id not in self.shards:
+            path = os.path.join(self.cache_dir, f"shard_{shard_id:05d}.bin")
+            if not os.path.exists(path) and not create:
+                return None
+            mode = 'r+' if os.path.exists(path) else 'w+'
+            self.shards[shard_id] = np.memmap(path, dtype=self.dtype, mode=mode, shape=(self.shard_size,) + self.shape)
+        return self.shards[shard_id]
+
+    def _read_disk(self, key):
+        if not self.cache_dir or key not in self.index:
+            return None
+        shard_id, slot = self.index[key]
+        shard = self._shard(shard_id)
+        if shard is None:
+            return None
+        return torch.from_numpy(np.array(shard[slot]))
+
+    def _write_disk(self, key, pixel_values):
+        if not self.cache_dir:
+            return
+        if self.shape is None:
+            self.shape = tuple(pixel_values.shape)
+        if tuple(pixel_values.shape) != self.shape:
+            return
+        position = len(self.index)
+        shard_id, slot = divmod(position, self.shard_size)
+        self._shard(shard_id, create=True)[slot] = pixel_values.to(torch.float32).numpy().astype(self.dtype)
+        self.index[key] = [shard_id, slot]
+
+    def pixel_values(self, image, key=None):
+        key = key or image_key(image)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        pixel_values = self._read_disk(key)
+        if pixel_values is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            pixel_values = self.processor.image_processor(images=image, return_tensors="pt")["pixel_values"][0]
+            self._write_disk(key, pixel_values)
+
+        self.memory[key] = pixel_values
+        if len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+        return pixel_values
+
+    def inputs(self, image, text, device, key=None, dtype=torch.float32):
+        prompt = self.prompt_inputs(text)
+        pixel_values = self.pixel_values(image, key).unsqueeze(0).to(device=device, dtype=dtype)
+        return {
+            "input_ids": prompt["input_ids"].to(device),
+            "attention_mask": prompt["attention_mask"].to(device),
+            "pixel_values": pixel_values,
+        }
+
+    def flush(self):
+        if not self.cache_dir:
+            return
+        for shard in self.shards.values():
+            shard.flush()
+        index_path = os.path.join(self.cache_dir, "index.json")
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'dtype': self.dtype.name, 'shape': list(self.shape) if self.shape else None, 'entries': self.index}, file)
+        os.replace(tmp_path, index_path)
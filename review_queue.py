@@ -0,0 +1,83 @@
+import json
+import math
+import os
+
+import numpy as np
+
+REVIEW_QUEUE_FILE = "review_queue.json"
+REVIEW_THRESHOLD = 0.3  # images the annotator was less than 70% confident about are flagged for review
+
+
+def box_iou(boxes_a, boxes_b):
+    # Pairwise IoU of (N, 4) and (M, 4) xyxy arrays -> (N, M)
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+def beam_agreement(beam_boxes):
+    """Score each box of the best beam by how well the other beams agree with it.
+
+    beam_boxes is a list of (N_i, 4) xyxy arrays, best beam first. A box's
+    score is the mean over the other beams of its best IoU with that beam.
+    """
+    best = np.asarray(beam_boxes[0], dtype=np.float32).reshape(-1, 4)
+    others = beam_boxes[1:]
+    if not len(best) or not others:
+        return np.ones(len(best), dtype=np.float32)
+    scores = np.zeros(len(best), dtype=np.float32)
+    for boxes in others:
+        if len(boxes):
+            scores += box_iou(best, boxes).max(axis=1)
+    return scores / len(others)
+
+
+def image_uncertainty(sequence_score, box_scores, beam_box_counts=None):
+    # sequence_score is the length-normalized beam log-probability from generate()
+    confidence = math.exp(sequence_score) if sequence_score is not None else 1.0
+    if len(box_scores):
+        confidence *= float(np.min(box_scores))
+    elif beam_box_counts and any(beam_box_counts[1:]):
+        # The best beam found nothing but other beams did: a likely missed object
+        confidence *= 1.0 - sum(1 for count in beam_box_counts[1:] if count) / len(beam_box_counts[1:])
+    return 1.0 - confidence
+
+
+class ReviewQueue:
+    """Per-image uncertainty scores written by the auto annotator and read by AnnotationTool."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, image, sequence_score, box_scores, beam_box_counts=None):
+        box_scores = [float(score) for score in box_scores]
+        self.entries[image] = {
+            'image': image,
+            'uncertainty': image_uncertainty(sequence_score, box_scores, beam_box_counts),
+            'sequence_score': sequence_score,
+            'box_scores': box_scores,
+        }
+
+    def ordered(self, threshold=0.0):
+        entries = [entry for entry in self.entries.values() if entry['uncertainty'] >= threshold]
+        return sorted(entries, key=lambda entry: (-entry['uncertainty'], entry['image']))
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'images': self.ordered()}, file, indent=1)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        queue = cls()
+        with open(path, 'r') as file:
+            for entry in json.load(file).get('images', []):
+                queue.entries[entry['image']] = entry
+        return queue
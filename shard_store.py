@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+from label_io import atomic_write_text, format_labels, label_filename
+
+SHARD_DIR = "label_shards"
+SHARD_NAME = re.compile(r"^shard_(\d+)\.jsonl$")
+
+
+class ShardWriter:
+    """Packs labels for many images into a few append-only JSONL shard files.
+
+    On shared storage the per-file open/close/metadata cost of one tiny
+    label file per image dominates; here each shard is one file written
+    sequentially. A shard is written under a temp name and renamed into
+    place together with its offset index once it is complete, so readers
+    only ever see finished shards.
+    """
+
+    def __init__(self, shard_dir, max_records=10000):
+        self.shard_dir = shard_dir
+        self.max_records = max_records
+        os.makedirs(shard_dir, exist_ok=True)
+        # After the highest finished shard, not the count: with a gap the count would name an existing shard
+        ids = [int(match.group(1)) for match in map(SHARD_NAME.match, os.listdir(shard_dir)) if match]
+        self.shard_id = max(ids) + 1 if ids else 0
+        self.file = None
+        self.index = {}
+        self.offset = 0
+
+    def _shard_path(self, shard_id):
+        return os.path.join(self.shard_dir, f"shard_{shard_id:05d}.jsonl")
+
+    def _open(self):
+        self.file = open(self._shard_path(self.shard_id) + ".tmp", 'wb')
+        self.index = {}
+        self.offset = 0
+
+    def write(self, rel_path, image_width, image_height, labels_text):
+        if self.file is None:
+            self._open()
+        record = {'image': rel_path.replace(os.sep, '/'), 'width': image_width, 'height': image_height, 'labels': labels_text}
+        data = (json.dumps(record) + "\n").encode("utf-8")
+        self.file.write(data)
+        self.index[record['image']] = [self.offset, len(data)]
+        self.offset += len(data)
+        if len(self.index) >= self.max_records:
+            self._finish()
+
+    def _finish(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        shard_path = self._shard_path(self.shard_id)
+        # Index first, data last: a .jsonl without the .tmp suffix always has a complete index next to it
+        atomic_write_text(shard_path + ".idx.json", json.dumps(self.index))
+        os.replace(shard_path + ".tmp", shard_path)
+        self.file = None
+        self.shard_id += 1
+
+    def close(self):
+        self._finish()
+
+
+class ShardReader:
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.index = {}  # image -> (shard path, offset, length); later shards win
+        for name in sorted(os.listdir(shard_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+            shard_path = os.path.join(shard_dir, name)
+            with open(shard_path + ".idx.json", 'r') as file:
+                for image, (offset, length) in json.load(file).items():
+                    self.index[image] = (shard_path, offset, length)
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, rel_path):
+        shard_path, offset, length = self.index[rel_path.replace(os.sep, '/')]
+        with open(shard_path, 'rb') as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    def iter_records(self):
+        # Reads each shard sequentially once instead of seeking per image
+        by_shard = {}
+        for image, (shard_path, offset, length) in self.index.items():
+            by_shard.setdefault(shard_path, set()).add(offset)
+        for shard_path in sorted(by_shard):
+            offsets = by_shard[shard_path]
+            with open(shard_path, 'rb') as file:
+                offset = 0
+                for line in file:
+                    if offset in offsets:
+                        yield json.loads(line)
+                    offset += len(line)
+
+
+class ShardExporter:
+    """Exporter for the "shards" output format (see exporters.build_exporter)."""
+
+    def __init__(self, output_folder, max_records=10000):
+        self.writer = ShardWriter(os.path.join(output_folder, SHARD_DIR), max_records)
+
+    def write(self, rel_path, image_width, image_height, classes, boxes):
+        self.writer.write(rel_path, image_width, image_height, format_labels(classes, boxes))
+
+    def close(self):
+        self.writer.close()
+
+
+def unpack_shards(shard_dir, label_folder, images=None):
+    """Write per-image YOLO txt files from shards, for all images or only the given ones."""
+    reader = ShardReader(shard_dir)
+    if images is None:
+        records = reader.iter_records()
+    else:
+        records = (reader.read(image) for image in images)
+    count = 0
+    for record in records:
+        label_dir = os.path.join(label_folder, os.path.dirname(record['image']))
+        os.makedirs(label_dir, exist_ok=True)
+        atomic_write_text(os.path.join(label_dir, label_filename(record['image'])), record['labels'])
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unpack label shards into per-image YOLO txt files.")
+    parser.add_argument("shard_dir")
+    parser.add_argument("label_folder")
+    parser.add_argument("images", nargs="*", help="Only unpack these images (paths relative to the dataset)")
+    args = parser.parse_args(argv)
+    count = unpack_shards(args.shard_dir, args.label_folder, args.images or None)
+    print(f"Unpacked {count} label files to {args.label_folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
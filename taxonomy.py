@@ -0,0 +1,74 @@
+import json
+import os
+import re
+from collections import Counter
+
+GROUNDING_TASK = "<CAPTION_TO_PHRASE_GROUNDING>"
+
+
+def normalize_label(label):
+    label = re.sub(r"[<>_]", " ", str(label).lower())
+    return " ".join(label.split())
+
+
+class Taxonomy:
+    """Maps free-text Florence-2 labels and their synonyms to class indices.
+
+    Unknown labels are counted (and logged the first time they are seen)
+    instead of raising, so one odd model output can't stop a folder run.
+    """
+
+    def __init__(self, registry, synonyms=None):
+        self.registry = registry
+        self.lookup = {}
+        self.phrases = []
+        self.unknown = Counter()
+        for class_name in registry.class_names():
+            self.add(class_name, [])
+        for class_name, names in (synonyms or {}).items():
+            self.add(class_name, names)
+
+    def add(self, class_name, synonyms):
+        class_index = self.registry.add(class_name)
+        for name in [class_name] + list(synonyms):
+            key = normalize_label(name)
+            if key and key not in self.lookup:
+                self.lookup[key] = class_index
+        if class_name not in self.phrases:
+            self.phrases.append(class_name)
+
+    def resolve(self, label):
+        key = normalize_label(label)
+        class_index = self.lookup.get(key)
+        if class_index is None and key.endswith("s"):
+            class_index = self.lookup.get(key[:-1])
+        if class_index is None:
+            if key not in self.unknown:
+                print(f"Warning: unknown label '{label}', skipping (known: {', '.join(self.phrases)})")
+            self.unknown[key] += 1
+        return class_index
+
+    def grounding_prompt(self):
+        # One phrase-grounding prompt covering every class, so each image needs a single pass
+        return GROUNDING_TASK + ". ".join(self.phrases) + "."
+
+    def report(self):
+        if not self.unknown:
+            return
+        print("Unknown labels skipped:")
+        for label, count in self.unknown.most_common():
+            print(f"  {label}: {count}")
+
+
+def load_taxonomy(path, registry):
+    """Load {"classes": {"bee": ["honey bee", ...], ...}} from a JSON (or YAML) file."""
+    with open(path, 'r') as file:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            data = yaml.safe_load(file) or {}
+        else:
+            data = json.load(file)
+    classes = data.get('classes', data)
+    if isinstance(classes, list):
+        classes = {name: [] for name in classes}
+    return Taxonomy(registry, classes)
@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from annotate_cli import build_config, build_parser
+
+
+def config_for(*argv):
+    return build_config(build_parser().parse_args(["--input", "images", "--profile", "none", *argv]))
+
+
+def test_prompts_option_is_split_into_a_list():
+    assert config_for("--prompts", "<bee>, <wasp>")['prompts'] == ["<bee>", "<wasp>"]
+    assert config_for()['prompts'] == []
+
+
+def test_prompts_need_the_torch_backend():
+    with pytest.raises(ValueError):
+        config_for("--prompts", "<bee>,<wasp>", "--backend", "onnx")
+    with pytest.raises(ValueError):
+        config_for("--prompts", "<bee>,<wasp>", "--server", "http://127.0.0.1:8765")
+
+
+def test_dedup_only_groups_images_in_the_run(tmp_path, monkeypatch):
+    pytest.importorskip("supervision")
+    from PIL import Image
+
+    from annotate_cli import run
+    from detector import StubDetector
+
+    monkeypatch.setattr("dataset_scan.CACHE_DIR", str(tmp_path / "cache"))
+    images = tmp_path / "images"
+    os.makedirs(images / "null")
+    noise = np.random.default_rng(0).integers(0, 255, (8, 8, 3), dtype=np.uint8)
+    pattern = Image.fromarray(noise).resize((128, 128), Image.BILINEAR)
+    pattern.save(images / "null" / "big.png")
+    pattern.resize((64, 64)).save(images / "small.png")
+
+    config = config_for("--input", str(images), "--output", str(tmp_path / "out"), "--dedup")
+    config['exclude'] = ["null/*"]
+    assert run(config, StubDetector()) == 1
+
+    labels = sorted(os.listdir(tmp_path / "out" / "labels"))
+    assert labels == ["small.txt"]
+
+
+class FailingDetector:
+    """StubDetector that raises on the given call, to interrupt a run half way."""
+
+    def __init__(self, fail_on_call):
+        from detector import StubDetector
+
+        self.stub = StubDetector()
+        self.cache = None
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def detect_batch(self, images, image_paths=None):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("model crashed")
+        return self.stub.detect_batch(images, image_paths)
+
+
+def make_images(folder, names):
+    from PIL import Image
+
+    os.makedirs(folder, exist_ok=True)
+    for name in names:
+        Image.new("RGB", (32, 24)).save(os.path.join(folder, name))
+
+
+def test_unreadable_images_are_skipped(tmp_path, monkeypatch):
+    pytest.importorskip("supervision")
+    from annotate_cli import run
+
+    monkeypatch.setattr("dataset_scan.CACHE_DIR", str(tmp_path / "cache"))
+    images = tmp_path / "images"
+    make_images(images, ["a.png", "c.png"])
+    with open(images / "b.png", 'wb') as file:
+        file.write(b"not a png")
+
+    config = config_for("--input", str(images), "--output", str(tmp_path / "out"), "--batch-size", "2")
+    assert run(config, FailingDetector(fail_on_call=0)) == 2
+    assert sorted(os.listdir(tmp_path / "out" / "labels")) == ["a.txt", "c.txt"]
+
+
+def test_outputs_are_finalized_when_a_run_fails(tmp_path, monkeypatch):
+    pytest.importorskip("supervision")
+    from annotate_cli import run
+
+    monkeypatch.setattr("dataset_scan.CACHE_DIR", str(tmp_path / "cache"))
+    images = tmp_path / "images"
+    make_images(images, ["a.png", "b.png", "c.png"])
+    output = tmp_path / "out"
+
+    config = config_for("--input", str(images), "--output", str(output), "--output-format", "yolo,coco")
+    with pytest.raises(RuntimeError):
+        run(config, FailingDetector(fail_on_call=2))
+
+    with open(output / "annotations.json", 'r') as file:
+        assert len(json.load(file)['images']) == 1
+    assert os.path.exists(output / "classes.txt")
+    assert not [name for name in os.listdir(output) if name.endswith(".tmp")]
@@ -0,0 +1,22 @@
+import pytest
+
+from class_registry import ClassRegistry
+
+
+def test_add_uses_the_next_free_index_and_keeps_existing_names():
+    registry = ClassRegistry(["bee", "wasp"])
+    assert registry.add("drone") == 2
+    assert registry.add("bee") == 0
+    assert registry.add("queen", 5) == 5
+    assert registry.names == ["bee", "wasp", "drone", None, None, "queen"]
+    assert registry.add("varroa", 3) == 3
+
+
+def test_add_rejects_negative_and_taken_indices():
+    registry = ClassRegistry(["bee", "wasp"])
+    with pytest.raises(ValueError):
+        registry.add("class_-1", -1)
+    with pytest.raises(ValueError):
+        registry.add("hornet", 1)
+    assert registry.class_names() == ["bee", "wasp"]
+    assert registry.index_of("wasp") == 1
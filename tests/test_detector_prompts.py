@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("supervision")
+
+from detector import Detector
+from feature_cache import FeatureCache
+
+PROMPT_IDS = {"<bee>": 1, "<wasp>": 2}
+LABELS = {1: "bee", 2: "wasp"}
+
+
+class FakeImageProcessor:
+    def __call__(self, images, return_tensors="pt"):
+        pixels = np.asarray(images.resize((4, 4)), dtype=np.float32) / 255
+        return {"pixel_values": torch.from_numpy(pixels).permute(2, 0, 1)[None]}
+
+
+class FakeProcessor:
+    """Tokenizes a prompt to its id and decodes a generated id back to that prompt's label."""
+
+    def __init__(self):
+        self.image_processor = FakeImageProcessor()
+
+    def _construct_prompts(self, texts):
+        return texts
+
+    def tokenizer(self, prompts, return_tensors="pt", padding=True):
+        return {"input_ids": torch.tensor([[PROMPT_IDS[prompt] for prompt in prompts]])}
+
+    def batch_decode(self, outputs, skip_special_tokens=False):
+        return [f"{LABELS[int(row[0])]}:{int(row[1])}" for row in outputs]
+
+    def post_process_generation(self, text, task, image_size):
+        label, brightness = text.split(":")
+        # The box encodes which image's features the prompt was decoded from
+        return {task: {'bboxes': [[brightness, 0, int(brightness) + 10, 10]], 'labels': [label]}}
+
+
+class FakeModel:
+    dtype = torch.float32
+
+    def __init__(self):
+        self.encoded = 0
+        self.embed = torch.nn.Embedding(8, 4)
+        with torch.no_grad():
+            self.embed.weight.zero_()
+            self.embed.weight[:, 0] = torch.arange(8, dtype=torch.float32)
+
+    def _encode_image(self, pixel_values):
+        self.encoded += len(pixel_values)
+        return pixel_values.reshape(len(pixel_values), -1)[:, :8].reshape(-1, 2, 4) * 100
+
+    def get_input_embeddings(self):
+        return self.embed
+
+    def _merge_input_ids_with_image_features(self, image_features, inputs_embeds):
+        return torch.cat([image_features, inputs_embeds], dim=1), None
+
+    def generate(self, input_ids=None, inputs_embeds=None, **kwargs):
+        prompt = inputs_embeds[:, -1, 0].round().long()
+        brightness = inputs_embeds[:, 0, 0].round().long()
+        return torch.stack([prompt, brightness], dim=1)
+
+
+def make_detector(feature_cache=None):
+    model = FakeModel()
+    detector = Detector(model, FakeProcessor(), torch.device("cpu"), 'fast', prompts=["<bee>", "<wasp>"],
+                        feature_cache=feature_cache)
+    return detector, model
+
+
+def gray(value):
+    return Image.new("RGB", (64, 48), (value, value, value))
+
+
+def test_each_image_is_encoded_once_for_all_prompts():
+    detector, model = make_detector()
+    results = detector.detect_batch([gray(51), gray(102)])
+
+    assert model.encoded == 2
+    for (detections, sequence_score, beam_box_counts), brightness in zip(results, (20, 40)):
+        assert list(detections.data['class_name']) == ["bee", "wasp"]
+        assert detections.xyxy[:, 0].tolist() == [brightness, brightness]
+        assert sequence_score is None and beam_box_counts is None
+
+
+def test_feature_cache_skips_the_encoder_on_repeat_images():
+    detector, model = make_detector(FeatureCache())
+    first = detector.detect_batch([gray(51), gray(102)])
+    second = detector.detect_batch([gray(102), gray(51), gray(153)])
+
+    assert model.encoded == 3
+    assert second[0][0].xyxy.tolist() == first[1][0].xyxy.tolist()
+    assert second[1][0].xyxy.tolist() == first[0][0].xyxy.tolist()
+
+
+def test_multiple_prompts_reject_other_backends():
+    with pytest.raises(ValueError):
+        Detector(FakeModel(), FakeProcessor(), torch.device("cpu"), backend=object(), prompts=["<bee>"])
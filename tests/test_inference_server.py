@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("supervision")
+
+from detector import StubDetector
+from inference_client import InferenceClient, RequestTooLarge
+from inference_server import BatchQueue, make_server
+
+
+class RecordingDetector(StubDetector):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def detect_batch(self, images, image_paths=None):
+        self.batches.append((self.text, [image.size for image in images]))
+        return super().detect_batch(images, image_paths)
+
+
+@pytest.fixture
+def server():
+    detector = RecordingDetector()
+    server = make_server(detector, port=0, max_batch=2, max_wait=0.05, max_queue=3)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, detector
+    server.shutdown()
+    server.server_close()
+
+
+def images(count):
+    return [Image.new("RGB", (40 + index, 30)) for index in range(count)]
+
+
+def test_batches_keep_prompts_apart_and_queue_order():
+    detector = RecordingDetector()
+    queue = BatchQueue(detector, max_batch=2, max_wait=0, max_queue=8)
+    with queue.condition:
+        # Held so the inference thread sees everything queued at once
+        futures = queue.submit(images(2), [None] * 2, "<bee>", "<OD>")
+        futures += queue.submit(images(1), [None], "<wasp>", "<OD>")
+        futures += queue.submit(images(3)[2:], [None], "<bee>", "<OD>")
+    for future in futures:
+        future.result(timeout=5)
+
+    assert detector.batches == [("<bee>", [(40, 30), (41, 30)]), ("<wasp>", [(40, 30)]), ("<bee>", [(42, 30)])]
+
+
+def test_oversized_request_is_split_by_the_client(server):
+    server, detector = server
+    client = InferenceClient(f"http://127.0.0.1:{server.server_address[1]}", retries=0)
+
+    results = client.detect_batch(images(7))
+
+    assert len(results) == 7
+    assert client.max_images == 3
+    assert sorted(size for _, sizes in detector.batches for size in sizes) == [(40 + index, 30) for index in range(7)]
+    assert client.metrics()['rejected'] == 1
+    client.close()
+
+
+def test_oversized_request_gets_413(server):
+    server, _ = server
+    client = InferenceClient(f"http://127.0.0.1:{server.server_address[1]}", retries=0)
+
+    with pytest.raises(RequestTooLarge) as error:
+        client._detect(images(4), [None] * 4)
+    assert error.value.max_images == 3
+    client.close()
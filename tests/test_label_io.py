@@ -0,0 +1,41 @@
+import numpy as np
+
+from label_io import parse_labels
+
+
+def test_parse_labels_well_formed_text():
+    classes, boxes, errors = parse_labels("0 0.5 0.5 0.1 0.2\n\n  2\t0.25 0.75 0.5 0.5  \r\n")
+
+    assert errors == []
+    assert classes.dtype == np.int32 and classes.tolist() == [0, 2]
+    assert boxes.dtype == np.float32
+    assert np.allclose(boxes, [[0.5, 0.5, 0.1, 0.2], [0.25, 0.75, 0.5, 0.5]])
+
+
+def test_parse_labels_empty_text():
+    classes, boxes, errors = parse_labels("\n  \n")
+
+    assert classes.shape == (0,) and boxes.shape == (0, 4) and errors == []
+
+
+def test_parse_labels_reports_bad_lines_and_keeps_the_rest():
+    text = "\n".join([
+        "0 0.5 0.5 0.1 0.1",
+        "1 0.5 0.5 0.1",  # 4 fields ...
+        "1 0.5 0.5 0.1 0.1 0.1",  # ... and 6: the token count alone still adds up
+        "1 0.5 abc 0.1 0.1",
+        "1 0.5 nan 0.1 0.1",
+        "1.5 0.5 0.5 0.1 0.1",
+        "3 0.1 0.2 0.3 0.4",
+    ])
+    classes, boxes, errors = parse_labels(text, "a.txt")
+
+    assert classes.tolist() == [0, 3]
+    assert np.allclose(boxes[1], [0.1, 0.2, 0.3, 0.4])
+    assert [(error.path, error.line_number, error.reason) for error in errors] == [
+        ("a.txt", 2, "expected 5 fields, got 4"),
+        ("a.txt", 3, "expected 5 fields, got 6"),
+        ("a.txt", 4, "non-numeric field"),
+        ("a.txt", 5, "non-finite value"),
+        ("a.txt", 6, "class index is not an integer"),
+    ]
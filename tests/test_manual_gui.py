@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("tkinter")
+pytest.importorskip("cv2")
+
+from manual_gui import AnnotationTool
+from review_queue import REVIEW_THRESHOLD, ReviewQueue
+
+
+def make_tool(image_files):
+    # Only the state the method under test reads: no window, dataset or journal
+    tool = AnnotationTool.__new__(AnnotationTool)
+    tool.image_files = image_files
+    return tool
+
+
+def test_review_queue_matches_relative_paths_above_the_threshold(tmp_path):
+    queue = ReviewQueue()
+    queue.entries = {image: {'image': image, 'uncertainty': uncertainty} for image, uncertainty in [
+        ("site1/a.jpg", 0.9), ("site2/a.jpg", 0.1), ("b.jpg", 0.5), ("gone.jpg", 0.95)]}
+    path = str(tmp_path / "review_queue.json")
+    queue.save(path)
+
+    tool = make_tool(["b.jpg", "c.jpg", "site1/a.jpg", "site2/a.jpg"])
+
+    assert tool.order_by_review_queue(path, REVIEW_THRESHOLD) == ["site1/a.jpg", "b.jpg"]
+    assert tool.order_by_review_queue(path, 0.0) == ["site1/a.jpg", "b.jpg", "site2/a.jpg"]
+
+
+class FailedAssist:
+    error = RuntimeError("CUDA out of memory")
+
+    def result(self, image_path):
+        return None
+
+
+class FakeRoot:
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, delay, callback):
+        self.callbacks.append(callback)
+
+
+def test_assist_failure_is_reported_once(monkeypatch):
+    shown = []
+    monkeypatch.setattr("manual_gui.messagebox.showerror", lambda title, message: shown.append(message))
+    tool = make_tool([])
+    tool.root = FakeRoot()
+    tool.assist = FailedAssist()
+    tool.assist_error_shown = False
+
+    tool.poll_proposals()
+    tool.poll_proposals()
+
+    assert len(shown) == 1 and "CUDA out of memory" in shown[0]
+    assert tool.root.callbacks == [tool.poll_proposals] * 2  # polling goes on
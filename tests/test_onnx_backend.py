@@ -0,0 +1,134 @@
+import numpy as np
+
+from onnx_backend import OnnxBackend, banned_ngram_tokens, past_names
+
+VOCAB = 10
+NUM_LAYERS = 2
+CONFIG = {
+    "num_layers": NUM_LAYERS,
+    "decoder_start_token_id": 2,
+    "eos_token_id": 2,
+    "pad_token_id": 1,
+    "forced_bos_token_id": 0,
+    "forced_eos_token_id": 2,
+    "no_repeat_ngram_size": 3,
+}
+CONFIG_PAST_NAMES = past_names("past", NUM_LAYERS)
+
+
+class FakeSession:
+    """Records a copy of every feed and answers with run(feed, call index)."""
+
+    def __init__(self, run):
+        self._run = run
+        self.feeds = []
+
+    def run(self, output_names, feed):
+        self.feeds.append(dict(feed))
+        return self._run(feed, len(self.feeds) - 1)
+
+
+class ScriptedDecoder:
+    """Shared by both decoder sessions: call k's logits pick script[row][k], and every
+    present tensor is filled with 100 * k + its output index so feeds can be traced back."""
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = 0
+
+    def __call__(self, feed, _):
+        batch_size = len(feed["input_ids"])
+        logits = np.zeros((batch_size, 1, VOCAB), dtype=np.float32)
+        for row in range(batch_size):
+            tokens = self.script[row]
+            logits[row, 0, tokens[min(self.calls, len(tokens) - 1)]] = 1
+        present = [np.full((batch_size, 1, 1, 1), 100 * self.calls + index, dtype=np.float32)
+                   for index in range(len(CONFIG_PAST_NAMES))]
+        self.calls += 1
+        return [logits, *present]
+
+
+def make_backend(script=((5,),), **config):
+    backend = OnnxBackend.__new__(OnnxBackend)
+    backend.config = dict(CONFIG, **config)
+    backend.past_names = CONFIG_PAST_NAMES
+    backend.vision_encoder = FakeSession(lambda feed, _: [np.zeros((len(feed["pixel_values"]), 2, 4), dtype=np.float32)])
+    backend.embed_tokens = FakeSession(lambda feed, _: [np.zeros((*feed["input_ids"].shape, 4), dtype=np.float32)])
+    backend.encoder = FakeSession(lambda feed, _: [feed["inputs_embeds"]])
+    decoder = ScriptedDecoder(script)
+    backend.decoder = FakeSession(decoder)
+    backend.decoder_with_past = FakeSession(decoder)
+    return backend
+
+
+def generate(backend, batch_size, max_new_tokens=20):
+    input_ids = np.zeros((batch_size, 3), dtype=np.int64)
+    pixel_values = np.zeros((batch_size, 3, 4, 4), dtype=np.float32)
+    return backend.generate(input_ids, pixel_values, max_new_tokens=max_new_tokens).tolist()
+
+
+def test_banned_ngram_tokens():
+    assert banned_ngram_tokens([1, 2, 3, 1, 2], 3) == [3]
+    assert banned_ngram_tokens([1, 2, 3, 1, 2, 4, 1, 2], 3) == [3, 4]
+    assert banned_ngram_tokens([5, 5], 2) == [5]
+    assert banned_ngram_tokens([1, 2, 3, 4], 3) == []
+    assert banned_ngram_tokens([1, 2], 3) == []
+    assert banned_ngram_tokens([1, 1, 1], 0) == []
+
+
+def test_next_tokens_forces_bos_then_eos():
+    backend = make_backend()
+    logits = np.zeros((2, VOCAB), dtype=np.float32)
+    logits[:, 7] = 1
+    sequences = [[2], [2]]
+
+    assert backend.next_tokens(logits, sequences, 1, 5).tolist() == [0, 0]
+    assert backend.next_tokens(logits, sequences, 2, 5).tolist() == [7, 7]
+    assert backend.next_tokens(logits, sequences, 5, 5).tolist() == [2, 2]
+    assert logits[:, 7].tolist() == [1, 1]  # the caller's logits are left alone
+
+
+def test_next_tokens_without_forced_tokens():
+    backend = make_backend(forced_bos_token_id=None, forced_eos_token_id=None)
+    logits = np.zeros((1, VOCAB), dtype=np.float32)
+    logits[:, 7] = 1
+
+    assert backend.next_tokens(logits, [[2]], 1, 1).tolist() == [7]
+
+
+def test_next_tokens_bans_repeated_ngrams_per_row():
+    backend = make_backend()
+    logits = np.zeros((2, VOCAB), dtype=np.float32)
+    logits[:, 7] = 2
+    logits[:, 8] = 1
+
+    # Only the first row has already produced "4 5 7"
+    assert backend.next_tokens(logits, [[4, 5, 7, 4, 5], [4, 5, 8, 4, 5]], 3, 10).tolist() == [8, 7]
+
+
+def test_generate_stops_when_every_row_has_ended():
+    backend = make_backend(script=[(0, 5, 6, 2), (0, 5, 2)])
+
+    assert generate(backend, 2) == [[2, 0, 5, 6, 2], [2, 0, 5, 2, 1]]
+    assert len(backend.decoder.feeds) == 1
+    assert [feed["input_ids"].ravel().tolist() for feed in backend.decoder_with_past.feeds] == [[0, 0], [5, 5], [6, 2]]
+
+
+def test_generate_forces_eos_at_the_token_limit():
+    backend = make_backend(script=[(0, 5, 6, 7, 8)])
+
+    assert generate(backend, 1, max_new_tokens=3) == [[2, 0, 5, 2]]
+
+
+def test_generate_feeds_the_kv_cache_in_order_and_keeps_the_first_cross_attention():
+    backend = make_backend(script=[(0, 5, 6, 7, 2)])
+    generate(backend, 1)
+
+    feeds = backend.decoder_with_past.feeds
+    assert len(feeds) == 4
+    for call, feed in enumerate(feeds):
+        for index, name in enumerate(CONFIG_PAST_NAMES):
+            # Self-attention comes from the previous decoder call, cross-attention always from the first one
+            source = 0 if name.endswith(("cross_key", "cross_value")) else call
+            assert feed[name].item() == 100 * source + index, name
+        assert feed["encoder_hidden_states"] is backend.decoder.feeds[0]["encoder_hidden_states"]
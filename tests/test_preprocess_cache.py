@@ -0,0 +1,56 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+from preprocess_cache import PreprocessCache
+
+
+class FakeImageProcessor:
+    def __call__(self, images, return_tensors="pt"):
+        pixels = np.asarray(images.resize((4, 4)), dtype=np.float32) / 255
+        return {"pixel_values": torch.from_numpy(pixels).permute(2, 0, 1)[None]}
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.image_processor = FakeImageProcessor()
+
+
+def index_data(cache):
+    with open(os.path.join(cache.cache_dir, "index.json"), 'r') as file:
+        return json.load(file)
+
+
+def test_empty_run_leaves_the_shape_unknown(tmp_path):
+    processor = FakeProcessor()
+    empty = PreprocessCache(processor, str(tmp_path))
+    empty.flush()
+    assert index_data(empty)['shape'] is None
+
+    cache = PreprocessCache(processor, str(tmp_path))
+    assert cache.shape is None
+    expected = cache.pixel_values(Image.new("RGB", (8, 8), (255, 0, 0)), key="red")
+    cache.flush()
+    assert index_data(cache)['shape'] == [3, 4, 4]
+    assert list(index_data(cache)['entries']) == ["red"]
+
+    reloaded = PreprocessCache(processor, str(tmp_path))
+    assert torch.allclose(reloaded.pixel_values(None, key="red").float(), expected, atol=1e-3)
+    assert reloaded.hits == 1
+
+
+def test_empty_shape_from_older_index_is_treated_as_unknown(tmp_path):
+    processor = FakeProcessor()
+    cache = PreprocessCache(processor, str(tmp_path))
+    with open(os.path.join(cache.cache_dir, "index.json"), 'w') as file:
+        json.dump({'dtype': "float16", 'shape': [], 'entries': {}}, file)
+
+    cache = PreprocessCache(processor, str(tmp_path))
+    cache.pixel_values(Image.new("RGB", (8, 8)), key="black")
+    cache.flush()
+    assert list(index_data(cache)['entries']) == ["black"]
@@ -0,0 +1,27 @@
+import os
+
+from shard_store import ShardReader, ShardWriter
+
+
+def write_shard(shard_dir, images):
+    writer = ShardWriter(str(shard_dir))
+    for image in images:
+        writer.write(image, 10, 10, "0 0.5 0.5 0.1 0.1\n")
+    writer.close()
+    return writer
+
+
+def test_new_shards_start_after_the_highest_existing_id(tmp_path):
+    write_shard(tmp_path, ["a.jpg"])
+    write_shard(tmp_path, ["b.jpg"])
+    write_shard(tmp_path, ["c.jpg"])
+    os.remove(tmp_path / "shard_00001.jsonl")
+    os.remove(tmp_path / "shard_00001.jsonl.idx.json")
+
+    writer = write_shard(tmp_path, ["d.jpg"])
+
+    assert writer.shard_id == 4
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".jsonl")) == [
+        "shard_00000.jsonl", "shard_00002.jsonl", "shard_00003.jsonl"]
+    reader = ShardReader(str(tmp_path))
+    assert sorted(reader.index) == ["a.jpg", "c.jpg", "d.jpg"]
@@ -0,0 +1,35 @@
+import os
+
+from PIL import Image
+
+from class_registry import ClassRegistry
+from validate_dataset import validate_dataset
+
+BOX = "0 0.5 0.5 0.2 0.2\n"
+
+
+def write(path, text=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def test_video_frame_labels_are_not_orphans(tmp_path, monkeypatch):
+    monkeypatch.setattr("dataset_scan.CACHE_DIR", str(tmp_path / "cache"))
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    os.makedirs(images / "site")
+    Image.new("RGB", (64, 48)).save(images / "a.jpg")
+    write(str(images / "site" / "hive.mp4"))
+    write(str(labels / "a.txt"), BOX)
+    write(str(labels / "site" / "hive_f000000.txt"), BOX)
+    write(str(labels / "site" / "hive_f000123.txt"), BOX)
+    write(str(labels / "hive_f000000.txt"), BOX)  # no hive video at the top level
+    write(str(labels / "ghost.txt"), BOX)
+
+    report = validate_dataset(str(images), str(labels), ClassRegistry(["bee"]), fix=True, workers=1)
+
+    assert sorted(report['orphan_labels']) == ["ghost.txt", "hive_f000000.txt"]
+    assert report['videos'] == 1
+    assert report['files'] == {}
+    assert os.path.exists(labels / "site" / "hive_f000123.txt")
+    assert not os.path.exists(labels / "ghost.txt")
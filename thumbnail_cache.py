@@ -0,0 +1,63 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from dataset_scan import CACHE_DIR
+from image_probe import load_thumbnail
+
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+THUMBNAIL_SIZE = 160
+
+
+def thumbnail_path(image_path, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_DIR):
+    # Keyed by path, mtime and size, so an edited or replaced image gets a fresh thumbnail
+    stat = os.stat(image_path)
+    key = hashlib.sha1(f"{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}:{size}".encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2], key + ".jpg")
+
+
+def make_thumbnail(image_path, thumb_path, size=THUMBNAIL_SIZE):
+    """Write a JPEG thumbnail of image_path to thumb_path; returns thumb_path, or None if unreadable."""
+    try:
+        img = load_thumbnail(image_path, size)
+    except OSError as e:
+        print(f"Error: Unable to read image from {image_path}: {e}")
+        return None
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+    img.save(tmp_path, "JPEG", quality=80)
+    os.replace(tmp_path, thumb_path)
+    return thumb_path
+
+
+class ThumbnailGenerator:
+    """Generates cached thumbnails on a process pool.
+
+    submit() returns one future per image; thumbnails already in the cache
+    resolve immediately without touching the pool. Workers are spawned, not
+    forked: the GUI process has Tk, prefetch and model threads running.
+    """
+
+    def __init__(self, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_DIR, workers=None):
+        self.size = size
+        self.cache_dir = cache_dir
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, image_paths):
+        futures = []
+        for image_path in image_paths:
+            try:
+                thumb_path = thumbnail_path(image_path, self.size, self.cache_dir)
+            except OSError:
+                thumb_path = None
+            if thumb_path is None or os.path.exists(thumb_path):
+                future = Future()
+                future.set_result(thumb_path)
+            else:
+                future = self.executor.submit(make_thumbnail, image_path, thumb_path, self.size)
+            futures.append(future)
+        return futures
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from class_registry import ClassRegistry
+from dataset_scan import VIDEO_EXTENSIONS, DatasetIndex, default_cache_path, list_images
+from image_probe import probe_size
+from label_io import atomic_write_text, clip_boxes, format_labels, parse_labels
+from review_queue import box_iou
+
+VALIDATION_REPORT = "validation_report.json"
+ORPHAN_DIR = "orphan_labels"
+DUPLICATE_IOU = 0.9
+MIN_BOX_PIXELS = 2
+MIN_BOX_SIZE = 1e-3  # normalized, for images whose size can't be read from the header
+EPSILON = 1e-6
+REPAIRABLE = ("parse_error", "out_of_range", "degenerate", "duplicate")
+FRAME_STEM = re.compile(r"^(.*)_f\d{6}$")  # video_annotate.frame_name: <video stem>_f000123
+
+
+def yolo_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.hstack([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2])
+
+
+def check_labels(classes, boxes, known_classes, image_size=None, duplicate_iou=DUPLICATE_IOU):
+    """Vectorized checks over the rows of one label file.
+
+    Returns (issues, keep, clipped): issues is a list of {'row', 'issue',
+    'detail'} dicts, keep marks rows that survive a repair (degenerate and
+    duplicate boxes are dropped) and clipped holds the boxes clipped to the image.
+    """
+    issues = []
+    xyxy = yolo_to_xyxy(boxes)
+    out_of_range = np.any((xyxy < -EPSILON) | (xyxy > 1 + EPSILON), axis=1)
+    clipped = clip_boxes(boxes)
+
+    if image_size:
+        degenerate = np.any(clipped[:, 2:] * np.array(image_size, dtype=np.float32) < MIN_BOX_PIXELS, axis=1)
+    else:
+        degenerate = np.any(clipped[:, 2:] < MIN_BOX_SIZE, axis=1)
+
+    unknown = ~np.isin(classes, known_classes)
+
+    # A box duplicates an earlier, non-degenerate box of the same class that it almost entirely overlaps
+    overlap = box_iou(yolo_to_xyxy(clipped), yolo_to_xyxy(clipped)) > duplicate_iou
+    overlap &= classes[:, None] == classes[None, :]
+    overlap &= ~degenerate[:, None] & ~degenerate[None, :]
+    duplicate = np.triu(overlap, k=1).any(axis=0)
+
+    for row in np.flatnonzero(out_of_range).tolist():
+        issues.append({'row': row, 'issue': "out_of_range", 'detail': [round(float(v), 6) for v in boxes[row]]})
+    for row in np.flatnonzero(degenerate).tolist():
+        issues.append({'row': row, 'issue': "degenerate", 'detail': [round(float(v), 6) for v in clipped[row, 2:]]})
+    for row in np.flatnonzero(duplicate).tolist():
+        issues.append({'row': row, 'issue': "duplicate", 'detail': int(np.flatnonzero(overlap[:row, row])[0])})
+    for row in np.flatnonzero(unknown).tolist():
+        issues.append({'row': row, 'issue': "unknown_class", 'detail': int(classes[row])})
+    return issues, ~(degenerate | duplicate), clipped
+
+
+def validate_label_file(label_path, image_size, known_classes, fix=False, duplicate_iou=DUPLICATE_IOU):
+    with open(label_path, 'r') as file:
+        text = file.read()
+    classes, boxes, errors = parse_labels(text, label_path)
+    issues = [{'row': None, 'issue': "parse_error", 'detail': f"line {error.line_number}: {error.reason}"} for error in errors]
+    row_issues, keep, clipped = check_labels(classes, boxes, known_classes, image_size, duplicate_iou)
+    issues += row_issues
+
+    fixed = False
+    if fix and any(issue['issue'] in REPAIRABLE for issue in issues):
+        # Unknown classes are only reported: adding a class or relabelling is a human decision
+        atomic_write_text(label_path, format_labels(classes[keep], clipped[keep]))
+        fixed = True
+    return issues, fixed
+
+
+def _validate_chunk(jobs, known_classes, fix, duplicate_iou):
+    results = []
+    for rel_label, label_path, image_path, image_size in jobs:
+        if image_size is None and image_path:
+            image_size = probe_size(image_path)
+        try:
+            issues, fixed = validate_label_file(label_path, image_size, known_classes, fix, duplicate_iou)
+        except OSError as e:
+            issues, fixed = [{'row': None, 'issue': "unreadable", 'detail': str(e)}], False
+        results.append((rel_label, image_size, issues, fixed))
+    return results
+
+
+def validate_dataset(image_folder, label_folder, registry, fix=False, workers=None, recursive=True,
+                     duplicate_iou=DUPLICATE_IOU, chunk_size=256):
+    """Check every label file against its image and the class list, over a process pool.
+
+    Labels mirror the image tree (images/a/b.jpg -> labels/a/b.txt); labels
+    of video frames (labels/a/hive_f000123.txt for images/a/hive.mp4) are
+    checked without an image size. Returns
+    a JSON-serializable report; with fix=True repairable problems are
+    rewritten in place and orphan labels are moved to ORPHAN_DIR.
+    """
+    index = DatasetIndex(image_folder, default_cache_path(image_folder))
+    images = list(index.iter_images(recursive, relative=True))
+    labels = [rel_label for rel_label in list_images(label_folder, recursive=recursive, extensions=('.txt',), relative=True)
+              if os.path.basename(rel_label) != "classes.txt"]
+    image_by_stem = {os.path.splitext(rel_image)[0]: rel_image for rel_image in images}
+    # Per-frame labels of videos that were never exploded into images belong to the video
+    videos = list_images(image_folder, recursive=recursive, extensions=VIDEO_EXTENSIONS, relative=True)
+    video_stems = {os.path.splitext(rel_video)[0] for rel_video in videos}
+    label_stems = {os.path.splitext(rel_label)[0] for rel_label in labels}
+
+    jobs = []
+    orphans = []
+    unsized = {}  # rel_label -> rel_image
+    for rel_label in labels:
+        rel_image = image_by_stem.get(os.path.splitext(rel_label)[0])
+        if rel_image is None:
+            frame = FRAME_STEM.match(os.path.splitext(rel_label)[0])
+            if not (frame and frame.group(1) in video_stems):
+                orphans.append(rel_label)
+            jobs.append((rel_label, os.path.join(label_folder, rel_label), None, None))
+            continue
+        # Sizes the index doesn't have yet are probed by the workers and cached here afterwards
+        image_size = index.cached_size(rel_image)
+        if image_size is None:
+            unsized[rel_label] = rel_image
+        jobs.append((rel_label, os.path.join(label_folder, rel_label), os.path.join(image_folder, rel_image), image_size))
+    unlabelled = [rel_image for stem, rel_image in image_by_stem.items() if stem not in label_stems]
+
+    known_classes = np.array(sorted(registry.indices.values()), dtype=np.int32)
+    chunks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+    files = {}
+    fixed_count = 0
+    counts = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_validate_chunk, chunks, [known_classes] * len(chunks),
+                                    [fix] * len(chunks), [duplicate_iou] * len(chunks)):
+            for rel_label, image_size, issues, fixed in results:
+                if rel_label in unsized:
+                    index.remember_size(unsized[rel_label], image_size)
+                counts.update(issue['issue'] for issue in issues)
+                fixed_count += fixed
+                if issues:
+                    files[rel_label.replace(os.sep, '/')] = {'issues': issues, 'fixed': fixed}
+    index.save()
+
+    if fix and orphans:
+        orphan_folder = os.path.join(os.path.dirname(os.path.normpath(label_folder)), ORPHAN_DIR)
+        for rel_label in orphans:
+            target = os.path.join(orphan_folder, rel_label)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(os.path.join(label_folder, rel_label), target)
+
+    counts['orphan_label'] = len(orphans)
+    counts['unlabelled_image'] = len(unlabelled)
+    return {
+        'image_folder': image_folder,
+        'label_folder': label_folder,
+        'images': len(images),
+        'videos': len(videos),
+        'labels': len(labels),
+        'summary': dict(counts),
+        'fixed_files': fixed_count,
+        'orphans_moved': len(orphans) if fix else 0,
+        'files': files,
+        'orphan_labels': [rel_label.replace(os.sep, '/') for rel_label in orphans],
+        'unlabelled_images': [rel_image.replace(os.sep, '/') for rel_image in unlabelled],
+    }
+
+
+def remaining_problems(report):
+    # Images without labels are normal in a dataset still being annotated, so they don't fail a run
+    problems = 0
+    for entry in report['files'].values():
+        problems += sum(1 for issue in entry['issues'] if not entry['fixed'] or issue['issue'] not in REPAIRABLE)
+    return problems + len(report['orphan_labels']) - report['orphans_moved']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate (and optionally repair) YOLO labels against their images.")
+    parser.add_argument("dataset", help="Dataset folder with images/, labels/ and classes.txt or data.yaml")
+    parser.add_argument("--images", help="Image folder (default: <dataset>/images)")
+    parser.add_argument("--labels", help="Label folder (default: <dataset>/labels)")
+    parser.add_argument("--fix", action="store_true", help="Clip boxes, drop degenerate/duplicate boxes and bad lines, move orphan labels")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--duplicate-iou", dest="duplicate_iou", type=float, default=DUPLICATE_IOU)
+    parser.add_argument("--report", help=f"Where to write the JSON report (default: <dataset>/{VALIDATION_REPORT})")
+    args = parser.parse_args(argv)
+
+    image_folder = args.images or os.path.join(args.dataset, "images")
+    label_folder = args.labels or os.path.join(args.dataset, "labels")
+    registry = ClassRegistry.load(args.dataset)
+    report = validate_dataset(image_folder, label_folder, registry, args.fix, args.workers, duplicate_iou=args.duplicate_iou)
+    report_path = args.report or os.path.join(args.dataset, VALIDATION_REPORT)
+    atomic_write_text(report_path, json.dumps(report, indent=1))
+
+    print(f"Checked {report['labels']} label files for {report['images']} images")
+    for issue, count in sorted(report['summary'].items()):
+        print(f"  {issue}: {count}")
+    if args.fix:
+        print(f"Repaired {report['fixed_files']} label files, moved {report['orphans_moved']} orphan labels")
+    print(f"Report written to {report_path}")
+    return 1 if remaining_problems(report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from dataset_scan import VIDEO_EXTENSIONS
+from detector import detections_to_yolo
+from label_io import clip_boxes
+
+SEEK_DISTANCE = 32  # forward jumps shorter than this grab frames instead of seeking to a keyframe
+TRACK_WIDTH = 640   # optical flow runs on frames downscaled to at most this width
+TRACK_GRID = 5      # points tracked per box side
+
+
+def frame_name(video_rel_path, index):
+    # Same naming as exploding the video into frames, so labels are <stem>_f000123.txt
+    stem = os.path.splitext(os.path.basename(video_rel_path))[0]
+    return os.path.join(os.path.dirname(video_rel_path), f"{stem}_f{index:06d}.jpg")
+
+
+class VideoReader:
+    """Frame access by index with as few seeks as possible.
+
+    Sequential reads just decode the next frame, short forward jumps grab
+    the frames in between, and only backward or long jumps seek. Safe to
+    share between the GUI prefetch threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise OSError(f"Unable to open video {path}")
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def read(self, index):
+        """BGR frame at index, or None past the end of the stream."""
+        with self.lock:
+            if index < self.position or index - self.position > SEEK_DISTANCE:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+                self.position = index
+            while self.position < index:
+                if not self.capture.grab():
+                    return None
+                self.position += 1
+            ok, frame = self.capture.read()
+            if not ok:
+                return None
+            self.position += 1
+            return frame
+
+    def frames(self):
+        index = 0
+        while True:
+            frame = self.read(index)
+            if frame is None:
+                return
+            yield index, frame
+            index += 1
+
+    def close(self):
+        self.capture.release()
+
+
+def track_gray(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    if width > TRACK_WIDTH:
+        gray = cv2.resize(gray, (TRACK_WIDTH, round(height * TRACK_WIDTH / width)), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def track_boxes(prev_gray, gray, boxes, min_points=6):
+    """Move normalized YOLO boxes from prev_gray to gray with pyramidal Lucas-Kanade flow.
+
+    A grid of points inside every box is tracked in one call; each box moves
+    by the median point displacement and scales by the median change in
+    point spread. Points failing the forward-backward check are ignored and
+    boxes left with fewer than min_points are dropped.
+    Returns (boxes, keep).
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if not len(boxes):
+        return boxes, np.zeros(0, dtype=bool)
+
+    height, width = gray.shape
+    scale = np.array([width, height], dtype=np.float32)
+    steps = (np.arange(TRACK_GRID, dtype=np.float32) + 0.5) / TRACK_GRID - 0.5
+    grid = np.stack(np.meshgrid(steps, steps), axis=-1).reshape(-1, 2)
+    points = (boxes[:, None, :2] + grid[None] * boxes[:, None, 2:]) * scale
+    start = points.reshape(-1, 1, 2)
+
+    moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, start, None, winSize=(15, 15), maxLevel=3)
+    back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, moved, None, winSize=(15, 15), maxLevel=3)
+    ok = (status.ravel() == 1) & (back_status.ravel() == 1) & (np.linalg.norm((back - start).reshape(-1, 2), axis=1) < 1.0)
+    ok = ok.reshape(len(boxes), -1)
+    moved = moved.reshape(len(boxes), -1, 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        before = np.where(ok[..., None], points, np.nan)
+        after = np.where(ok[..., None], moved, np.nan)
+        shift = np.nanmedian(after - before, axis=1)
+        spread_before = np.linalg.norm(before - np.nanmean(before, axis=1, keepdims=True), axis=2)
+        spread_after = np.linalg.norm(after - np.nanmean(after, axis=1, keepdims=True), axis=2)
+        growth = np.clip(np.nan_to_num(np.nanmedian(spread_after / spread_before, axis=1), nan=1.0), 0.8, 1.25)
+
+    keep = ok.sum(axis=1) >= min_points
+    tracked = np.hstack([boxes[:, :2] + np.nan_to_num(shift) / scale, boxes[:, 2:] * growth[:, None]])
+    return clip_boxes(tracked)[keep], keep
+
+
+def iter_segments(reader, keyframe_interval, keep_frames=False):
+    """Yield one segment per keyframe: its index, the BGR keyframe and grayscale tracking frames."""
+    segment = None
+    for index, frame in reader.frames():
+        if index % keyframe_interval == 0:
+            if segment:
+                yield segment
+            segment = {'start': index, 'keyframe': frame, 'grays': [], 'frames': []}
+        segment['grays'].append(track_gray(frame))
+        if keep_frames:
+            segment['frames'].append(frame)
+    if segment:
+        yield segment
+
+
+def annotate_video(detector, video_path, rel_path, exporter, taxonomy, keyframe_interval=10, batch_size=1, frames_folder=None):
+    """Detect on every keyframe_interval-th frame and track boxes through the frames in between.
+
+    Labels are written through exporter under frame_name(rel_path, index);
+    with frames_folder set, the decoded frames are saved there too.
+    Returns (frames, detector_calls).
+    """
+    reader = VideoReader(video_path)
+    height = int(reader.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width = int(reader.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frames = 0
+    keyframes = 0
+    batch = []
+    try:
+        segments = iter_segments(reader, keyframe_interval, keep_frames=frames_folder is not None)
+        for segment in segments:
+            batch.append(segment)
+            if len(batch) == batch_size:
+                frames += _annotate_segments(detector, batch, rel_path, width, height, exporter, taxonomy, frames_folder)
+                keyframes += len(batch)
+                batch = []
+        if batch:
+            frames += _annotate_segments(detector, batch, rel_path, width, height, exporter, taxonomy, frames_folder)
+            keyframes += len(batch)
+    finally:
+        reader.close()
+    return frames, keyframes
+
+
+def _annotate_segments(detector, segments, rel_path, width, height, exporter, taxonomy, frames_folder):
+    from PIL import Image
+
+    keyframes = [Image.fromarray(cv2.cvtColor(segment['keyframe'], cv2.COLOR_BGR2RGB)) for segment in segments]
+    results = detector.detect_batch(keyframes)
+    count = 0
+    for segment, (detections, _, _) in zip(segments, results):
+        classes, boxes, _ = detections_to_yolo(detections, width, height, taxonomy)
+        prev_gray = None
+        for offset, gray in enumerate(segment['grays']):
+            if prev_gray is not None:
+                boxes, keep = track_boxes(prev_gray, gray, boxes)
+                classes = classes[keep]
+            prev_gray = gray
+            name = frame_name(rel_path, segment['start'] + offset)
+            exporter.write(name, width, height, classes, boxes)
+            if frames_folder:
+                frame_path = os.path.join(frames_folder, name)
+                os.makedirs(os.path.dirname(frame_path), exist_ok=True)
+                cv2.imwrite(frame_path, segment['frames'][offset])
+            count += 1
+    return count
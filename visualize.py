@@ -0,0 +1,164 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from class_registry import ClassRegistry
+from dataset_scan import list_images
+from image_probe import load_thumbnail
+from label_io import label_path_for, read_labels, report_errors
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+LINE_THICKNESS = 2
+
+_worker_registry = None
+
+
+def denormalize_boxes(boxes, image_width, image_height):
+    # (N, 4) normalized cx, cy, w, h -> (N, 4) integer pixel x_min, y_min, x_max, y_max
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scale = np.array([image_width, image_height, image_width, image_height], dtype=np.float32)
+    centers = boxes[:, :2]
+    half_sizes = boxes[:, 2:] / 2
+    xyxy = np.hstack([centers - half_sizes, centers + half_sizes]) * scale
+    return xyxy.astype(np.int32)
+
+
+def draw_boxes(image, classes, boxes, registry=None, draw_labels=True):
+    image_height, image_width = image.shape[:2]
+    xyxy = denormalize_boxes(boxes, image_width, image_height)
+
+    for class_index, (x_min, y_min, x_max, y_max) in zip(np.asarray(classes).tolist(), xyxy.tolist()):
+        color = registry.bgr_of(class_index) if registry else (0, 255, 0)
+        cv2.rectangle(image, (x_min, y_min), (x_max, y_max), color, LINE_THICKNESS)
+        if draw_labels and registry:
+            text_size = registry.text_size_of(class_index)
+            if text_size is None:
+                continue
+            text_width, text_height = text_size
+            top = max(y_min, text_height + 4)
+            cv2.rectangle(image, (x_min, top - text_height - 4), (x_min + text_width, top), color, -1)
+            cv2.putText(image, registry.name_of(class_index), (x_min, top - 2), FONT, FONT_SCALE, (255, 255, 255), 1, cv2.LINE_AA)
+    return image
+
+
+def measure_cv2_text(name):
+    (text_width, text_height), baseline = cv2.getTextSize(name, FONT, FONT_SCALE, 1)
+    return text_width, text_height + baseline
+
+
+def _init_worker(class_names):
+    global _worker_registry
+    _worker_registry = ClassRegistry()
+    for index, name in enumerate(class_names):
+        if name is not None:
+            _worker_registry.add(name, index)
+    _worker_registry.set_text_measure(measure_cv2_text)
+
+
+def downscale(image, max_size):
+    if not max_size:
+        return image
+    image_height, image_width = image.shape[:2]
+    scale = max_size / max(image_height, image_width)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (int(image_width * scale), int(image_height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def render_image(image_path, label_path, max_size=None):
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"Error: Unable to read image from {image_path}")
+        return None
+    # Boxes are normalized, so drawing after the downscale gives the same picture for less work
+    image = downscale(image, max_size)
+    classes, boxes, errors = read_labels(label_path)
+    report_errors(errors)
+    return draw_boxes(image, classes, boxes, _worker_registry)
+
+
+def _render_preview(task):
+    image_path, label_path, output_path, max_size, quality = task
+    image = render_image(image_path, label_path, max_size)
+    if image is None:
+        return False
+    return cv2.imwrite(output_path, image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+
+def _render_tile(task):
+    image_path, label_path, tile_size = task
+    tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+    try:
+        # Tiles only need a few hundred pixels, so decode JPEGs at reduced scale
+        image = cv2.cvtColor(np.asarray(load_thumbnail(image_path, tile_size)), cv2.COLOR_RGB2BGR)
+    except OSError as e:
+        print(f"Error: Unable to read image from {image_path}: {e}")
+        return tile
+    classes, boxes, errors = read_labels(label_path)
+    report_errors(errors)
+    draw_boxes(image, classes, boxes, _worker_registry)
+    image_height, image_width = image.shape[:2]
+    top = (tile_size - image_height) // 2
+    left = (tile_size - image_width) // 2
+    tile[top:top + image_height, left:left + image_width] = image
+    name = os.path.basename(image_path)
+    cv2.putText(tile, name[:32], (4, tile_size - 6), FONT, 0.35, (255, 255, 255), 1, cv2.LINE_AA)
+    return tile
+
+
+def render_folder(image_folder, label_folder, output_folder, registry=None, workers=None,
+                  max_size=None, quality=85, label_suffix="", contact_sheet=False,
+                  tile_size=256, columns=8, rows=6, recursive=False):
+    """Render labelled previews for every image in a folder over a process pool.
+
+    Writes one JPEG per image, or with contact_sheet=True, mosaics of
+    rows x columns tiles named contact_sheet_000.jpg, contact_sheet_001.jpg, ...
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    if registry is None:
+        registry = ClassRegistry.load(label_folder)
+        if not len(registry):
+            registry = ClassRegistry.load(os.path.dirname(os.path.abspath(label_folder)), default_names=['bee'])
+    image_files = list_images(image_folder, recursive=recursive, relative=True)
+    if not image_files:
+        print(f"No images found in {image_folder}")
+        return []
+
+    image_paths = [os.path.join(image_folder, f) for f in image_files]
+    label_paths = [label_path_for(f, label_folder, label_suffix) for f in image_files]
+    chunksize = max(1, len(image_files) // ((workers or os.cpu_count() or 1) * 4))
+    written = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(registry.names,)) as executor:
+        if not contact_sheet:
+            tasks = []
+            for image_file, image_path, label_path in zip(image_files, image_paths, label_paths):
+                output_path = os.path.join(output_folder, os.path.splitext(image_file)[0] + ".jpg")
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                tasks.append((image_path, label_path, output_path, max_size, quality))
+            for task, success in zip(tasks, executor.map(_render_preview, tasks, chunksize=chunksize)):
+                if success:
+                    written.append(task[2])
+                else:
+                    print(f"Error: Unable to save image to {task[2]}")
+            return written
+
+        per_sheet = columns * rows
+        tasks = [(image_path, label_path, tile_size) for image_path, label_path in zip(image_paths, label_paths)]
+        tiles = executor.map(_render_tile, tasks, chunksize=chunksize)
+        for sheet_index in range(math.ceil(len(tasks) / per_sheet)):
+            count = min(per_sheet, len(tasks) - sheet_index * per_sheet)
+            sheet = np.zeros((rows * tile_size, columns * tile_size, 3), dtype=np.uint8)
+            for position in range(count):
+                row, column = divmod(position, columns)
+                sheet[row * tile_size:(row + 1) * tile_size, column * tile_size:(column + 1) * tile_size] = next(tiles)
+            output_path = os.path.join(output_folder, f"contact_sheet_{sheet_index:03d}.jpg")
+            if cv2.imwrite(output_path, sheet, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+                written.append(output_path)
+            else:
+                print(f"Error: Unable to save image to {output_path}")
+    return written